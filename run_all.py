@@ -1,15 +1,25 @@
 # 一键跑通：解析 -> 分词 -> 建索引 -> 布尔/短语检索 -> VSM 检索
+# 默认用 pipeline.py 在单进程内完成 解析 -> 分词 -> 建索引（不落盘中间 JSONL）
+# 可选 --staged：按原方式分三个脚本执行并写出 data_stage/ 中间文件
+# 可选 --incremental：只解析新增/变更的 XML，并把增量合入已有索引
 import subprocess, sys, pathlib
 
 root = pathlib.Path(__file__).resolve().parent
-def run(py):
-    print(f"\n=== Running {py} ===")
-    subprocess.check_call([sys.executable, str(root / "src" / py)])
+def run(py, *args):
+    print(f"\n=== Running {py} {' '.join(args)} ===")
+    subprocess.check_call([sys.executable, str(root / "src" / py), *args])
 
 if __name__ == "__main__":
-    run("parse_xml.py")
-    run("tokenize.py")
-    run("build_index.py")
+    if "--incremental" in sys.argv[1:]:
+        run("parse_xml.py", "--incremental")
+        run("tokenize.py", "--delta")
+        run("build_index.py", "--delta")
+    elif "--staged" in sys.argv[1:]:
+        run("parse_xml.py")
+        run("tokenize.py")
+        run("build_index.py")
+    else:
+        run("pipeline.py")
     run("search_boolean.py")
     run("search_vsm.py")
     print("\nAll done. See data_stage/, index_json/, results/")
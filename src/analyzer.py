@@ -0,0 +1,164 @@
+# 统一分析器（analyzer）：建索引与查询解析共用同一条规范化流水线
+#   lowercase  -> 整段文本先转小写（在切词之前，C 实现，代价极低）
+#   fold       -> ASCII 折叠（café -> cafe），启用后切词改用 Unicode 字母数字
+#   stopwords  -> 停用词过滤
+#   stem       -> 轻量英文词干化（Porter step 1：复数、-ed/-ing、-y）
+# 词级阶段按“表面形式”做有界 LRU 缓存：Meetup 词表高度 Zipf，昂贵阶段每个不同词形只算一次。
+import json, re, unicodedata
+from functools import lru_cache
+from utils import INDEX_DIR, atomic_open
+
+STOP = set('''a an the and or not is are was were be been being to of in on at for from with by as it this that these those we you your our his her their i he she they them me my mine ours yours its into about over under up down out more most less few many any each every'''.split())
+
+STAGES = ("lowercase", "fold", "stopwords", "stem")
+DEFAULT_STAGES = ("lowercase", "stopwords")
+ASCII_TOKEN = re.compile(r"[A-Za-z0-9]+")
+UNICODE_TOKEN = re.compile(r"[^\W_]+")
+
+def ascii_fold(tok):
+    # NFKD 分解后去掉组合附加符号；无法分解的字符（如中文）原样保留
+    if tok.isascii():
+        return tok
+    return "".join(c for c in unicodedata.normalize("NFKD", tok) if not unicodedata.combining(c))
+
+_VOWELS = set("aeiou")
+
+def _is_cons(w, i):
+    c = w[i]
+    if c in _VOWELS:
+        return False
+    if c == "y":
+        return i == 0 or not _is_cons(w, i - 1)
+    return True
+
+def _measure(stem):
+    # Porter 中的 m：词干中 VC 序列的个数
+    m = 0
+    prev_vowel = False
+    for i in range(len(stem)):
+        cons = _is_cons(stem, i)
+        if cons and prev_vowel:
+            m += 1
+        prev_vowel = not cons
+    return m
+
+def _has_vowel(stem):
+    return any(not _is_cons(stem, i) for i in range(len(stem)))
+
+def _cvc(w):
+    # 以 辅音-元音-辅音 结尾，且末辅音不是 w/x/y
+    n = len(w)
+    return (n >= 3 and _is_cons(w, n - 3) and not _is_cons(w, n - 2)
+            and _is_cons(w, n - 1) and w[-1] not in "wxy")
+
+def light_stem(w):
+    """Porter 算法 step 1a/1b/1c：ponies->poni, meetings->meet, hopped->hop, happy->happi"""
+    if len(w) <= 2 or not w.isalpha():
+        return w
+    # step 1a
+    if w.endswith("sses"):
+        w = w[:-2]
+    elif w.endswith("ies"):
+        w = w[:-2]
+    elif w.endswith("s") and not w.endswith("ss"):
+        w = w[:-1]
+    # step 1b
+    if w.endswith("eed"):
+        if _measure(w[:-3]) > 0:
+            w = w[:-1]
+    else:
+        for suf in ("ed", "ing"):
+            if w.endswith(suf) and _has_vowel(w[:-len(suf)]):
+                w = w[:-len(suf)]
+                if w.endswith(("at", "bl", "iz")):
+                    w += "e"
+                elif len(w) >= 2 and w[-1] == w[-2] and _is_cons(w, len(w) - 1) and w[-1] not in "lsz":
+                    w = w[:-1]
+                elif _measure(w) == 1 and _cvc(w):
+                    w += "e"
+                break
+    # step 1c
+    if w.endswith("y") and _has_vowel(w[:-1]):
+        w = w[:-1] + "i"
+    return w
+
+def parse_stages(spec):
+    """"lowercase,stopwords,stem" -> ("lowercase", "stopwords", "stem")"""
+    if isinstance(spec, str):
+        spec = [s.strip().lower() for s in spec.split(",") if s.strip()]
+    stages = tuple(spec)
+    for s in stages:
+        if s not in STAGES:
+            raise ValueError(f"unknown analyzer stage: {s} (choose from {', '.join(STAGES)})")
+    return stages
+
+class Analyzer:
+    def __init__(self, stages=DEFAULT_STAGES, cache_size=65536):
+        self.stages = parse_stages(stages)
+        self.lowercase = "lowercase" in self.stages
+        self.pattern = UNICODE_TOKEN if "fold" in self.stages else ASCII_TOKEN
+        # 词级阶段（lowercase 已在切词前对整段文本完成）
+        funcs = []
+        for s in self.stages:
+            if s == "fold":
+                funcs.append(ascii_fold)
+            elif s == "stopwords":
+                funcs.append(lambda t: None if t in STOP else t)
+            elif s == "stem":
+                funcs.append(light_stem)
+        self._funcs = tuple(funcs)
+        self.cache_size = cache_size
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize) if cache_size else self._normalize
+
+    def _normalize(self, tok):
+        for f in self._funcs:
+            tok = f(tok)
+            if not tok:
+                return None
+        return tok
+
+    def normalize_term(self, tok):
+        """规范化单个查询词（含 lowercase）；停用词等被过滤时返回 None"""
+        return self.normalize(tok.lower() if self.lowercase else tok)
+
+    def normalize_pattern(self, pattern):
+        """通配模式（含 *）只做字符级规范化（小写、折叠），不做停用词与词干：模式是词的片段而非完整的词"""
+        if self.lowercase:
+            pattern = pattern.lower()
+        return ascii_fold(pattern) if "fold" in self.stages else pattern
+
+    def analyze(self, text):
+        """切词 + 规范化，返回 [(term, pos)]；pos 按原始 token 序号计（被过滤的词也占位）"""
+        if self.lowercase:
+            text = text.lower()
+        norm = self.normalize
+        tokens = []
+        for i, m in enumerate(self.pattern.finditer(text)):
+            term = norm(m.group(0))
+            if term is not None:
+                tokens.append((term, i))  # (token, position)
+        return tokens
+
+    def terms(self, text):
+        return [t for t, _ in self.analyze(text)]
+
+    def cache_info(self):
+        return self.normalize.cache_info() if self.cache_size else None
+
+    def to_config(self):
+        return {"stages": list(self.stages), "cache_size": self.cache_size}
+
+ANALYZER_FILE = "analyzer.json"
+
+def save_analyzer(analyzer, directory):
+    with atomic_open(directory / ANALYZER_FILE, "w", encoding="utf-8") as f:
+        json.dump(analyzer.to_config(), f, ensure_ascii=False, indent=2)
+
+def load_analyzer(directory=INDEX_DIR):
+    """读取索引目录中记录的分析器配置；缺失时使用默认配置（与旧版分词一致）"""
+    path = directory / ANALYZER_FILE
+    if not path.exists():
+        return Analyzer()
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    return Analyzer(cfg.get("stages", DEFAULT_STAGES), cfg.get("cache_size", 65536))
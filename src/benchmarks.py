@@ -39,7 +39,7 @@ def ensure_compressed_lexicons():
     run([sys.executable, str(SRC / "compress_lexicon.py")])
 
 
-def bench_dict_modes(modes=("raw", "block", "front")):
+def bench_dict_modes(modes=("bin", "raw", "block", "front")):
     print("=== Benchmark: dictionary modes ===")
     ensure_compressed_lexicons()
     out = {}
@@ -67,8 +67,8 @@ def bench_skip_strategies(strategies=("none", "sqrt", "k:8", "alpha:0.1")):
         print(f"-- skip strategy: {strat}")
         # rebuild index with skip strategy
         run([sys.executable, str(SRC / "build_index.py"), "--skip", strat])
-        # size of postings
-        postings_size = size_of(INDEX_DIR / "postings.json")
+        # size of postings (skip tables are embedded in postings.bin)
+        postings_size = size_of(INDEX_DIR / "postings.bin")
         # run search with skip optimization enabled
         run([sys.executable, str(SRC / "search_boolean.py"), "--dict", "raw", "--use-skip"])    
         time_file = RESULTS_DIR / "execution_times.json"
@@ -85,7 +85,182 @@ def bench_skip_strategies(strategies=("none", "sqrt", "k:8", "alpha:0.1")):
     print("Saved ->", RESULTS_DIR / "benchmark_skip_strategies.json")
 
 
+def bench_extract_event(repeat=5, number=2000):
+    """XML 字段抽取微基准：原始多次 XPath 下钻 vs 单遍扫描（fixture 取自 tmp_test_parse.py）"""
+    print("=== Benchmark: extract_event ===")
+    import timeit
+    import xml.etree.ElementTree as ET
+    sys.path.insert(0, str(SRC))
+    sys.path.insert(0, str(ROOT))
+    from parse_xml import extract_event, extract_event_xpath
+    from tmp_test_parse import xml as fixture_xml
+    elem = ET.fromstring(fixture_xml)
+    assert extract_event(elem) == extract_event_xpath(elem)
+    out = {}
+    for name, fn in (("xpath", extract_event_xpath), ("single_pass", extract_event)):
+        best = min(timeit.repeat(lambda: fn(elem), repeat=repeat, number=number))
+        out[name] = {"events_per_s": round(number / best, 1), "us_per_event": round(best / number * 1e6, 2)}
+        print(f"-- {name}: {out[name]['events_per_s']} events/s")
+    out["speedup"] = round(out["single_pass"]["events_per_s"] / out["xpath"]["events_per_s"], 2)
+    write_json(RESULTS_DIR / "benchmark_extract_event.json", out)
+    print("Saved ->", RESULTS_DIR / "benchmark_extract_event.json")
+
+
+def bench_intersection(ratios=(1, 4, 16, 64, 256, 1024), n_docs=400000, long_df=100000, repeat=5, seed=42):
+    """AND 求交微基准：合成两条倒排（长的 df 固定，短的 df = long_df / ratio），
+    比较两两归并、跳表归并、set 求交与 n 路交集（gallop/哈希探测自适应）"""
+    print("=== Benchmark: intersection ===")
+    import random
+    import timeit
+    sys.path.insert(0, str(SRC))
+    from build_index import add_skip_pointers
+    from search_boolean import and_intersect_merge, and_intersect_with_skip, intersect_n
+    rng = random.Random(seed)
+
+    def make(df):
+        ids = sorted(rng.sample(range(n_docs), df))
+        return add_skip_pointers([{"doc_id": d, "tf": 1, "pos": []} for d in ids], "sqrt")
+
+    def set_path(a, b):
+        return set(d["doc_id"] for d in a) & set(d["doc_id"] for d in b)
+
+    long_list = make(long_df)
+    paths = {
+        "merge": lambda a, b: and_intersect_merge(a, b),
+        "skip": lambda a, b: and_intersect_with_skip(a, b, use_skip=True),
+        "set": set_path,
+        "nway": lambda a, b: intersect_n([a, b]),
+    }
+    out = {}
+    for ratio in ratios:
+        short_list = make(max(long_df // ratio, 1))
+        expected = sorted(set_path(short_list, long_list))
+        row = {"short_df": len(short_list), "long_df": len(long_list), "hits": len(expected)}
+        for name, fn in paths.items():
+            assert sorted(fn(short_list, long_list)) == expected
+            best = min(timeit.repeat(lambda: fn(short_list, long_list), repeat=repeat, number=1))
+            row[f"{name}_ms"] = round(best * 1000, 3)
+        out[f"1:{ratio}"] = row
+        print(f"-- ratio 1:{ratio}: " + ", ".join(f"{k} {row[f'{k}_ms']} ms" for k in paths))
+    write_json(RESULTS_DIR / "benchmark_intersection.json", out)
+    print("Saved ->", RESULTS_DIR / "benchmark_intersection.json")
+
+
+def bench_server(port=18765, rounds=3):
+    """常驻服务 vs 每次启动进程：冷启动为 search_boolean.py + search_vsm.py 两个进程的总耗时（含解释器启动与索引载入），
+    常驻服务分别测逐条 HTTP 请求与一次 /batch 的往返耗时，并核对结果与两个结果文件一致"""
+    print("=== Benchmark: query server ===")
+    import urllib.request
+    queries = {"boolean": read_json(ROOT / "queries" / "boolean.json").get("queries", []),
+               "vsm": read_json(ROOT / "queries" / "vsm.json").get("queries", [])}
+    start = time.time()
+    run([sys.executable, str(SRC / "search_boolean.py")])
+    run([sys.executable, str(SRC / "search_vsm.py")])
+    cold_ms = (time.time() - start) * 1000
+    base = f"http://127.0.0.1:{port}"
+
+    def call(path, obj=None):
+        data = json.dumps(obj).encode("utf-8") if obj is not None else None
+        with urllib.request.urlopen(urllib.request.Request(base + path, data=data)) as r:
+            return json.load(r)
+
+    proc = subprocess.Popen([sys.executable, str(SRC / "server.py"), "--port", str(port)], cwd=str(ROOT))
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                health = call("/health")
+                break
+            except OSError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("query server did not start")
+                time.sleep(0.1)
+        single = []
+        batch = []
+        for _ in range(rounds):
+            start = time.time()
+            for q in queries["boolean"]:
+                call("/search/boolean", {"q": q})
+            for q in queries["vsm"]:
+                call("/search/vsm", {"q": q})
+            single.append((time.time() - start) * 1000)
+            start = time.time()
+            res = call("/batch", queries)
+            batch.append((time.time() - start) * 1000)
+    finally:
+        proc.terminate()
+        proc.wait()
+    matches = ({r["query"]: r.get("docs") for r in res["boolean"]} == read_json(RESULTS_DIR / "boolean_results.json")
+               and {r["query"]: r.get("results") for r in res["vsm"]} == read_json(RESULTS_DIR / "vsm_results.json"))
+    n = len(queries["boolean"]) + len(queries["vsm"])
+    out = {
+        "queries": n,
+        "server_load_ms": health["load_ms"],
+        "cold_processes_ms": round(cold_ms, 2),
+        "server_single_ms": round(min(single), 2),
+        "server_single_avg_per_query_ms": round(min(single) / max(n, 1), 3),
+        "server_batch_ms": round(min(batch), 2),
+        "results_match_cli": matches,
+    }
+    print(f"-- cold {out['cold_processes_ms']} ms, per-request {out['server_single_ms']} ms, batch {out['server_batch_ms']} ms")
+    write_json(RESULTS_DIR / "benchmark_server.json", out)
+    print("Saved ->", RESULTS_DIR / "benchmark_server.json")
+
+
+def bench_concurrent_readers(threads=(1, 2, 4, 8), rounds=20, cache_size=64):
+    """多线程共用一份已载入的索引：各线程同时执行 queries/ 中的布尔与 VSM 查询，并用 block/front 压缩词典查全部词项，
+    结果须与单线程逐条执行完全一致；cache_size 取小值让 LRU 频繁淘汰，覆盖并发解码与缓存更新"""
+    print("=== Benchmark: concurrent readers ===")
+    from concurrent.futures import ThreadPoolExecutor
+    sys.path.insert(0, str(SRC))
+    ensure_compressed_lexicons()
+    from search_boolean import LexiconLookup, eval_one, open_search_index
+    from search_vsm import load_vsm_stats, score
+    from analyzer import load_analyzer
+    postings, doc_ids, universe, bitmaps, biwords, kgrams = open_search_index(INDEX_DIR, "auto", cache_size)
+    analyzer = load_analyzer(INDEX_DIR)
+    stats = load_vsm_stats(postings, doc_ids, len(universe), INDEX_DIR)
+    lookups = [LexiconLookup(mode) for mode in ("block", "front")]
+    terms = sorted(postings.keys())
+    probes = terms + [t + "zz" for t in terms]
+    bq = read_json(ROOT / "queries" / "boolean.json").get("queries", [])
+    vq = read_json(ROOT / "queries" / "vsm.json").get("queries", [])
+    tasks = ([("boolean", q) for q in bq] + [("vsm", q) for q in vq] + [("postings", t) for t in terms]
+             + [(i, t) for i in range(len(lookups)) for t in probes])
+
+    def work(task):
+        kind, arg = task
+        if kind == "boolean":
+            return eval_one(postings, arg, analyzer=analyzer, universe=universe, bitmaps=bitmaps, biwords=biwords,
+                            kgrams=kgrams)
+        if kind == "vsm":
+            return score(arg, postings, doc_ids, stats, analyzer)[:10]
+        if kind == "postings":
+            return [(e["doc_id"], e["tf"], postings.positions(e)) for e in postings.get(arg, [])]
+        return lookups[kind].contains(arg)
+
+    expected = [work(t) for t in tasks]
+    out = {"tasks_per_round": len(tasks), "rounds": rounds}
+    for n in threads:
+        with ThreadPoolExecutor(n) as pool:
+            start = time.time()
+            for _ in range(rounds):
+                assert list(pool.map(work, tasks)) == expected, f"results differ with {n} threads"
+            elapsed = time.time() - start
+        out[f"threads_{n}"] = {"tasks_per_s": round(len(tasks) * rounds / elapsed, 1)}
+        print(f"-- {n} threads: {out[f'threads_{n}']['tasks_per_s']} tasks/s, results identical")
+    out["cache"] = postings.cache_info() if hasattr(postings, "cache_info") else None
+    for lookup in lookups:
+        lookup.close()
+    write_json(RESULTS_DIR / "benchmark_concurrent_readers.json", out)
+    print("Saved ->", RESULTS_DIR / "benchmark_concurrent_readers.json")
+
+
 def main():
+    bench_extract_event()
+    bench_intersection()
+    bench_server()
+    bench_concurrent_readers()
     bench_dict_modes()
     bench_skip_strategies()
 
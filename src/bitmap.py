@@ -0,0 +1,265 @@
+# 高频词项的压缩位图（roaring 风格的混合容器，index_json/bitmaps.bin）
+# 文档编号按高 16 位分块（每块 65536 个编号），每块按密度选容器：
+#   稀疏块：块内低 16 位的升序列表（数组容器，每个元素 2 字节）
+#   稠密块：位图（Python 大整数，第 i 位表示块内编号 i；AND/OR/ANDNOT 由整数位运算在 C 层逐字完成）
+# 选择依据与 roaring 相同：基数 × 16 位大于块的位宽时位图更省（末块按实际编号范围计）。
+# 只有 df × DENSE_RATIO > N 的词项在建索引时写出位图，低频词仍走有序倒排（gallop）。
+#
+# 文件布局：
+#   MAGIC
+#   <QQ>(文档数 N, 词项数 V)
+#   V 条记录：term, varint(df), varint(容器数), 每个容器 [varint(块号), 类型字节(0 数组/1 位图), varint(字节数), 内容]
+#   数组容器内容为小端 uint16，位图容器内容为小端字节序的整数
+import struct, sys
+from array import array
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from utils import atomic_open
+
+MAGIC = b"IRBM1\n"
+BITMAPS_FILE = "bitmaps.bin"
+_HEAD = struct.Struct("<QQ")
+CHUNK_BITS = 16
+CHUNK = 1 << CHUNK_BITS
+LOW_MASK = CHUNK - 1
+DENSE_RATIO = 16
+# 字节值 -> 其中为 1 的位序号，用于把位图展开为编号列表
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+def _span(key, n_docs):
+    return max(min(CHUNK, n_docs - (key << CHUNK_BITS)), 1)
+
+def _to_bits(values):
+    ba = bytearray((values[-1] >> 3) + 1) if values else bytearray()
+    for x in values:
+        ba[x >> 3] |= 1 << (x & 7)
+    return int.from_bytes(ba, "little")
+
+def _to_values(bits):
+    out = []
+    for i, b in enumerate(bits.to_bytes((bits.bit_length() + 7) >> 3, "little")):
+        if b:
+            base = i << 3
+            out.extend(base + j for j in _BYTE_BITS[b])
+    return out
+
+def _card(c):
+    return c.bit_count() if isinstance(c, int) else len(c)
+
+def _and(a, b):
+    a_bits, b_bits = isinstance(a, int), isinstance(b, int)
+    if a_bits and b_bits:
+        return a & b
+    if a_bits or b_bits:
+        bits, values = (a, b) if a_bits else (b, a)
+        bb = bits.to_bytes((bits.bit_length() + 7) >> 3, "little")
+        n = len(bb)
+        return [x for x in values if (x >> 3) < n and bb[x >> 3] >> (x & 7) & 1]
+    keep = set(b)
+    return [x for x in a if x in keep]
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        return (a if isinstance(a, int) else _to_bits(a)) | (b if isinstance(b, int) else _to_bits(b))
+    return sorted(set(a).union(b))
+
+def _andnot(a, b):
+    if isinstance(a, int):
+        return a & ~(b if isinstance(b, int) else _to_bits(b))
+    if isinstance(b, int):
+        bb = b.to_bytes((b.bit_length() + 7) >> 3, "little")
+        n = len(bb)
+        return [x for x in a if (x >> 3) >= n or not bb[x >> 3] >> (x & 7) & 1]
+    drop = set(b)
+    return [x for x in a if x not in drop]
+
+class RoaringBitmap:
+    """按块混合存储的编号集合；containers: 块号 -> 位图整数 | 低 16 位升序列表"""
+    __slots__ = ("n_docs", "containers")
+
+    def __init__(self, n_docs, containers=None):
+        self.n_docs = n_docs
+        self.containers = containers or {}
+
+    @classmethod
+    def from_sorted(cls, ids, n_docs):
+        chunks = {}
+        for d in ids:
+            key = d >> CHUNK_BITS
+            values = chunks.get(key)
+            if values is None:
+                values = chunks[key] = []
+            values.append(d & LOW_MASK)
+        bm = cls(n_docs)
+        for key, values in chunks.items():
+            bm._put(key, values)
+        return bm
+
+    @classmethod
+    def full(cls, n_docs):
+        return cls(n_docs, {key: (1 << _span(key, n_docs)) - 1 for key in range((n_docs + CHUNK - 1) >> CHUNK_BITS)})
+
+    def _put(self, key, c):
+        # 运算后按密度重新选择容器；空容器丢弃
+        card = _card(c)
+        if not card:
+            return
+        dense = card * 16 > _span(key, self.n_docs)
+        if dense and not isinstance(c, int):
+            c = _to_bits(c)
+        elif not dense and isinstance(c, int):
+            c = _to_values(c)
+        self.containers[key] = c
+
+    def __len__(self):
+        return sum(_card(c) for c in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __and__(self, other):
+        out = RoaringBitmap(self.n_docs)
+        for key, c in self.containers.items():
+            o = other.containers.get(key)
+            if o is not None:
+                out._put(key, _and(c, o))
+        return out
+
+    def __or__(self, other):
+        out = RoaringBitmap(self.n_docs)
+        for key in sorted(self.containers.keys() | other.containers.keys()):
+            a, b = self.containers.get(key), other.containers.get(key)
+            out._put(key, a if b is None else b if a is None else _or(a, b))
+        return out
+
+    def __sub__(self, other):
+        out = RoaringBitmap(self.n_docs)
+        for key, c in self.containers.items():
+            o = other.containers.get(key)
+            out._put(key, c if o is None else _andnot(c, o))
+        return out
+
+    def to_list(self):
+        out = []
+        for key in sorted(self.containers):
+            c = self.containers[key]
+            base = key << CHUNK_BITS
+            out.extend(base + x for x in (_to_values(c) if isinstance(c, int) else c))
+        return out
+
+    def encode(self, out):
+        encode_varint(len(self.containers), out)
+        for key in sorted(self.containers):
+            c = self.containers[key]
+            if isinstance(c, int):
+                data = c.to_bytes((c.bit_length() + 7) >> 3, "little")
+                kind = 1
+            else:
+                arr = array("H", c)
+                if sys.byteorder == "big":
+                    arr.byteswap()
+                data = arr.tobytes()
+                kind = 0
+            encode_varint(key, out)
+            out.append(kind)
+            encode_varint(len(data), out)
+            out += data
+
+    @classmethod
+    def decode(cls, buf, pos, n_docs):
+        n, pos = decode_varint(buf, pos)
+        containers = {}
+        for _ in range(n):
+            key, pos = decode_varint(buf, pos)
+            kind = buf[pos]
+            size, pos = decode_varint(buf, pos + 1)
+            data = buf[pos:pos + size]
+            pos += size
+            if kind:
+                containers[key] = int.from_bytes(data, "little")
+            else:
+                arr = array("H")
+                arr.frombytes(data)
+                if sys.byteorder == "big":
+                    arr.byteswap()
+                containers[key] = arr.tolist()
+        return cls(n_docs, containers), pos
+
+class BitmapBuilder:
+    """随倒排流挑出高频词项并编码其位图（与 stats.StatsBuilder 同样的 add/wrap/merge/save 用法）"""
+    def __init__(self, n_docs, dense_ratio=DENSE_RATIO):
+        self.n_docs = n_docs
+        self.dense_ratio = dense_ratio
+        self.records = []  # (term, 已编码的记录)
+
+    def add(self, term, docs_list):
+        df = len(docs_list)
+        if not df or df * self.dense_ratio <= self.n_docs:
+            return
+        rec = bytearray()
+        encode_str(term, rec)
+        encode_varint(df, rec)
+        RoaringBitmap.from_sorted((e["doc_id"] for e in docs_list), self.n_docs).encode(rec)
+        self.records.append(bytes(rec))
+
+    def wrap(self, items):
+        for term, docs_list in items:
+            self.add(term, docs_list)
+            yield term, docs_list
+
+    def merge(self, other):
+        self.records += other.records
+
+    def save(self, path):
+        with atomic_open(path) as f:
+            f.write(MAGIC)
+            f.write(_HEAD.pack(self.n_docs, len(self.records)))
+            for rec in self.records:
+                f.write(rec)
+
+class BitmapIndex:
+    """bitmaps.bin 的读取器：载入时只建 term -> 记录偏移的目录，位图在首次使用时解码并缓存"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buf = f.read()
+        if self.buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a bitmap file")
+        self.n_docs, n_terms = _HEAD.unpack_from(self.buf, len(MAGIC))
+        pos = len(MAGIC) + _HEAD.size
+        self.directory = {}
+        self.cache = {}
+        buf = self.buf
+        for _ in range(n_terms):
+            term, pos = decode_str(buf, pos)
+            df, pos = decode_varint(buf, pos)
+            self.directory[term] = pos
+            n, pos = decode_varint(buf, pos)
+            for _ in range(n):
+                _, pos = decode_varint(buf, pos)
+                size, pos = decode_varint(buf, pos + 1)
+                pos += size
+
+    def __contains__(self, term):
+        return term in self.directory
+
+    def __len__(self):
+        return len(self.directory)
+
+    def get(self, term):
+        bm = self.cache.get(term)
+        if bm is None:
+            pos = self.directory.get(term)
+            if pos is None:
+                return RoaringBitmap(self.n_docs)
+            bm, _ = RoaringBitmap.decode(self.buf, pos, self.n_docs)
+            self.cache[term] = bm
+        return bm
+
+def load_bitmaps(directory):
+    """读取 bitmaps.bin；不存在或格式不符时返回 None（检索端只用有序倒排）"""
+    path = directory / BITMAPS_FILE
+    if not path.exists():
+        return None
+    try:
+        return BitmapIndex(path)
+    except ValueError:
+        return None
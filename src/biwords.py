@@ -0,0 +1,217 @@
+# 词对（biword）索引（index_json/biwords.bin）：常见两词短语的预计算倒排
+# 词对 (a, b) 表示某文档中 b 恰好出现在 a 的下一个位置上，与 search_boolean.phrase_match 的相邻判定一致，
+# 因此两词短语只要词对被收录，结果直接就是该词对的倒排，不必做文档交集与位置校验；
+# 更长的短语用已收录的相邻词对缩小候选，仍逐个候选校验位置。
+# 收录哪些词对由建索引时的选项决定：按语料中的文档频率取前 top 个，和/或查询日志中双引号短语里的全部相邻词对。
+# 按文档频率选取需要统计全部词对；给出内存预算（--memory-mb）时，收集的词对倒排超出预算即按词对排序刷成 run
+# （与 SPIMI 相同，在文档边界处刷出），保存时两遍归并各 run：先统计 df 选出词对，再写出被选中词对的倒排。
+#
+# 文件布局：
+#   MAGIC
+#   <QQ>(文档数 N, 词对数 P)
+#   P 条倒排（按词对排序）：df 个 varint(文档编号差值)
+#   目录：P 个 [term_a, term_b, varint(df), varint(倒排偏移)]
+#   尾部：<Q>(目录偏移) + MAGIC
+# 读取器只解析目录，倒排在首次使用时按偏移解码。
+import heapq, json, re, shutil, struct
+from collections import defaultdict
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from utils import atomic_open
+
+MAGIC = b"IRBW2\n"
+BIWORDS_FILE = "biwords.bin"
+_HEAD = struct.Struct("<QQ")
+_TRAILER = struct.Struct("<Q")
+# 内存估算（CPython 对象开销）：每个新词对（键与列表）约 200B，列表中每个 doc_id 引用约 40B
+PAIR_BYTES = 200
+DOC_BYTES = 40
+
+def adjacent_pairs(tokens):
+    """一篇文档的 [(term, pos)] 中所有相邻词对（去重）；同一位置有多个词时逐一组合"""
+    at = defaultdict(list)
+    for term, pos in tokens:
+        at[pos].append(term)
+    return {(term, nxt) for term, pos in tokens for nxt in at.get(pos + 1, ())}
+
+def query_log_pairs(path, analyzer):
+    """查询日志（与 queries/boolean.json 相同的 {"queries": [...]}）中双引号短语经分析器后的相邻词对"""
+    with open(path, "r", encoding="utf-8") as f:
+        queries = json.load(f).get("queries", [])
+    pairs = set()
+    for q in queries:
+        for ph in re.findall(r'"([^"]+)"', q):
+            terms = analyzer.terms(ph)
+            pairs.update(zip(terms, terms[1:]))
+    return pairs
+
+def _flush_run(docs, path):
+    """把内存中的词对倒排按词对排序写成一个 run：每行 [term_a, term_b, [外部 doc_id...]]"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for (a, b) in sorted(docs):
+            f.write(json.dumps([a, b, docs[(a, b)]], ensure_ascii=False) + "\n")
+    return path
+
+def _read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            a, b, docs = json.loads(line)
+            yield (a, b), docs
+
+class BiwordBuilder:
+    """随分词流收集词对所在的文档（外部 doc_id），保存时再选出要收录的词对并换成内部编号。
+    top 为 0 时只收集查询日志中的词对；否则需要语料中全部词对的文档频率。
+    memory_mb > 0 时收集的倒排超出预算即刷成 run_dir 下的有序 run，内存受预算约束；否则全部留在内存中。
+    """
+    def __init__(self, top=0, pairs=(), memory_mb=0, run_dir=None):
+        self.top = top
+        self.wanted = set(pairs)
+        self.docs = defaultdict(list)  # (a, b) -> 外部 doc_id 列表
+        self.budget = memory_mb * 1024 * 1024
+        self.run_dir = run_dir
+        self.runs = []
+        self.used = 0
+        if self.budget and run_dir is not None:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    def add(self, doc_id, tokens):
+        for pair in adjacent_pairs(tokens):
+            if self.top or pair in self.wanted:
+                docs = self.docs[pair]
+                self.used += DOC_BYTES if docs else PAIR_BYTES
+                docs.append(doc_id)
+        if self.budget and self.used >= self.budget:
+            self._flush()
+
+    def _flush(self):
+        self.runs.append(_flush_run(self.docs, self.run_dir / f"run_{len(self.runs):04d}.jsonl"))
+        self.docs = defaultdict(list)
+        self.used = 0
+
+    def wrap(self, rows):
+        for row in rows:
+            self.add(row.get("doc_id") or row.get("title"), row["tokens"])
+            yield row
+
+    def merged(self):
+        """按词对顺序产出 (词对, 外部 doc_id 列表)；有 run 时 k 路归并（每篇文档的词对只在一个 run 中）"""
+        if not self.runs:
+            yield from sorted(self.docs.items())
+            return
+        if self.docs:
+            self._flush()
+        current, docs = None, []
+        for pair, run_docs in heapq.merge(*(_read_run(r) for r in self.runs), key=lambda x: x[0]):
+            if pair != current:
+                if current is not None:
+                    yield current, docs
+                current, docs = pair, []
+            docs.extend(run_docs)
+        if current is not None:
+            yield current, docs
+
+    def select(self):
+        """要收录的词对（升序）：查询日志中出现在语料里的词对，加上文档频率最高的 top 个（同频按词对排序）"""
+        chosen = set()
+        def counts():
+            for pair, docs in self.merged():
+                if pair in self.wanted:
+                    chosen.add(pair)
+                yield pair, len(docs)
+        if self.top:
+            chosen.update(p for p, _ in heapq.nsmallest(self.top, counts(), key=lambda x: (-x[1], x[0])))
+        else:
+            for _ in counts():
+                pass
+        return sorted(chosen)
+
+    def save(self, path, doc_num):
+        """doc_num：外部 doc_id -> 内部编号（与刚写出的 docids.json 一致）。返回收录的词对数"""
+        chosen = set(self.select())
+        directory = []
+        with atomic_open(path) as f:
+            f.write(MAGIC)
+            f.write(_HEAD.pack(len(doc_num), len(chosen)))
+            off = len(MAGIC) + _HEAD.size
+            for pair, docs in self.merged():
+                if pair not in chosen:
+                    continue
+                ids = sorted({doc_num[d] for d in docs if d in doc_num})
+                rec = bytearray()
+                prev = 0
+                for d in ids:
+                    encode_varint(d - prev, rec)
+                    prev = d
+                f.write(rec)
+                directory.append((pair, len(ids), off))
+                off += len(rec)
+            tail = bytearray()
+            for (a, b), df, rec_off in directory:
+                encode_str(a, tail)
+                encode_str(b, tail)
+                encode_varint(df, tail)
+                encode_varint(rec_off, tail)
+            f.write(tail)
+            f.write(_TRAILER.pack(off))
+            f.write(MAGIC)
+        if self.runs:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        return len(directory)
+
+class BiwordIndex:
+    """biwords.bin 的读取器：载入时只解析尾部目录 (a, b) -> (df, 倒排偏移)，倒排在首次使用时解码并缓存"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buf = f.read()
+        buf = self.buf
+        end = len(buf) - len(MAGIC)
+        if end < len(MAGIC) + _HEAD.size + _TRAILER.size or buf[:len(MAGIC)] != MAGIC or buf[end:] != MAGIC:
+            raise ValueError(f"{path}: not a biword file")
+        self.n_docs, n_pairs = _HEAD.unpack_from(buf, len(MAGIC))
+        pos, = _TRAILER.unpack_from(buf, end - _TRAILER.size)
+        self.directory = {}
+        self.cache = {}
+        for _ in range(n_pairs):
+            a, pos = decode_str(buf, pos)
+            b, pos = decode_str(buf, pos)
+            df, pos = decode_varint(buf, pos)
+            off, pos = decode_varint(buf, pos)
+            self.directory[(a, b)] = (df, off)
+
+    def __contains__(self, pair):
+        return pair in self.directory
+
+    def __len__(self):
+        return len(self.directory)
+
+    def df(self, pair):
+        entry = self.directory.get(pair)
+        return entry[0] if entry else 0
+
+    def get(self, pair):
+        """词对的升序编号列表（未收录时为空）"""
+        ids = self.cache.get(pair)
+        if ids is None:
+            entry = self.directory.get(pair)
+            if entry is None:
+                return []
+            df, pos = entry
+            ids = []
+            d = 0
+            buf = self.buf
+            for _ in range(df):
+                gap, pos = decode_varint(buf, pos)
+                d += gap
+                ids.append(d)
+            self.cache[pair] = ids
+        return ids
+
+def load_biwords(directory):
+    """读取 biwords.bin；不存在或格式不符时返回 None（短语一律走位置校验）"""
+    path = directory / BIWORDS_FILE
+    if not path.exists():
+        return None
+    try:
+        return BiwordIndex(path)
+    except ValueError:
+        return None
@@ -1,6 +1,17 @@
-import json, pathlib, math, argparse
+import json, pathlib, math, argparse, heapq, shutil, os, sys, subprocess, time, bisect, zlib
 from collections import defaultdict
-from utils import read_jsonl, save_json, DATA_STAGE, INDEX_DIR
+from utils import read_jsonl, save_json, save_json_items, json_item, load_docids, DATA_STAGE, INDEX_DIR, DOCIDS_FILE
+from tokens import read_token_stream, token_block_offsets
+from analyzer import load_analyzer, save_analyzer
+from postings_bin import write_postings_bin, write_postings_fragment, concat_postings_bin, BinaryPostings, POSITIONS_FILE
+from lexicon_bin import LEXICON_FILE
+from stats import StatsBuilder, STATS_FILE
+from bitmap import BitmapBuilder, BITMAPS_FILE
+from wildcard import KGramBuilder, KGRAMS_FILE
+from biwords import BiwordBuilder, BIWORDS_FILE, query_log_pairs
+from segments import (SegmentLock, load_segments, save_segments, new_segment_name, segment_dir, reset_segments,
+                      add_tombstones, select_merges, postings_format, load_tombstones,
+                      BASE, SEGMENTS_DIR, TOMBSTONES_FILE)
 
 def calculate_skip_interval(length, strategy: str = "sqrt"):
     """根据倒排记录表长度计算跳表间隔
@@ -56,24 +67,40 @@ def add_skip_pointers(postings_list, strategy: str = "sqrt"):
     
     return postings_list
 
-def main():
-    parser = argparse.ArgumentParser(description="Build inverted index with optional skip pointers")
-    parser.add_argument("--skip", dest="skip_strategy", default="sqrt",
-                        help="skip pointer strategy: none|sqrt|k:<int>|alpha:<float>")
-    args = parser.parse_args()
+def accumulate(rows):
+    """读取分词结果，累积 term -> doc_id -> {tf, pos}"""
     postings = defaultdict(lambda: defaultdict(lambda: {"tf":0, "pos":[]}))
-    df = {}
-    src = DATA_STAGE / "events.tokens.jsonl"
-    
-    # 读取数据并构建基础倒排索引
-    for row in read_jsonl(src):
+    for row in rows:
         doc_id = row.get("doc_id") or row.get("title")  # fallback
         for term, pos in row["tokens"]:
             p = postings[term][doc_id]
             p["tf"] += 1
             p["pos"].append(pos)
-    
-    # 转换为普通结构并添加跳表指针
+    return postings
+
+def lexicon_entry(length, strategy):
+    return {
+        "df": length,
+        "skip_interval": calculate_skip_interval(length, strategy),
+        "skip_strategy": strategy,
+        "length": length
+    }
+
+def assign_doc_ids(ids):
+    """按外部 id 字典序分配稠密内部编号 0..N-1，返回 (doc_ids 表, 外部 id -> 编号)。
+    编号顺序与外部 id 顺序一致，按编号排序的结果映射回外部 id 后仍是原来的顺序。
+    """
+    doc_ids = sorted(set(ids))
+    return doc_ids, {d: i for i, d in enumerate(doc_ids)}
+
+def finalize(postings, strategy, doc_num=None):
+    """转换为普通结构（doc_id 换成内部整数编号）并添加跳表指针，返回 (lexicon, postings_out, doc_ids)
+    doc_num 缺省时由 postings 中出现的全部文档重新分配编号。
+    """
+    if doc_num is None:
+        doc_ids, doc_num = assign_doc_ids(d for docs in postings.values() for d in docs)
+    else:
+        doc_ids = list(doc_num)
     lexicon = {}
     postings_out = {}
     
@@ -81,26 +108,573 @@ def main():
         docs_list = []
         for doc_id, stat in docs.items():
             stat["pos"].sort()
-            docs_list.append({"doc_id": doc_id, **stat})
+            docs_list.append({"doc_id": doc_num[doc_id], **stat})
         
-        # 按文档ID排序（假设文档ID可比较）
+        # 按内部文档编号排序
         docs_list.sort(key=lambda x: x["doc_id"])
         
         # 添加跳表指针
-        docs_list_with_skip = add_skip_pointers(docs_list, args.skip_strategy)
+        docs_list_with_skip = add_skip_pointers(docs_list, strategy)
         
         postings_out[term] = docs_list_with_skip
-        length = len(docs_list)
-        lexicon[term] = {
-            "df": length,
-            "skip_interval": calculate_skip_interval(length, args.skip_strategy),
-            "skip_strategy": args.skip_strategy,
-            "length": length
-        }
+        lexicon[term] = lexicon_entry(len(docs_list), strategy)
+    return lexicon, postings_out, doc_ids
+
+# ---------------- SPIMI：内存预算内单遍建索引，溢出到磁盘 run，最后 k 路归并 ----------------
+SPIMI_DIR = DATA_STAGE / "spimi_runs"
+# 粗略的内存估算（CPython 对象开销）：每个 (term, doc) 条目约 200B，每个位置约 40B
+ENTRY_BYTES = 200
+POS_BYTES = 40
+
+def _flush_run(block, path):
+    """把内存块按 term 排序写成一个 run：每行 [term, [[doc_id, [pos...]], ...]]（doc 已排序）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for term in sorted(block):
+            docs = block[term]
+            f.write(json.dumps([term, [[d, docs[d]] for d in sorted(docs)]], ensure_ascii=False) + "\n")
+    return path
+
+def spimi_invert(rows, memory_mb):
+    """单遍倒排：term -> {doc_id: [pos]}，估算内存超出预算即在文档边界处刷出一个有序 run。
+    run 中仍使用外部 doc_id（编号要等全部文档读完才能分配），返回 (runs, 有词的文档 id 集合)。
+    """
+    budget = memory_mb * 1024 * 1024
+    if SPIMI_DIR.exists():
+        shutil.rmtree(SPIMI_DIR)
+    runs = []
+    doc_ids = set()
+    block = {}
+    used = 0
+    for row in rows:
+        doc_id = row.get("doc_id") or row.get("title")  # fallback
+        if row["tokens"]:
+            doc_ids.add(doc_id)
+        for term, pos in row["tokens"]:
+            docs = block.get(term)
+            if docs is None:
+                docs = block[term] = {}
+            plist = docs.get(doc_id)
+            if plist is None:
+                plist = docs[doc_id] = []
+                used += ENTRY_BYTES
+            plist.append(pos)
+            used += POS_BYTES
+        if used >= budget:
+            runs.append(_flush_run(block, SPIMI_DIR / f"run_{len(runs):04d}.jsonl"))
+            block = {}
+            used = 0
+    if block or not runs:
+        runs.append(_flush_run(block, SPIMI_DIR / f"run_{len(runs):04d}.jsonl"))
+    return runs, doc_ids
+
+def _read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            term, docs = json.loads(line)
+            yield term, docs
+
+def merge_runs(runs, strategy, doc_num):
+    """k 路归并各 run（heapq.merge 按 term 有序），逐个产出 (term, 带跳表的倒排列表)。
+    同一文档可能出现在多个 run 中（重复 doc_id），按 doc 合并 tf/pos；输出时换成内部编号 doc_num[doc_id]。
+    """
+    current, docs = None, {}
+    def emit():
+        docs_list = []
+        for doc_id in sorted(docs):
+            pos = sorted(docs[doc_id])
+            docs_list.append({"doc_id": doc_num[doc_id], "tf": len(pos), "pos": pos})
+        return current, add_skip_pointers(docs_list, strategy)
+    for term, run_docs in heapq.merge(*(_read_run(r) for r in runs), key=lambda x: x[0]):
+        if term != current:
+            if current is not None:
+                yield emit()
+            current, docs = term, {}
+        for doc_id, pos in run_docs:
+            docs.setdefault(doc_id, []).extend(pos)
+    if current is not None:
+        yield emit()
+
+def build_spimi(rows, strategy, memory_mb, pretty=False, fmt="bin"):
+    """SPIMI 建索引：倒排表直接流式写出，内存占用受预算（与单个词项的倒排长度）约束。返回词项数"""
+    runs, ids = spimi_invert(rows, memory_mb)
+    doc_ids, doc_num = assign_doc_ids(ids)
+    lexicon = {}
+    def items():
+        for term, docs_list in merge_runs(runs, strategy, doc_num):
+            lexicon[term] = lexicon_entry(len(docs_list), strategy)
+            yield term, docs_list
+    save_postings(lambda: items(), doc_ids, fmt, pretty)
+    save_json(INDEX_DIR / "lexicon.json", lexicon)
+    print(f"SPIMI: {len(runs)} runs merged (budget {memory_mb} MB)")
+    shutil.rmtree(SPIMI_DIR, ignore_errors=True)
+    return len(lexicon)
+
+# ---------------- 并行建索引：按文档分片 map（各进程局部倒排）+ 按词项分区 reduce ----------------
+# map：分词文件按字节区间切成 n 片（边界对齐到行/块），每个进程只读自己的区间，局部倒排按 crc32(term) % n
+#      分区写成有序 run（仍用外部 doc_id）；
+# reduce：汇总全部文档后统一分配编号，进程 j 归并所有分片的第 j 个分区，直接编码成倒排片段文件；
+# 主进程只做片段拼接（文件复制）与目录偏移修正，没有逐词项的串行工作。
+PARALLEL_DIR = DATA_STAGE / "parallel_runs"
+
+def shard_ranges(path, n, fmt):
+    """把分词文件切成至多 n 个 [start, end) 字节区间，起点对齐到行首（jsonl）或块首（bin）"""
+    size = path.stat().st_size
+    if fmt == "bin":
+        offsets = token_block_offsets(path)
+        cuts = set(offsets[:1])
+        for k in range(1, n):
+            i = bisect.bisect_left(offsets, size * k // n)
+            if i < len(offsets):
+                cuts.add(offsets[i])
+    else:
+        cuts = {0}
+        with open(path, "rb") as f:
+            for k in range(1, n):
+                f.seek(size * k // n)
+                f.readline()  # 跳到下一行行首
+                cuts.add(f.tell())
+    cuts = sorted(c for c in cuts if c < size)
+    return [(a, b) for a, b in zip(cuts, cuts[1:] + [size])]
+
+def _read_shard(path, fmt, start, end):
+    if fmt == "bin":
+        yield from read_token_stream(path, start, end)
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+def term_partition(term, n):
+    # 跨进程稳定的分区函数（内置 hash 对 str 有随机化）
+    return zlib.crc32(term.encode("utf-8")) % n
+
+def _map_shard(path, fmt, start, end, n_parts, shard_id):
+    """map 任务：对一个分片建局部倒排，按词项分区写出有序 run，返回该分片中有词的文档 id"""
+    block = {}
+    doc_ids = []
+    for row in _read_shard(path, fmt, start, end):
+        doc_id = row.get("doc_id") or row.get("title")  # fallback
+        if row["tokens"]:
+            doc_ids.append(doc_id)
+        for term, pos in row["tokens"]:
+            docs = block.get(term)
+            if docs is None:
+                docs = block[term] = {}
+            plist = docs.get(doc_id)
+            if plist is None:
+                plist = docs[doc_id] = []
+            plist.append(pos)
+    parts = [{} for _ in range(n_parts)]
+    for term, docs in block.items():
+        parts[term_partition(term, n_parts)][term] = docs
+    for j, part in enumerate(parts):
+        _flush_run(part, PARALLEL_DIR / f"s{shard_id:03d}_p{j:03d}.jsonl")
+    return doc_ids
+
+def _reduce_part(runs, strategy, doc_num, fmts, part_id, pretty):
+    """reduce 任务：归并一个词项分区的所有 run，写出 json/bin 倒排片段，
+    返回 (lexicon 片段, bin 片段目录, 部分统计, 高频词位图, 词项 k-gram)"""
+    lexicon = {}
+    stats = StatsBuilder(len(doc_num))
+    bitmaps = BitmapBuilder(len(doc_num))
+    kgrams = KGramBuilder()
+    json_f = open(PARALLEL_DIR / f"part_{part_id:03d}.json", "w", encoding="utf-8") if "json" in fmts else None
+    bin_f = open(PARALLEL_DIR / f"part_{part_id:03d}.bin", "wb") if "bin" in fmts else None
+    pos_f = open(PARALLEL_DIR / f"part_{part_id:03d}.pos", "wb") if "bin" in fmts else None
+    directory = []
+    try:
+        def items():
+            for term, docs_list in kgrams.wrap(bitmaps.wrap(stats.wrap(merge_runs(runs, strategy, doc_num)))):
+                lexicon[term] = lexicon_entry(len(docs_list), strategy)
+                if json_f is not None:
+                    json_f.write("," + json_item(term, docs_list, pretty))
+                yield term, docs_list
+        if bin_f is not None:
+            directory = write_postings_fragment(bin_f, pos_f, items())
+        else:
+            for _ in items():
+                pass
+    finally:
+        for fh in (json_f, bin_f, pos_f):
+            if fh is not None:
+                fh.close()
+    return lexicon, directory, stats, bitmaps, kgrams
+
+def _concat_json_parts(path, parts, pretty):
+    # 各片段为 ",item,item..."：去掉整体第一个逗号后与 save_json_items 的输出逐字节一致
+    first = True
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("{")
+        for part in parts:
+            with open(part, "r", encoding="utf-8") as f:
+                if first:
+                    if not f.read(1):
+                        continue
+                    first = False
+                shutil.copyfileobj(f, out)
+        out.write("\n}" if pretty and not first else "}")
+
+def build_parallel(name, tokens_fmt, strategy, workers, fmt="bin", pretty=False):
+    """多进程建索引（map 分片倒排 + reduce 分区归并），输出与单进程构建一致。返回词项数"""
+    from concurrent.futures import ProcessPoolExecutor
+    path = DATA_STAGE / f"{name}.tokens.{tokens_fmt}"
+    fmts = ("json", "bin") if fmt == "both" else (fmt,)
+    shutil.rmtree(PARALLEL_DIR, ignore_errors=True)
+    PARALLEL_DIR.mkdir(parents=True)
+    ranges = shard_ranges(path, workers, tokens_fmt)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futs = [ex.submit(_map_shard, path, tokens_fmt, a, b, workers, i) for i, (a, b) in enumerate(ranges)]
+        ids = []
+        for fut in futs:
+            ids.extend(fut.result())
+        doc_ids, doc_num = assign_doc_ids(ids)
+        futs = [ex.submit(_reduce_part, sorted(PARALLEL_DIR.glob(f"s*_p{j:03d}.jsonl")), strategy, doc_num,
+                          fmts, j, pretty) for j in range(workers)]
+        parts = [fut.result() for fut in futs]
+    lexicon = {}
+    stats = StatsBuilder(len(doc_ids))
+    bitmaps = BitmapBuilder(len(doc_ids))
+    kgrams = KGramBuilder()
+    for lex, _, part_stats, part_bitmaps, part_kgrams in parts:
+        lexicon.update(lex)
+        stats.merge(part_stats)
+        bitmaps.merge(part_bitmaps)
+        kgrams.merge(part_kgrams)
+    stats.save(INDEX_DIR / STATS_FILE)
+    bitmaps.save(INDEX_DIR / BITMAPS_FILE)
+    kgrams.save(INDEX_DIR / KGRAMS_FILE)
+    save_json(INDEX_DIR / DOCIDS_FILE, doc_ids, pretty=pretty)
+    if "json" in fmts:
+        _concat_json_parts(INDEX_DIR / POSTINGS_FILES["json"],
+                           [PARALLEL_DIR / f"part_{j:03d}.json" for j in range(workers)], pretty)
+    if "bin" in fmts:
+        concat_postings_bin(INDEX_DIR / POSTINGS_FILES["bin"],
+                            [(PARALLEL_DIR / f"part_{j:03d}.bin", PARALLEL_DIR / f"part_{j:03d}.pos", d)
+                             for j, (_, d, _, _, _) in enumerate(parts)], len(doc_ids))
+    _remove_other_formats(fmts, INDEX_DIR)
+    save_json(INDEX_DIR / "lexicon.json", lexicon)
+    print(f"Parallel build: {len(ranges)} shards x {workers} partitions")
+    shutil.rmtree(PARALLEL_DIR, ignore_errors=True)
+    return len(lexicon)
+
+# ---------------- 倒排表的存储格式：postings.json / postings.bin + docids.json ----------------
+POSTINGS_FILES = {"json": "postings.json", "bin": "postings.bin"}
+# 每种格式的全部文件：二进制倒排的位置单独存放在 positions.bin，词典为 lexicon.bin
+FORMAT_FILES = {"json": ("postings.json",), "bin": ("postings.bin", POSITIONS_FILE, LEXICON_FILE)}
+
+def _remove_other_formats(fmts, directory):
+    for f, names in FORMAT_FILES.items():
+        if f in fmts:
+            continue
+        for name in names:
+            if (directory / name).exists():
+                (directory / name).unlink()
+
+def save_postings(make_items, doc_ids, fmt="bin", pretty=False, directory=INDEX_DIR):
+    """按 fmt（json|bin|both）写出倒排表、docids.json、集合统计 stats.bin、高频词位图 bitmaps.bin 与通配查询用的 kgrams.bin；
+    make_items() 每次返回一个新的 (term, docs_list) 流。统计、位图与 k-gram 在写第一种格式时顺带累积，不额外遍历倒排。
+    未选择的格式若残留旧文件则删除，避免检索端读到过期索引。
+    """
+    save_json(directory / DOCIDS_FILE, doc_ids, pretty=pretty)
+    stats = StatsBuilder(len(doc_ids))
+    bitmaps = BitmapBuilder(len(doc_ids))
+    kgrams = KGramBuilder()
+    fmts = ("json", "bin") if fmt == "both" else (fmt,)
+    for i, f in enumerate(fmts):
+        path = directory / POSTINGS_FILES[f]
+        items = kgrams.wrap(bitmaps.wrap(stats.wrap(make_items()))) if i == 0 else make_items()
+        if f == "json":
+            save_json_items(path, items, pretty=pretty)
+        else:
+            write_postings_bin(path, items, len(doc_ids))
+    stats.save(directory / STATS_FILE)
+    bitmaps.save(directory / BITMAPS_FILE)
+    kgrams.save(directory / KGRAMS_FILE)
+    _remove_other_formats(fmts, directory)
+
+def load_postings_any(directory=INDEX_DIR):
+    """读取现有倒排表（优先 postings.bin，位置从 positions.bin 补齐），返回可修改的 dict；不存在则为空"""
+    if (directory / "postings.bin").exists():
+        with BinaryPostings(directory / "postings.bin", cache_size=0) as bp:
+            return {term: bp.get_full(term) for term in bp.keys()}
+    return load_json_or(directory / "postings.json", {})
+
+# ---------------- 词对索引：常见短语的预计算倒排（见 biwords.py） ----------------
+BIWORD_RUNS_DIR = DATA_STAGE / "biword_runs"
+
+def biword_builder(top, queries, analyzer, memory_mb=0):
+    """按选项创建 BiwordBuilder：top 为按文档频率收录的词对数，queries 为查询日志路径；都未指定时返回 None。
+    memory_mb > 0（SPIMI 模式）时词对倒排另按同样大小的预算溢出到 data_stage/biword_runs/
+    """
+    if not top and not queries:
+        return None
+    pairs = query_log_pairs(pathlib.Path(queries), analyzer) if queries else ()
+    return BiwordBuilder(top, pairs, memory_mb, BIWORD_RUNS_DIR)
+
+def save_biwords(builder, directory=INDEX_DIR):
+    """全量构建后写出 biwords.bin（编号取刚写出的 docids.json）；未启用时删除旧文件，避免检索端读到过期的词对倒排"""
+    path = directory / BIWORDS_FILE
+    if builder is None:
+        if path.exists():
+            path.unlink()
+        return
+    n = builder.save(path, {d: i for i, d in enumerate(load_docids(directory))})
+    print(f"Biwords: {n} pairs -> {path}")
+
+def read_tokens(name, fmt):
+    """读取分词结果：jsonl（events.tokens.jsonl）或二进制 token 流（events.tokens.bin）"""
+    if fmt == "bin":
+        return read_token_stream(DATA_STAGE / f"{name}.tokens.bin")
+    return read_jsonl(DATA_STAGE / f"{name}.tokens.jsonl")
+
+def load_json_or(path, default):
+    if not path.exists():
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ---------------- 分段索引：增量写新段 + 墓碑删除 + 分层合并（见 segments.py） ----------------
+def flush_segment(delta_postings, deletes, strategy, fmt="bin", root=INDEX_DIR):
+    """把增量写成一个新的不可变段；delta 中的文档（upsert）与删除列表在已有各段中记为墓碑。
+    返回 (新段名或 None, 新增墓碑数)。
+    """
+    lexicon, postings_out, doc_ids = finalize(delta_postings, strategy)
+    with SegmentLock(root):
+        manifest = load_segments(root)
+        name = None
+        if doc_ids:
+            name = new_segment_name(manifest)
+            d = segment_dir(name, root)
+            save_json(d / "lexicon.json", lexicon)
+            save_postings(lambda: iter(postings_out.items()), doc_ids, fmt, directory=d)
+        # 先标记旧版本再登记新段：墓碑只作用于已有段
+        n_dead = add_tombstones(manifest, set(deletes) | set(doc_ids), root)
+        if name:
+            manifest["segments"].append({"name": name, "docs": len(doc_ids), "deleted": 0})
+        save_segments(manifest, root)
+    return name, n_dead
+
+def _install_base(tmp, root):
+    # 合并结果成为新的 base：替换根目录下的索引文件（lexicon/docids/postings/tombstones）
+    # 词对索引按旧 base 的编号写成，合并后不再对应，一并删除
+    for f in [*(n for names in FORMAT_FILES.values() for n in names), TOMBSTONES_FILE, BIWORDS_FILE]:
+        if (root / f).exists() and not (tmp / f).exists():
+            (root / f).unlink()
+    for f in tmp.iterdir():
+        os.replace(f, root / f.name)
+    tmp.rmdir()
+
+def merge_segments(names, strategy, fmt=None, root=INDEX_DIR):
+    """把若干段（按快照时的墓碑过滤）合并为一个新段；含 base 时合并结果即新的 base。
+    只在选段与提交时持锁：合并期间其他进程仍可写入新段/墓碑，提交时把期间新增的墓碑映射到合并段上。
+    返回合并后的段名（所有文档均已删除且不含 base 时为 None）。
+    """
+    with SegmentLock(root):
+        manifest = load_segments(root)
+        busy = set(manifest.get("merging", []))
+        segs = [s for s in manifest["segments"] if s["name"] in names and s["name"] not in busy]
+        if not segs:
+            return None
+        names = [s["name"] for s in segs]
+        snapshot = {n: load_tombstones(n, root) for n in names}
+        target = BASE if BASE in names else new_segment_name(manifest)
+        manifest["merging"] = sorted(busy | set(names))
+        save_segments(manifest, root)
+    tmp = root / SEGMENTS_DIR / f"_merge_{target}"
+    try:
+        # 按外部 id 重新累积存活文档（同一外部 id 至多在一个段中存活：更新时旧版本已被墓碑标记）
+        merged = defaultdict(dict)
+        for n in names:
+            d = segment_dir(n, root)
+            ext = load_docids(d)
+            dead = snapshot[n]
+            for term, plist in load_postings_any(d).items():
+                for e in plist:
+                    if e["doc_id"] not in dead:
+                        merged[term][ext[e["doc_id"]]] = {"tf": e["tf"], "pos": list(e["pos"])}
+        lexicon, postings_out, doc_ids = finalize(merged, strategy)
+        if doc_ids or target == BASE:
+            shutil.rmtree(tmp, ignore_errors=True)
+            save_json(tmp / "lexicon.json", lexicon)
+            save_postings(lambda: iter(postings_out.items()), doc_ids,
+                          fmt or postings_format(segment_dir(names[0], root)), directory=tmp)
+        with SegmentLock(root):
+            manifest = load_segments(root)
+            num = {d: i for i, d in enumerate(doc_ids)}
+            extra = set()
+            for n in names:
+                ext = load_docids(segment_dir(n, root))
+                for i in load_tombstones(n, root) - snapshot[n]:
+                    if ext[i] in num:
+                        extra.add(num[ext[i]])
+            record = None
+            if doc_ids or target == BASE:
+                if extra:
+                    with open(tmp / TOMBSTONES_FILE, "w", encoding="utf-8") as f:
+                        json.dump(sorted(extra), f)
+                if target == BASE:
+                    _install_base(tmp, root)
+                else:
+                    os.replace(tmp, segment_dir(target, root))
+                record = {"name": target, "docs": len(doc_ids), "deleted": len(extra)}
+            segs_out = []
+            for s in manifest["segments"]:
+                if s["name"] in names:
+                    if record is not None:
+                        segs_out.append(record)
+                        record = None
+                else:
+                    segs_out.append(s)
+            manifest["segments"] = segs_out
+            manifest["merging"] = [n for n in manifest.get("merging", []) if n not in names]
+            save_segments(manifest, root)
+        for n in names:
+            if n != BASE:
+                shutil.rmtree(segment_dir(n, root), ignore_errors=True)
+        return target if (doc_ids or target == BASE) else None
+    except BaseException:
+        with SegmentLock(root):
+            manifest = load_segments(root)
+            manifest["merging"] = [n for n in manifest.get("merging", []) if n not in names]
+            save_segments(manifest, root)
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def run_merge_policy(strategy, fmt=None, factor=10, root=INDEX_DIR):
+    """反复应用分层合并策略直到没有可合并的段（合并结果可能触发上一层的合并），返回合并次数"""
+    n = 0
+    while True:
+        with SegmentLock(root):
+            groups = select_merges(load_segments(root), factor)
+        if not groups:
+            return n
+        for g in groups:
+            merge_segments(g, strategy, fmt, root)
+            n += 1
+
+def force_merge(strategy, fmt=None, root=INDEX_DIR):
+    """把所有段（含墓碑）压实为单个 base 段，等价于全量重建"""
+    with SegmentLock(root):
+        names = [s["name"] for s in load_segments(root)["segments"]]
+    if names:
+        merge_segments(names, strategy, fmt, root)
+    with SegmentLock(root):
+        manifest = load_segments(root)
+        segs = manifest["segments"]
+        if len(segs) == 1 and segs[0]["name"] == BASE and not segs[0].get("deleted") and not manifest.get("merging"):
+            reset_segments(root)  # 回到无清单的单一 base 形态
+
+def spawn_background_merge(args):
+    """在脱离当前进程的子进程中执行合并策略，增量写入立即返回；日志写到 segments/merge.log"""
+    log_dir = INDEX_DIR / SEGMENTS_DIR
+    log_dir.mkdir(parents=True, exist_ok=True)
+    cmd = [sys.executable, str(pathlib.Path(__file__).resolve()), "--merge", args.merge,
+           "--skip", args.skip_strategy, "--merge-factor", str(args.merge_factor)]
+    if args.fmt:
+        cmd += ["--format", args.fmt]
+    with open(log_dir / "merge.log", "a", encoding="utf-8") as log:
+        subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+def run_merge(args):
+    if args.merge == "full":
+        force_merge(args.skip_strategy, args.fmt)
+        return "full merge done"
+    return f"{run_merge_policy(args.skip_strategy, args.fmt, args.merge_factor)} merges"
+
+def main():
+    parser = argparse.ArgumentParser(description="Build inverted index with optional skip pointers")
+    parser.add_argument("--skip", dest="skip_strategy", default="sqrt",
+                        help="skip pointer strategy: none|sqrt|k:<int>|alpha:<float>")
+    parser.add_argument("--delta", action="store_true",
+                        help="write events.delta.tokens.jsonl as a new segment; events.delta.deletes.json and updated docs become tombstones")
+    parser.add_argument("--tokens", dest="tokens_fmt", default="jsonl", choices=["jsonl", "bin"],
+                        help="token input format: jsonl (events.tokens.jsonl) | bin (events.tokens.bin)")
+    parser.add_argument("--format", dest="fmt", default=None, choices=["json", "bin", "both"],
+                        help="postings format: bin (gap/varint compressed postings.bin) | json (postings.json) | both "
+                             "(default: bin for full builds, the existing index's format for --delta/--merge; "
+                             "search engines read postings.bin, json is only for inspection)")
+    parser.add_argument("--pretty", action="store_true",
+                        help="write postings.json with indent=2 (readable but several times larger/slower)")
+    parser.add_argument("--memory-mb", type=int, default=0,
+                        help="SPIMI mode: flush sorted runs to disk when the in-memory block exceeds this budget, then k-way merge (0 = all in memory)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parallel full build: shard the token file across N processes, then merge per-term partitions (1 = serial)")
+    parser.add_argument("--merge", default=None, choices=["tiered", "full", "none"],
+                        help="segment merge: tiered policy | full (compact everything into base) | none "
+                             "(default with --delta: tiered; alone: run the merge and exit)")
+    parser.add_argument("--merge-factor", type=int, default=10,
+                        help="tiered policy: merge once this many segments share a size tier")
+    parser.add_argument("--background", action="store_true",
+                        help="with --delta: run the merge in a detached process and return right after the new segment is written")
+    parser.add_argument("--biwords", type=int, default=0,
+                        help="full builds: also index the N adjacent word pairs with the highest document frequency (biwords.bin)")
+    parser.add_argument("--biword-queries", default=None,
+                        help="full builds: also index every adjacent pair of the quoted phrases in this query log "
+                             "(JSON with a \"queries\" list, e.g. queries/boolean.json)")
+    args = parser.parse_args()
+
+    if args.delta:
+        # 增量：只读 delta，写成新段；旧版本/删除文档记为墓碑，已有段文件保持不变
+        t0 = time.perf_counter()
+        fmt = args.fmt or postings_format(INDEX_DIR)
+        deletes = load_json_or(DATA_STAGE / "events.delta.deletes.json", [])
+        delta_postings = accumulate(read_tokens("events.delta", args.tokens_fmt))
+        name, n_dead = flush_segment(delta_postings, deletes, args.skip_strategy, fmt)
+        print(f"Flushed segment {name or '(none)'} ({n_dead} tombstones) in {time.perf_counter() - t0:.2f} s")
+        args.merge = args.merge or "tiered"
+        if args.merge == "none":
+            return
+        if args.background:
+            spawn_background_merge(args)
+            print(f"Segment merge ({args.merge}) started in background -> {INDEX_DIR / SEGMENTS_DIR / 'merge.log'}")
+        else:
+            print(f"Segment merge: {run_merge(args)}")
+        return
+
+    if args.merge:
+        if args.merge != "none":
+            print(f"Segment merge: {run_merge(args)}")
+        return
+
+    fmt = args.fmt or "bin"
+    analyzer = load_analyzer(DATA_STAGE)
+    biwords = biword_builder(args.biwords, args.biword_queries, analyzer, args.memory_mb)
+    # 全量重建取代所有增量段与墓碑
+    reset_segments(INDEX_DIR)
+    if args.workers > 1:
+        t0 = time.perf_counter()
+        n_terms = build_parallel("events", args.tokens_fmt, args.skip_strategy, args.workers, fmt, args.pretty)
+        if biwords is not None:
+            # 分词文件由各进程分片读取，词对在主进程另读一遍
+            for _ in biwords.wrap(read_tokens("events", args.tokens_fmt)):
+                pass
+        save_biwords(biwords)
+        save_analyzer(analyzer, INDEX_DIR)
+        print(f"Indexed {n_terms} terms -> {INDEX_DIR} ({time.perf_counter() - t0:.2f} s)")
+        return
+    rows = read_tokens("events", args.tokens_fmt)
+    if biwords is not None:
+        rows = biwords.wrap(rows)
+    if args.memory_mb > 0:
+        n_terms = build_spimi(rows, args.skip_strategy, args.memory_mb, pretty=args.pretty, fmt=fmt)
+        save_biwords(biwords)
+        save_analyzer(analyzer, INDEX_DIR)
+        print(f"Indexed {n_terms} terms -> {INDEX_DIR}")
+        return
+
+    # 读取数据并构建基础倒排索引
+    postings = accumulate(rows)
+    lexicon, postings_out, doc_ids = finalize(postings, args.skip_strategy)
     
-    # 保存索引
+    # 保存索引（连同分词时使用的分析器配置与编号表）
     save_json(INDEX_DIR / "lexicon.json", lexicon)
-    save_json(INDEX_DIR / "postings.json", postings_out)
+    save_postings(lambda: iter(postings_out.items()), doc_ids, fmt, args.pretty)
+    save_biwords(biwords)
+    save_analyzer(analyzer, INDEX_DIR)
     print(f"Indexed {len(lexicon)} terms -> {INDEX_DIR}")
 
 if __name__ == "__main__":
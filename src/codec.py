@@ -0,0 +1,35 @@
+# 变长整数（variable-byte / varint）编解码：每字节低 7 位存数据，最高位为 1 表示后续还有字节
+# 供二进制 token 流、压缩倒排等格式共用
+
+def encode_varint(n, out):
+    """把非负整数 n 以 varint 追加到 bytearray out"""
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def decode_varint(buf, pos):
+    """从 buf[pos:] 解码一个 varint，返回 (值, 新位置)"""
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = b & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def encode_str(s, out):
+    """UTF-8 字符串：varint 长度 + 字节"""
+    data = s.encode("utf-8")
+    encode_varint(len(data), out)
+    out += data
+
+def decode_str(buf, pos):
+    n, pos = decode_varint(buf, pos)
+    return bytes(buf[pos:pos + n]).decode("utf-8"), pos + n
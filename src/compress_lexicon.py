@@ -3,7 +3,7 @@ import math
 import pathlib
 from typing import List, Tuple
 
-from utils import INDEX_DIR, RESULTS_DIR
+from utils import INDEX_DIR, RESULTS_DIR, load_docids
 
 
 def load_terms() -> List[str]:
@@ -73,6 +73,50 @@ def size_of(path: pathlib.Path) -> int:
     return path.stat().st_size if path.exists() else 0
 
 
+def postings_bin_size(postings_json: pathlib.Path):
+    """(postings.bin, positions.bin) 的大小；若只建了 JSON 倒排，则临时编码一份以统计压缩效果"""
+    from postings_bin import write_postings_bin, positions_path
+    bin_path = INDEX_DIR / "postings.bin"
+    if bin_path.exists():
+        return size_of(bin_path), size_of(positions_path(bin_path))
+    if not postings_json.exists():
+        return 0, 0
+    import tempfile
+    with open(postings_json, "r", encoding="utf-8") as f:
+        postings = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = pathlib.Path(tmp) / "postings.bin"
+        write_postings_bin(tmp_path, postings.items(), len(load_docids()))
+        return size_of(tmp_path), size_of(positions_path(tmp_path))
+
+
+def postings_json_size(postings_json: pathlib.Path):
+    """原始倒排表 postings.json（indent=2）的大小；全量构建默认只写 postings.bin，此时由它临时还原一份以统计压缩效果。
+    返回 (字节数, 是否为临时还原的估计值)"""
+    if postings_json.exists():
+        return size_of(postings_json), False
+    bin_path = INDEX_DIR / "postings.bin"
+    if not bin_path.exists():
+        return 0, False
+    import tempfile
+    from postings_bin import BinaryPostings
+    from utils import save_json_items
+    with tempfile.TemporaryDirectory() as tmp, BinaryPostings(bin_path, cache_size=0) as bp:
+        tmp_path = pathlib.Path(tmp) / "postings.json"
+        save_json_items(tmp_path, ((term, bp.get_full(term)) for term in bp.keys()), pretty=True)
+        return size_of(tmp_path), True
+
+
+def write_postings_lexicon(block_size: int):
+    """检索端实际使用的词典 lexicon.bin：由 postings.bin 的目录按块大小 block_size 重写（前端编码 + 块头表）；
+    没有二进制倒排时返回 None"""
+    from postings_bin import rebuild_lexicon
+    bin_path = INDEX_DIR / "postings.bin"
+    if not bin_path.exists():
+        return None
+    return rebuild_lexicon(bin_path, block_size)
+
+
 def main(block_size: int = 8):
     terms = load_terms()
     blocks = make_blocks(terms, block_size)
@@ -85,6 +129,7 @@ def main(block_size: int = 8):
     # 生成两种压缩形式
     write_block_storage(blocks, block_dict, block_idx)
     write_front_coding(blocks, front_dict)
+    lexicon_bin = write_postings_lexicon(block_size)
 
     # 统计大小并保存对比
     original = INDEX_DIR / "lexicon.json"
@@ -96,6 +141,8 @@ def main(block_size: int = 8):
     }
     sizes["block_total"] = sizes["lexicon.block.dict"] + sizes["lexicon.block.idx"]
     sizes["front_total"] = sizes["lexicon.front.dict"]
+    # lexicon.bin 另含每个词的 df 与倒排/位置偏移，是检索端唯一的词典
+    sizes["lexicon.bin"] = size_of(lexicon_bin) if lexicon_bin else 0
     sizes["block_saving_bytes"] = max(0, sizes["original_lexicon.json"] - sizes["block_total"])
     sizes["front_saving_bytes"] = max(0, sizes["original_lexicon.json"] - sizes["front_total"])
     def pct(saved, base):
@@ -105,7 +152,7 @@ def main(block_size: int = 8):
 
     # 计算“整个索引”（词典 + 原始倒排表）的总体节省
     postings_path = INDEX_DIR / "postings.json"
-    postings_size = size_of(postings_path)
+    postings_size, estimated = postings_json_size(postings_path)
     sizes["original_index_total_bytes"] = sizes["original_lexicon.json"] + postings_size
     sizes["block_index_total_bytes"] = sizes["block_total"] + postings_size
     sizes["front_index_total_bytes"] = sizes["front_total"] + postings_size
@@ -116,6 +163,18 @@ def main(block_size: int = 8):
     sizes["block_index_saving_pct"] = round(pct_total(sizes["block_index_saving_bytes"], sizes["original_index_total_bytes"]), 3)
     sizes["front_index_saving_pct"] = round(pct_total(sizes["front_index_saving_bytes"], sizes["original_index_total_bytes"]), 3)
 
+    # 倒排表压缩：postings.json vs postings.bin（docID d-gap + varint）+ positions.bin（位置差分 + varint）
+    sizes["postings.json"] = postings_size
+    sizes["postings.json_estimated"] = estimated
+    sizes["postings.bin"], sizes["positions.bin"] = postings_bin_size(postings_path)
+    bin_total = sizes["postings.bin"] + sizes["positions.bin"]
+    sizes["postings_saving_bytes"] = max(0, postings_size - bin_total) if postings_size else 0
+    sizes["postings_saving_pct"] = round(pct(sizes["postings_saving_bytes"], postings_size), 2)
+    # 词典（前端编码）与倒排同时压缩后的整体索引
+    sizes["compressed_index_total_bytes"] = sizes["front_total"] + bin_total
+    sizes["compressed_index_saving_bytes"] = max(0, sizes["original_index_total_bytes"] - sizes["compressed_index_total_bytes"])
+    sizes["compressed_index_saving_pct"] = round(pct_total(sizes["compressed_index_saving_bytes"], sizes["original_index_total_bytes"]), 3)
+
     RESULTS_DIR.mkdir(parents=True, exist_ok=True)
     with open(RESULTS_DIR / "dict_compression_sizes.json", "w", encoding="utf-8") as f:
         json.dump(sizes, f, ensure_ascii=False, indent=2)
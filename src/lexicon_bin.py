@@ -0,0 +1,171 @@
+# 压缩词典（index_json/lexicon.bin）：前端编码 + 分块，mmap 后直接二分查找，term -> (df, 倒排偏移, 字节长度, 位置区偏移)
+# 写 postings.bin 时一并生成（compress_lexicon.py 可按指定块大小重写），检索端以它作为唯一的词典：
+# 载入只映射文件、读取定长尾部，不建任何 term 表；查找先在块头表上二分（O(log(V/k)) 次取块首词），
+# 再在块内顺序解码至多 k 个词，常驻内存与词项数无关。
+#
+# 文件布局：
+#   MAGIC
+#   块区：按 term（UTF-8 字节序）排序，每块 k 个词项；块首词完整保存 [varint(字节数), 字节]，
+#         其余词为 [varint(与前一词的公共前缀字节数), varint(后缀字节数), 后缀]；
+#         每个词后跟 varint(df) varint(倒排偏移) varint(字节长度) varint(位置区偏移)
+#   块头表：每块一个 <Q> 块起始偏移（定长，可按下标直接读取）
+#   尾部：<QQQQQ>(词项数 V, 块大小 k, 块头表偏移, 对应 postings.bin 的大小, 其目录偏移) + MAGIC
+# 尾部记录的 postings.bin 大小与目录偏移用于识别过期的词典：与当前 postings.bin 不符时读取器拒绝载入。
+import mmap, os, struct
+from codec import encode_varint, decode_varint
+
+MAGIC = b"IRLX1\n"
+LEXICON_FILE = "lexicon.bin"
+LEXICON_BLOCK = 8
+_TRAILER = struct.Struct("<QQQQQ")
+_OFFSET = struct.Struct("<Q")
+
+def lexicon_path(path):
+    # 与 postings.bin 同目录的词典文件
+    return path.with_name(LEXICON_FILE)
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def write_lexicon_bin(path, entries, postings_size, dir_off, block_k=LEXICON_BLOCK):
+    """entries：[(term, df, 偏移, 字节长度, 位置区偏移)]（任意顺序）；postings_size/dir_off 为对应 postings.bin 的大小与目录偏移。
+    返回块数。
+    """
+    block_k = max(1, block_k)
+    rows = sorted((term.encode("utf-8"), df, off, n, p_off) for term, df, off, n, p_off in entries)
+    out = bytearray(MAGIC)
+    starts = []
+    prev = b""
+    for i, (term, df, off, n, p_off) in enumerate(rows):
+        if i % block_k == 0:
+            starts.append(len(out))
+            encode_varint(len(term), out)
+            out += term
+        else:
+            cpl = _common_prefix(prev, term)
+            encode_varint(cpl, out)
+            encode_varint(len(term) - cpl, out)
+            out += term[cpl:]
+        for v in (df, off, n, p_off):
+            encode_varint(v, out)
+        prev = term
+    table_off = len(out)
+    for s in starts:
+        out += _OFFSET.pack(s)
+    out += _TRAILER.pack(len(rows), block_k, table_off, postings_size, dir_off)
+    out += MAGIC
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(out)
+    os.replace(tmp, path)
+    return len(starts)
+
+class LexiconBin:
+    """lexicon.bin 的只读视图，接口与 dict 相同（get / in / len / 迭代 / keys / items），
+    值为 (df, 偏移, 字节长度, 位置区偏移)。给出 postings_size/dir_off 时校验词典与 postings.bin 是否对应。
+    """
+    def __init__(self, path, postings_size=None, dir_off=None):
+        self._fh = open(path, "rb")
+        try:
+            self.buf = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            self._fh.close()
+            raise
+        buf = self.buf
+        end = len(buf) - len(MAGIC)
+        if end < len(MAGIC) + _TRAILER.size or buf[:len(MAGIC)] != MAGIC or buf[end:] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a lexicon file")
+        self.n_terms, self.block_k, self.table_off, size, d_off = _TRAILER.unpack_from(buf, end - _TRAILER.size)
+        if postings_size is not None and (size, d_off) != (postings_size, dir_off):
+            self.close()
+            raise ValueError(f"{path} does not match the postings file")
+        self.n_blocks = (self.n_terms + self.block_k - 1) // self.block_k
+
+    def close(self):
+        self.buf.close()
+        self._fh.close()
+
+    def _block_start(self, i):
+        return _OFFSET.unpack_from(self.buf, self.table_off + i * _OFFSET.size)[0]
+
+    def _first_term(self, i):
+        buf = self.buf
+        n, pos = decode_varint(buf, self._block_start(i))
+        return buf[pos:pos + n]
+
+    def _scan(self, i):
+        """顺序解码第 i 块，逐个产出 (term 字节, (df, 偏移, 字节长度, 位置区偏移))"""
+        buf = self.buf
+        pos = self._block_start(i)
+        n, pos = decode_varint(buf, pos)
+        term = buf[pos:pos + n]
+        pos += n
+        for j in range(min(self.block_k, self.n_terms - i * self.block_k)):
+            if j:
+                cpl, pos = decode_varint(buf, pos)
+                n, pos = decode_varint(buf, pos)
+                term = term[:cpl] + buf[pos:pos + n]
+                pos += n
+            df, pos = decode_varint(buf, pos)
+            off, pos = decode_varint(buf, pos)
+            size, pos = decode_varint(buf, pos)
+            p_off, pos = decode_varint(buf, pos)
+            yield term, (df, off, size, p_off)
+
+    def _block_of(self, key):
+        # 二分找最后一个块首词 <= key 的块；key 小于所有词时为 -1
+        lo, hi = 0, self.n_blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_term(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def get(self, term, default=None):
+        key = term.encode("utf-8")
+        i = self._block_of(key)
+        if i < 0:
+            return default
+        for t, entry in self._scan(i):
+            if t == key:
+                return entry
+            if t > key:
+                break
+        return default
+
+    def with_prefix(self, prefix):
+        """按字典序产出以 prefix 开头的 (term, 值)：定位到前缀所在的块后顺序扫描，遇到第一个不以它开头的词即停"""
+        key = prefix.encode("utf-8")
+        for i in range(max(self._block_of(key), 0), self.n_blocks):
+            for t, entry in self._scan(i):
+                if t < key:
+                    continue
+                if not t.startswith(key):
+                    return
+                yield t.decode("utf-8"), entry
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __len__(self):
+        return self.n_terms
+
+    def items(self):
+        for i in range(self.n_blocks):
+            for t, entry in self._scan(i):
+                yield t.decode("utf-8"), entry
+
+    def keys(self):
+        for term, _ in self.items():
+            yield term
+
+    def __iter__(self):
+        return self.keys()
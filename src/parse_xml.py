@@ -1,52 +1,140 @@
-import pathlib, re, html, hashlib, xml.etree.ElementTree as ET
-from utils import write_jsonl, DATA_STAGE
+import pathlib, re, html, hashlib, json, os, time, xml.etree.ElementTree as ET
+from utils import write_jsonl, save_json, DATA_STAGE
 
 RAW_DIR = pathlib.Path(__file__).resolve().parents[1] / "data_raw"
+MANIFEST = DATA_STAGE / "manifest.json"  # 已处理 XML 文件清单（增量解析用）
+
+# 各字段的候选路径（按优先级）：直系子元素 "x"、下钻 ".//x"、下钻父子 ".//a/x"
+FIELD_PATHS = {
+    "doc_id": ["id", ".//id", ".//event/id", ".//group/id"],
+    "title": ["title", "name", ".//name", ".//event/name"],  # 许多数据用 <name> 作为标题
+    "description": ["description", ".//description"],  # Event 类文件关键字段
+    "group": ["group", ".//group/name", ".//group/who"],  # who/name 二选一
+    "group_urlname": [".//group/urlname"],
+    "venue_name": [".//venue/name"],
+    "venue_addr": [".//venue/address_1"],
+    "venue_city": [".//venue/city"],
+    "venue_state": [".//venue/state"],
+    "venue_country": [".//venue/country"],
+    "venue_lat": [".//venue/lat"],
+    "venue_lon": [".//venue/lon"],
+    "time": ["time", ".//time"],
+    "created": ["created", ".//created"],
+    "updated": ["updated", ".//updated"],
+    "status": ["status", ".//status"],
+    "yes_rsvp_count": ["yes_rsvp_count", ".//yes_rsvp_count"],
+    "maybe_rsvp_count": ["maybe_rsvp_count", ".//maybe_rsvp_count"],
+    "waitlist_count": ["waitlist_count", ".//waitlist_count"],
+    "headcount": ["headcount", ".//headcount"],
+    "event_url": ["event_url", ".//event_url"],
+}
+HOSTS_PATH = ".//event_hosts_item/member_name"  # 可能有多个 host
+
+def _compile_paths(paths):
+    # 把路径按形态拆成三张分派表：tag -> path / 父 tag -> {tag -> path}
+    child, desc, pair = {}, {}, {}
+    for p in paths:
+        if not p.startswith(".//"):
+            child[p] = p
+        elif "/" in p[3:]:
+            a, b = p[3:].split("/")
+            pair.setdefault(a, {})[b] = p
+        else:
+            desc[p[3:]] = p
+    return child, desc, pair
+
+_CHILD_PATHS, _DESC_PATHS, _PAIR_PATHS = _compile_paths(
+    [p for ps in FIELD_PATHS.values() for p in ps] + [HOSTS_PATH])
+
+def scan_paths(elem):
+    """单遍扫描 elem 子树，返回 (path -> 首个匹配元素的 text, hosts 列表)。
+    与 findtext 的语义一致：".//x" 取先序第一个；".//a/x" 取先序最靠前的 a 下的第一个 x；
+    只记录首个匹配（即便其文本为空），由 ftext 按优先级回退。
+    """
+    found = {}
+    hosts = []
+    for child in elem:
+        p = _CHILD_PATHS.get(child.tag)
+        if p is not None and p not in found:
+            found[p] = child.text or ""
+    desc_paths, pair_paths = _DESC_PATHS, _PAIR_PATHS
+    nodes = elem.iter()
+    next(nodes)  # 跳过 elem 自身（".//" 不含自身）
+    for node in nodes:
+        tag = node.tag
+        p = desc_paths.get(tag)
+        if p is not None and p not in found:
+            found[p] = node.text or ""
+        sub = pair_paths.get(tag)
+        if sub is None:
+            continue
+        # 只有 venue/group/event/event_hosts_item 等父节点才需要看子元素
+        for child in node:
+            p = sub.get(child.tag)
+            if p is None:
+                continue
+            if p == HOSTS_PATH:
+                hosts.append(child.text or "")
+            elif p not in found:
+                found[p] = child.text or ""
+    return found, hosts
 
 def extract_event(elem):
-    # 便捷读取：尝试多个 XPath（直系与下钻）
+    # 单遍扫描收集所有候选路径，再按 FIELD_PATHS 的优先级回退取值
+    found, hosts = scan_paths(elem)
+    def ftext(paths):
+        for p in paths:
+            t = found.get(p)
+            if t and t.strip():
+                return t.strip()
+        return ""
+    return _build_doc(elem, ftext, [h.strip() for h in hosts if h.strip()])
+
+def extract_event_xpath(elem):
+    # 原始实现：每个字段逐一 findtext（多次下钻重扫子树），保留用于对照与基准测试
     def ftext(paths):
         for p in paths:
             t = elem.findtext(p)
             if t and t.strip():
                 return t.strip()
         return ""
+    host_names = [
+        (x.text or "").strip()
+        for x in elem.findall(HOSTS_PATH)
+        if x is not None and (x.text or "").strip()
+    ]
+    return _build_doc(elem, ftext, host_names)
 
+def _build_doc(elem, ftext, host_names):
+    F = FIELD_PATHS
     # 常见字段：更丰富的标签与下钻（Event 必含 Description）
-    doc_id = elem.attrib.get("id") or ftext(["id", ".//id", ".//event/id", ".//group/id"]) or ""
-    title = ftext(["title", "name", ".//name", ".//event/name"])  # 许多数据用 <name> 作为标题
-    description_raw = ftext(["description", ".//description"])  # Event 类文件关键字段
+    doc_id = elem.attrib.get("id") or ftext(F["doc_id"]) or ""
+    title = ftext(F["title"])
+    description_raw = ftext(F["description"])
 
     # Group 信息下钻
-    group_name = ftext(["group", ".//group/name", ".//group/who"])  # who/name 二选一
-    group_urlname = ftext([".//group/urlname"]) or ""
+    group_name = ftext(F["group"])
+    group_urlname = ftext(F["group_urlname"]) or ""
 
     # Venue 信息下钻
-    venue_name = ftext([".//venue/name"]) or ""
-    venue_addr = ftext([".//venue/address_1"]) or ""
-    venue_city = ftext([".//venue/city"]) or ""
-    venue_state = ftext([".//venue/state"]) or ""
-    venue_country = ftext([".//venue/country"]) or ""
-    venue_lat = ftext([".//venue/lat"]) or ""
-    venue_lon = ftext([".//venue/lon"]) or ""
-
-    # Hosts 下钻（可能有多个 host）
-    host_names = [
-        (x.text or "").strip()
-        for x in elem.findall(".//event_hosts_item/member_name")
-        if x is not None and (x.text or "").strip()
-    ]
+    venue_name = ftext(F["venue_name"]) or ""
+    venue_addr = ftext(F["venue_addr"]) or ""
+    venue_city = ftext(F["venue_city"]) or ""
+    venue_state = ftext(F["venue_state"]) or ""
+    venue_country = ftext(F["venue_country"]) or ""
+    venue_lat = ftext(F["venue_lat"]) or ""
+    venue_lon = ftext(F["venue_lon"]) or ""
 
     # 其他常用元数据
-    time_val = ftext(["time", ".//time"]) or ""
-    created = ftext(["created", ".//created"]) or ""
-    updated = ftext(["updated", ".//updated"]) or ""
-    status = ftext(["status", ".//status"]) or ""
-    yes_rsvp = ftext(["yes_rsvp_count", ".//yes_rsvp_count"]) or ""
-    maybe_rsvp = ftext(["maybe_rsvp_count", ".//maybe_rsvp_count"]) or ""
-    waitlist = ftext(["waitlist_count", ".//waitlist_count"]) or ""
-    headcount = ftext(["headcount", ".//headcount"]) or ""
-    event_url = ftext(["event_url", ".//event_url"]) or ""
+    time_val = ftext(F["time"]) or ""
+    created = ftext(F["created"]) or ""
+    updated = ftext(F["updated"]) or ""
+    status = ftext(F["status"]) or ""
+    yes_rsvp = ftext(F["yes_rsvp_count"]) or ""
+    maybe_rsvp = ftext(F["maybe_rsvp_count"]) or ""
+    waitlist = ftext(F["waitlist_count"]) or ""
+    headcount = ftext(F["headcount"]) or ""
+    event_url = ftext(F["event_url"]) or ""
 
     # HTML 清洗与实体反转义（只用于 text 聚合，不覆盖原 description_raw）
     desc_clean = description_raw
@@ -98,28 +186,235 @@ def extract_event(elem):
     }
     return doc
 
-def main():
-    docs = []
-    for xml_path in RAW_DIR.rglob("*.xml"):
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        # 兼容 <events><event/></events> 或直接 <event/>（或 <item/>）
-        if root.tag.lower() == "events":
-            events = root.findall(".//event")
+def finalize_doc(d):
+    """补全 doc_id（缺失时基于 title/time/group 生成稳定 md5 前缀）；无可检索文本则返回 None"""
+    if not d.get("doc_id"):
+        # 基于 title/time/group 生成稳定 doc_id（避免冲突）
+        key = (d.get("title", "") + "|" + d.get("time", "") + "|" + d.get("group", "")).encode("utf-8", errors="ignore")
+        d["doc_id"] = hashlib.md5(key).hexdigest()[:12]
+    return d if d["text"] else None
+
+def iter_events_tree(xml_path):
+    """整树解析：一次性 ET.parse 整个文件（原始实现）"""
+    tree = ET.parse(xml_path)
+    root = tree.getroot()
+    # 兼容 <events><event/></events> 或直接 <event/>（或 <item/>）
+    if root.tag.lower() == "events":
+        events = root.findall(".//event")
+    else:
+        events = [root]
+    for e in events:
+        yield e
+
+def iter_events_stream(xml_path):
+    """流式解析：基于 iterparse，每个最外层 <event> 闭合即产出，随后清理已处理子树。
+    产出顺序与 iter_events_tree 一致（文档先序），峰值内存与文件大小无关。
+    非 <events> 根（单个 <event>/<item> 文件）本身就是一个文档，只能读完整棵树后产出。
+    """
+    stack = []        # 当前打开的元素链（用于从父节点摘除已处理子树）
+    event_depth = 0   # 当前位于几层 <event> 之内
+    streaming = None  # 根为 <events> 时才逐条产出
+    for ev, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if ev == "start":
+            if streaming is None:
+                streaming = elem.tag.lower() == "events"
+            stack.append(elem)
+            if elem.tag == "event" and len(stack) > 1:
+                event_depth += 1
+            continue
+        stack.pop()
+        if not streaming:
+            if not stack:
+                yield elem
+            continue
+        if elem.tag == "event" and stack:
+            event_depth -= 1
+            if event_depth == 0:
+                # 最外层 event：连同其内部嵌套 event 一起按先序产出（等价于 findall(".//event")）
+                for e in elem.iter("event"):
+                    yield e
+        if event_depth == 0 and stack:
+            # 不在任何 event 内部：该子树已无用，清空并从父节点摘除
+            elem.clear()
+            stack[-1].remove(elem)
+
+def iter_docs(xml_paths, stream=True):
+    """依次解析多个 XML 文件，产出可写入 events.jsonl 的文档"""
+    iter_events = iter_events_stream if stream else iter_events_tree
+    for xml_path in xml_paths:
+        for e in iter_events(xml_path):
+            d = finalize_doc(extract_event(e))
+            if d is not None:
+                yield d
+
+def list_xml_files():
+    # 按路径排序，保证多次运行（及并行合并）的文档顺序一致
+    return sorted(RAW_DIR.rglob("*.xml"))
+
+def parse_file_lines(xml_path, stream=True):
+    """进程池任务：解析单个文件，返回 (已序列化的 JSONL 文本, 统计信息)。
+    在子进程内完成 json.dumps，主进程只需按文件顺序拼接写出。
+    """
+    t0 = time.perf_counter()
+    docs = list(iter_docs([xml_path], stream=stream))
+    lines = [json.dumps(d, ensure_ascii=False) + "\n" for d in docs]
+    stats = {
+        "pid": os.getpid(),
+        "docs": len(lines),
+        "bytes": os.path.getsize(xml_path),
+        "seconds": time.perf_counter() - t0,
+        "doc_ids": [d["doc_id"] for d in docs],
+    }
+    return "".join(lines), stats
+
+def report_worker_stats(all_stats):
+    # 按 worker 进程汇总吞吐：docs/s 与 MB/s（按 worker 实际忙碌时间计）
+    per_worker = {}
+    for st in all_stats:
+        w = per_worker.setdefault(st["pid"], {"files": 0, "docs": 0, "bytes": 0, "seconds": 0.0})
+        w["files"] += 1
+        w["docs"] += st["docs"]
+        w["bytes"] += st["bytes"]
+        w["seconds"] += st["seconds"]
+    for i, (pid, w) in enumerate(sorted(per_worker.items())):
+        sec = w["seconds"] or 1e-9
+        print(f"  worker {i} (pid {pid}): {w['files']} files, {w['docs']} docs, "
+              f"{w['docs'] / sec:.1f} docs/s, {w['bytes'] / sec / 1e6:.2f} MB/s")
+
+def parse_parallel(xml_paths, out, workers, stream=True):
+    """多进程解析：各 worker 独立处理整文件，主进程按 xml_paths 顺序合并，输出与串行一致。
+    返回 {xml_path: [doc_id, ...]}
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    out.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    all_stats = []
+    file_doc_ids = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as ex, open(out, "w", encoding="utf-8") as f:
+        # map 按提交顺序返回结果 -> 确定性合并
+        for xml_path, (text, st) in zip(xml_paths, ex.map(partial(parse_file_lines, stream=stream), xml_paths)):
+            f.write(text)
+            n += st["docs"]
+            all_stats.append(st)
+            file_doc_ids[xml_path] = st["doc_ids"]
+    elapsed = time.perf_counter() - t0
+    total_bytes = sum(st["bytes"] for st in all_stats)
+    print(f"Parallel ingest: {len(xml_paths)} files, {workers} workers, {elapsed:.2f} s "
+          f"({n / (elapsed or 1e-9):.1f} docs/s, {total_bytes / (elapsed or 1e-9) / 1e6:.2f} MB/s)")
+    report_worker_stats(all_stats)
+    return file_doc_ids
+
+def parse_serial(xml_paths, out, stream=True):
+    """串行解析：逐文件流式写出，返回 {xml_path: [doc_id, ...]}"""
+    file_doc_ids = {}
+    def rows():
+        for xml_path in xml_paths:
+            ids = file_doc_ids.setdefault(xml_path, [])
+            for d in iter_docs([xml_path], stream=stream):
+                ids.append(d["doc_id"])
+                yield d
+    # write_jsonl 逐行写出，配合生成器即为增量写入
+    write_jsonl(out, rows())
+    return file_doc_ids
+
+def ingest(xml_paths, out, workers=1, stream=True):
+    if workers > 1:
+        return parse_parallel(xml_paths, out, workers, stream=stream)
+    return parse_serial(xml_paths, out, stream=stream)
+
+# ---------------- 增量解析：文件清单（manifest） ----------------
+
+def file_md5(path, chunk=1 << 20):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def manifest_key(xml_path):
+    return pathlib.Path(xml_path).relative_to(RAW_DIR).as_posix()
+
+def manifest_entry(xml_path, doc_ids, md5=None):
+    st = os.stat(xml_path)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "md5": md5 or file_md5(xml_path),
+        "doc_ids": doc_ids,
+    }
+
+def load_manifest():
+    if not MANIFEST.exists():
+        return {}
+    with open(MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def diff_manifest(manifest, xml_paths):
+    """对比清单与当前文件：返回 (新增/变更的文件, 已删除的清单键, 未变更的清单)。
+    size+mtime 相同视为未变更；否则再比对内容 md5（仅 touch 过的文件不会重新解析）。
+    """
+    changed, kept = [], {}
+    for xml_path in xml_paths:
+        key = manifest_key(xml_path)
+        old = manifest.get(key)
+        if old is None:
+            changed.append(xml_path)
+            continue
+        st = os.stat(xml_path)
+        if st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]:
+            kept[key] = old
+            continue
+        md5 = file_md5(xml_path)
+        if md5 == old["md5"]:
+            kept[key] = manifest_entry(xml_path, old["doc_ids"], md5)
         else:
-            events = [root]
-        for e in events:
-            d = extract_event(e)
-            if not d.get("doc_id"):
-                # 基于 title/time/group 生成稳定 doc_id（避免冲突）
-                key = (d.get("title", "") + "|" + d.get("time", "") + "|" + d.get("group", "")).encode("utf-8", errors="ignore")
-                d["doc_id"] = hashlib.md5(key).hexdigest()[:12]
-            if d["text"]:
-                docs.append(d)
-    out = DATA_STAGE / "events.jsonl"
-    write_jsonl(out, docs)
-    print(f"Parsed {len(docs)} docs -> {out}")
+            changed.append(xml_path)
+    current = {manifest_key(p) for p in xml_paths}
+    removed = sorted(k for k in manifest if k not in current)
+    return changed, removed, kept
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Parse Meetup XML into events.jsonl")
+    ap.add_argument("--no-stream", dest="stream", action="store_false",
+                    help="use whole-tree ET.parse instead of streaming iterparse")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="number of worker processes (1 = serial)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="parse only new/changed files (per manifest) into events.delta.jsonl + events.delta.deletes.json")
+    args = ap.parse_args()
+
+    xml_paths = list_xml_files()
+    if not args.incremental:
+        out = DATA_STAGE / "events.jsonl"
+        file_doc_ids = ingest(xml_paths, out, args.workers, args.stream)
+        save_json(MANIFEST, {manifest_key(p): manifest_entry(p, ids) for p, ids in file_doc_ids.items()})
+        print(f"Parsed {sum(len(v) for v in file_doc_ids.values())} docs -> {out}")
+        return
+
+    manifest = load_manifest()
+    changed, removed, kept = diff_manifest(manifest, xml_paths)
+    out = DATA_STAGE / "events.delta.jsonl"
+    file_doc_ids = ingest(changed, out, args.workers, args.stream)
+    new_manifest = dict(kept)
+    for p, ids in file_doc_ids.items():
+        new_manifest[manifest_key(p)] = manifest_entry(p, ids)
+    # 删除 = 旧清单中变更/删除文件的 doc_id，且不再出现在任何现存文件中；
+    # 变更文件里仍存在的 doc_id 由建索引阶段按“先删后加”（upsert）处理
+    old_ids = set()
+    for key in removed + [manifest_key(p) for p in changed]:
+        old_ids.update(manifest.get(key, {}).get("doc_ids", []))
+    live_ids = set()
+    for entry in new_manifest.values():
+        live_ids.update(entry["doc_ids"])
+    deletes = sorted(old_ids - live_ids)
+    save_json(DATA_STAGE / "events.delta.deletes.json", deletes)
+    save_json(MANIFEST, dict(sorted(new_manifest.items())))
+    n = sum(len(v) for v in file_doc_ids.values())
+    print(f"Incremental: {len(changed)} new/changed files, {len(removed)} removed files, "
+          f"{n} docs -> {out}, {len(deletes)} deletions")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,98 @@
+# 单进程流式构建：XML 元素 -> extract_event -> simple_tokenize -> 倒排累积 -> 索引文件。
+# 各阶段以生成器串联，不再经由 events.jsonl / events.tokens.jsonl 落盘再读回；
+# 中间文件仅在 --debug-stage 时顺带写出，便于排查。
+import argparse, json, time
+from utils import save_json, DATA_STAGE, INDEX_DIR
+from parse_xml import iter_docs, list_xml_files, manifest_entry, manifest_key, MANIFEST
+from tokens import simple_tokenize
+from analyzer import DEFAULT_STAGES, parse_stages, save_analyzer, Analyzer
+from build_index import accumulate, finalize, build_spimi, save_postings, biword_builder, save_biwords
+from segments import reset_segments
+
+class _Tee:
+    """可选的中间文件写出：逐行追加，不缓存整个语料"""
+    def __init__(self, path):
+        self.path = path
+        self.fh = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.fh = open(path, "w", encoding="utf-8")
+
+    def write(self, row):
+        if self.fh is not None:
+            self.fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+
+def iter_token_rows(xml_paths, file_doc_ids, stream=True, debug_stage=False, stages=DEFAULT_STAGES):
+    """逐文档产出 {"doc_id", "tokens"}；同时记录各文件的 doc_id（用于刷新 manifest）"""
+    docs_out = _Tee(DATA_STAGE / "events.jsonl" if debug_stage else None)
+    toks_out = _Tee(DATA_STAGE / "events.tokens.jsonl" if debug_stage else None)
+    try:
+        for xml_path in xml_paths:
+            ids = file_doc_ids.setdefault(xml_path, [])
+            for d in iter_docs([xml_path], stream=stream):
+                docs_out.write(d)
+                ids.append(d["doc_id"])
+                # 只保留建索引所需字段（title/text 已在 events.jsonl 中）
+                row = {"doc_id": d["doc_id"], "tokens": simple_tokenize(d["text"], stages)}
+                toks_out.write(row)
+                yield row
+    finally:
+        docs_out.close()
+        toks_out.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Fused in-process parse -> tokenize -> index pipeline")
+    ap.add_argument("--skip", dest="skip_strategy", default="sqrt",
+                    help="skip pointer strategy: none|sqrt|k:<int>|alpha:<float>")
+    ap.add_argument("--no-stream", dest="stream", action="store_false",
+                    help="use whole-tree ET.parse instead of streaming iterparse")
+    ap.add_argument("--debug-stage", action="store_true",
+                    help="also write data_stage/events.jsonl and events.tokens.jsonl, and index_json/postings.json "
+                         "next to postings.bin (same as --format both)")
+    ap.add_argument("--analyzer", default=",".join(DEFAULT_STAGES),
+                    help="comma-separated stages: lowercase,fold,stopwords,stem")
+    ap.add_argument("--format", dest="fmt", default=None, choices=["json", "bin", "both"],
+                    help="postings format: bin (gap/varint compressed postings.bin) | json (postings.json) | both "
+                         "(default: bin, or both with --debug-stage; search engines read postings.bin)")
+    ap.add_argument("--memory-mb", type=int, default=0,
+                    help="SPIMI mode: bounded-memory build with on-disk runs + k-way merge (0 = all in memory)")
+    ap.add_argument("--pretty", action="store_true",
+                    help="write postings.json with indent=2 (readable but several times larger/slower)")
+    ap.add_argument("--biwords", type=int, default=0,
+                    help="also index the N adjacent word pairs with the highest document frequency (biwords.bin)")
+    ap.add_argument("--biword-queries", default=None,
+                    help="also index every adjacent pair of the quoted phrases in this query log (e.g. queries/boolean.json)")
+    args = ap.parse_args()
+
+    # postings.json 只作阅读调试，与中间 JSONL 一样默认不写
+    args.fmt = args.fmt or ("both" if args.debug_stage else "bin")
+    t0 = time.perf_counter()
+    xml_paths = list_xml_files()
+    file_doc_ids = {}
+    stages = parse_stages(args.analyzer)
+    rows = iter_token_rows(xml_paths, file_doc_ids, args.stream, args.debug_stage, stages)
+    biwords = biword_builder(args.biwords, args.biword_queries, Analyzer(stages), args.memory_mb)
+    if biwords is not None:
+        rows = biwords.wrap(rows)
+    reset_segments(INDEX_DIR)  # 全量构建取代所有增量段与墓碑
+    if args.memory_mb > 0:
+        n_terms = build_spimi(rows, args.skip_strategy, args.memory_mb, pretty=args.pretty, fmt=args.fmt)
+    else:
+        postings = accumulate(rows)
+        lexicon, postings_out, doc_ids = finalize(postings, args.skip_strategy)
+        save_json(INDEX_DIR / "lexicon.json", lexicon)
+        save_postings(lambda: iter(postings_out.items()), doc_ids, args.fmt, args.pretty)
+        n_terms = len(lexicon)
+    save_biwords(biwords)
+    save_analyzer(Analyzer(stages), INDEX_DIR)
+    save_json(MANIFEST, {manifest_key(p): manifest_entry(p, ids) for p, ids in file_doc_ids.items()})
+    n = sum(len(v) for v in file_doc_ids.values())
+    print(f"Pipeline: {len(xml_paths)} files, {n} docs, {n_terms} terms -> {INDEX_DIR} "
+          f"({time.perf_counter() - t0:.2f} s)")
+
+if __name__ == "__main__":
+    main()
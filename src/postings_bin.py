@@ -0,0 +1,451 @@
+# 二进制倒排文件（postings.bin）：docID d-gap + varint，内嵌跳表；位置信息单独存放在 positions.bin
+# docID 为建索引时分配的稠密内部编号 0..N-1，与外部 id 的映射见 index_json/docids.json
+#
+# postings.bin 布局：
+#   MAGIC
+#   倒排区：按 term 顺序依次存放各词项的倒排列表
+#   词项目录：varint(V) + V 个 [term, varint(df), varint(偏移), varint(字节长度), varint(位置区偏移)]
+#   尾部：<QQ>(文档数 N, 目录偏移) + MAGIC
+#
+# 单个倒排列表：
+#   varint(df) varint(k)                      k = 跳表步长（0 表示无跳表）
+#   跳表：对 j = k, 2k, ... < df：varint(第 j 项 docID 与上一跳点之差) varint(第 j 项字节偏移与上一跳点之差)
+#         varint(第 j 项位置偏移与上一跳点之差)
+#   文档项：varint(docID 差) varint(tf) varint(该文档位置数据的字节数)
+# 跳表字节偏移相对于文档项起点，读取器可据此直接跳到第 j 项而无需解码前面的内容（SkipReader：--use-skip 求交时按块解码）。
+#
+# positions.bin 布局：POS_MAGIC + 按 term 顺序的位置区，每个词项内按文档顺序存 tf 个 varint(位置差)。
+# 词项的位置区偏移加上前面各文档的字节数即为 (term, doc) 的位置地址，解码倒排时记为项的 poff；
+# 布尔/VSM 查询只读 postings.bin，短语与 NEAR 才按 poff 读取 positions.bin。
+# 写出时同时生成压缩词典 lexicon.bin（见 lexicon_bin.py），读取器以它代替尾部目录；尾部目录保留，供重建词典与兜底。
+# 三个文件都先写到同目录的 .tmp 再 os.replace 换入：已打开（mmap）旧文件的读取器（如 server.py 的常驻索引）
+# 继续读旧内容，不会读到写了一半的文件。
+import bisect, mmap, os, shutil, struct, threading
+from collections import OrderedDict
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from lexicon_bin import LexiconBin, write_lexicon_bin, lexicon_path, LEXICON_BLOCK
+
+MAGIC = b"IRPB3\n"
+POS_MAGIC = b"IRPP1\n"
+POSITIONS_FILE = "positions.bin"
+_TRAILER = struct.Struct("<QQ")
+
+def positions_path(path):
+    # 与 postings.bin 同目录的位置文件
+    return path.with_name(POSITIONS_FILE)
+
+def skip_step(docs_list):
+    """从 add_skip_pointers 写入的 skip 字段还原步长（首项的 skip 即为 k）"""
+    if docs_list and "skip" in docs_list[0]:
+        return docs_list[0]["skip"]
+    return 0
+
+def encode_postings(docs_list, out, pos_out):
+    """把 [{"doc_id","tf","pos",("skip")}]（doc_id 为内部整数编号，升序）编码：文档项追加到 out，位置追加到 pos_out"""
+    df = len(docs_list)
+    k = skip_step(docs_list)
+    body = bytearray()
+    skips = []
+    prev = 0
+    pos_start = len(pos_out)
+    for i, d in enumerate(docs_list):
+        num = d["doc_id"]
+        if k and i and i % k == 0:
+            skips.append((num, len(body), len(pos_out) - pos_start))
+        encode_varint(num - prev, body)
+        prev = num
+        pos = d["pos"]
+        encode_varint(len(pos), body)
+        before = len(pos_out)
+        p0 = 0
+        for p in pos:
+            encode_varint(p - p0, pos_out)
+            p0 = p
+        encode_varint(len(pos_out) - before, body)
+    encode_varint(df, out)
+    encode_varint(k, out)
+    last_num = last_off = last_poff = 0
+    for num, off, poff in skips:
+        encode_varint(num - last_num, out)
+        encode_varint(off - last_off, out)
+        encode_varint(poff - last_poff, out)
+        last_num, last_off, last_poff = num, off, poff
+    out += body
+
+def decode_postings(buf, pos, pos_base=0):
+    """解码一个倒排列表为 [{"doc_id","tf","poff",("skip")}]；poff 为该项位置数据在 positions.bin 中的偏移
+    （pos_base 为该词项位置区的起点）。位置本身不解码，见 decode_positions。
+    """
+    df, pos = decode_varint(buf, pos)
+    k, pos = decode_varint(buf, pos)
+    n_skips = (df - 1) // k if k else 0
+    for _ in range(n_skips * 3):  # 顺序解码时不需要跳表，直接越过
+        _, pos = decode_varint(buf, pos)
+    out = []
+    num = 0
+    poff = pos_base
+    for i in range(df):
+        # 单字节 varint 占绝大多数，内联快路径，多字节时再调用 decode_varint
+        gap = buf[pos]
+        if gap < 0x80:
+            pos += 1
+        else:
+            gap, pos = decode_varint(buf, pos)
+        num += gap
+        tf = buf[pos]
+        if tf < 0x80:
+            pos += 1
+        else:
+            tf, pos = decode_varint(buf, pos)
+        size = buf[pos]
+        if size < 0x80:
+            pos += 1
+        else:
+            size, pos = decode_varint(buf, pos)
+        entry = {"doc_id": num, "tf": tf, "poff": poff}
+        poff += size
+        if k and i % k == 0 and i + k < df:
+            entry["skip"] = i + k
+        out.append(entry)
+    return out
+
+class SkipReader:
+    """按跳表分块读取一个倒排列表（直接在 postings.bin 的映射区上，不整体解码）：载入时只解码 df、步长与跳表，
+    文档项按块（跳点 j*k 起的 k 项）在需要时才解码。块 0 从文档项起点读；其余块从跳表记录的字节偏移读，
+    块首项的 docID 差值直接由跳点的 docID 取代，无需前面任何一项。
+    """
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.df, pos = decode_varint(buf, pos)
+        self.k, pos = decode_varint(buf, pos)
+        n_skips = (self.df - 1) // self.k if self.k else 0
+        self.starts = [0]  # 各块首项的 docID（块 0 记为 0，作二分的下界）
+        self.offsets = [0]  # 各块首项相对文档项起点的字节偏移
+        num = off = 0
+        for _ in range(n_skips):
+            gap, pos = decode_varint(buf, pos)
+            delta, pos = decode_varint(buf, pos)
+            _, pos = decode_varint(buf, pos)  # 位置偏移：只求交时用不到
+            num += gap
+            off += delta
+            self.starts.append(num)
+            self.offsets.append(off)
+        self.body = pos
+        self.blocks_read = 0
+
+    def block(self, b):
+        """第 b 块的 docID 列表"""
+        buf = self.buf
+        pos = self.body + self.offsets[b]
+        k = self.k or self.df
+        num = 0
+        out = []
+        for i in range(min(k, self.df - b * k)):
+            gap, pos = decode_varint(buf, pos)
+            num = self.starts[b] if i == 0 and b else num + gap
+            _, pos = decode_varint(buf, pos)  # tf
+            _, pos = decode_varint(buf, pos)  # 位置字节数
+            out.append(num)
+        self.blocks_read += 1
+        return out
+
+    def intersect(self, ids):
+        """升序编号 ids 与本列表的交集：每个编号先在块首 docID 上二分定位所在块，只解码被命中的块"""
+        out = []
+        b = -1
+        docs = ()
+        for d in ids:
+            nb = bisect.bisect_right(self.starts, d, max(b, 0)) - 1
+            if nb != b:
+                b = nb
+                docs = self.block(b)
+            i = bisect.bisect_left(docs, d)
+            if i < len(docs) and docs[i] == d:
+                out.append(d)
+        return out
+
+def decode_positions(buf, pos, tf):
+    """从 positions.bin 的 pos 处解码 tf 个位置（差分还原为绝对位置）"""
+    plist = []
+    p = 0
+    for _ in range(tf):
+        g = buf[pos]
+        if g < 0x80:
+            pos += 1
+        else:
+            g, pos = decode_varint(buf, pos)
+        p += g
+        plist.append(p)
+    return plist
+
+def entry_positions(postings, entry):
+    """倒排项的位置列表：JSON 倒排内联在 pos 中，二进制倒排（及多段视图）按 poff 从位置文件读取"""
+    pos = entry.get("pos")
+    return pos if pos is not None else postings.positions(entry)
+
+def write_postings_fragment(f, pf, items, base=0, pos_base=0):
+    """把有序 (term, docs_list) 流逐词编码，文档项写入 f、位置写入 pf，
+    返回目录 [(term, df, base + 偏移, 字节长度, pos_base + 位置区偏移)]"""
+    directory = []
+    off = base
+    poff = pos_base
+    for term, docs_list in items:
+        buf = bytearray()
+        pbuf = bytearray()
+        encode_postings(docs_list, buf, pbuf)
+        f.write(buf)
+        pf.write(pbuf)
+        directory.append((term, len(docs_list), off, len(buf), poff))
+        off += len(buf)
+        poff += len(pbuf)
+    return directory
+
+def _write_tail(f, directory, dir_off, n_docs):
+    tail = bytearray()
+    encode_varint(len(directory), tail)
+    for term, df, t_off, t_len, p_off in directory:
+        encode_str(term, tail)
+        encode_varint(df, tail)
+        encode_varint(t_off, tail)
+        encode_varint(t_len, tail)
+        encode_varint(p_off, tail)
+    f.write(tail)
+    f.write(_TRAILER.pack(n_docs, dir_off))
+    f.write(MAGIC)
+
+def _finish(f, path, directory, n_docs):
+    # 写尾部目录，再按最终的文件大小与目录偏移生成 lexicon.bin
+    dir_off = f.tell()
+    _write_tail(f, directory, dir_off, n_docs)
+    write_lexicon_bin(lexicon_path(path), directory, f.tell(), dir_off)
+
+def tmp_path(path):
+    return path.with_name(path.name + ".tmp")
+
+def _replace(path):
+    # 位置文件先于倒排换入，词典已在 _finish 中换入（与旧倒排不符时读取器退回尾部目录）
+    os.replace(tmp_path(positions_path(path)), positions_path(path))
+    os.replace(tmp_path(path), path)
+
+def write_postings_bin(path, items, n_docs):
+    """items: 有序 (term, docs_list) 流；n_docs: 文档总数 N。逐词写出 postings.bin 与同目录的 positions.bin、lexicon.bin，
+    返回词项数"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp_path(path), "wb") as f, open(tmp_path(positions_path(path)), "wb") as pf:
+        f.write(MAGIC)
+        pf.write(POS_MAGIC)
+        directory = write_postings_fragment(f, pf, items, len(MAGIC), len(POS_MAGIC))
+        _finish(f, path, directory, n_docs)
+    _replace(path)
+    return len(directory)
+
+def concat_postings_bin(path, fragments, n_docs):
+    """把各自独立编码的片段 [(倒排片段路径, 位置片段路径, 片段内目录)] 拼成 postings.bin 与 positions.bin，返回词项数"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    directory = []
+    with open(tmp_path(path), "wb") as f, open(tmp_path(positions_path(path)), "wb") as pf:
+        f.write(MAGIC)
+        pf.write(POS_MAGIC)
+        for frag_path, frag_pos_path, frag_dir in fragments:
+            base, pos_base = f.tell(), pf.tell()
+            with open(frag_path, "rb") as src:
+                shutil.copyfileobj(src, f)
+            with open(frag_pos_path, "rb") as src:
+                shutil.copyfileobj(src, pf)
+            directory.extend((term, df, base + off, n, pos_base + p_off) for term, df, off, n, p_off in frag_dir)
+        _finish(f, path, directory, n_docs)
+    _replace(path)
+    return len(directory)
+
+def read_directory(buf, dir_off, end):
+    """解析尾部词项目录 buf[dir_off:end]，返回 {term: (df, 偏移, 字节长度, 位置区偏移)}"""
+    dir_buf = buf[dir_off:end]  # 目录区整体拷出一次，避免逐字节访问 mmap
+    n_terms, pos = decode_varint(dir_buf, 0)
+    directory = {}
+    for _ in range(n_terms):
+        term, pos = decode_str(dir_buf, pos)
+        df, pos = decode_varint(dir_buf, pos)
+        t_off, pos = decode_varint(dir_buf, pos)
+        t_len, pos = decode_varint(dir_buf, pos)
+        p_off, pos = decode_varint(dir_buf, pos)
+        directory[term] = (df, t_off, t_len, p_off)
+    return directory
+
+def rebuild_lexicon(path, block_k=LEXICON_BLOCK):
+    """由 postings.bin 的尾部目录重写同目录的 lexicon.bin（块大小 block_k），返回词典路径"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        end = len(buf) - len(MAGIC)
+        if buf[:len(MAGIC)] != MAGIC or buf[end:] != MAGIC:
+            raise ValueError(f"{path} is not a binary postings file")
+        _, dir_off = _TRAILER.unpack_from(buf, end - _TRAILER.size)
+        directory = read_directory(buf, dir_off, end - _TRAILER.size)
+        size = len(buf)
+    out = lexicon_path(path)
+    write_lexicon_bin(out, [(t, *ent) for t, ent in directory.items()], size, dir_off, block_k)
+    return out
+
+class LRUCache:
+    """按词项缓存已解码的倒排列表，超出容量时淘汰最久未用的项（capacity=0 表示不缓存）。
+    读写都在锁内完成，多个线程可共用同一个读取器；缓存的列表本身只读，可在锁外使用。
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.data = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+
+    def info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.data), "capacity": self.capacity}
+
+DEFAULT_CACHE_SIZE = 1024
+
+class BinaryPostings:
+    """postings.bin 读取器：以 mmap 打开文件，词项目录（term -> (df, 偏移, 长度, 位置区偏移)）由同目录的
+    lexicon.bin 提供（同样 mmap，按块二分查找，不建 term 表）；词典缺失或与本文件不符时才解析尾部目录。
+    倒排列表在被访问时才从映射区切出对应字节解码，解码结果放入 LRU 缓存。
+    常驻内存与启动耗时取决于查询实际触及的词项，而不是整个索引的大小。
+    倒排项不含位置（只有指向 positions.bin 的 poff），positions.bin 在构造时打开、第一次调用 positions() 时才映射，
+    因此之后被换成新文件也不影响本读取器。
+    提供与 dict 相同的只读接口（get / [] / in / keys / values / items / len），可直接替换 json 加载的 postings。
+    所有读取都是映射区上的切片，不经过共享的文件位置；一个读取器可由多个线程同时查询。
+    """
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self._pos_fh = self.pos_buf = None
+        self._pos_lock = threading.Lock()
+        self.directory = None
+        self._fh = open(path, "rb")
+        self.buf = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self.buf
+        end = len(buf) - len(MAGIC)
+        if buf[:len(MAGIC)] != MAGIC or buf[end:] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a binary postings file")
+        self.n_docs, dir_off = _TRAILER.unpack_from(buf, end - _TRAILER.size)
+        try:
+            self.directory = LexiconBin(lexicon_path(path), len(buf), dir_off)
+        except (OSError, ValueError):
+            self.directory = read_directory(buf, dir_off, end - _TRAILER.size)
+        try:
+            self._pos_fh = open(positions_path(path), "rb")
+        except FileNotFoundError:  # 缺少位置文件时只在短语/NEAR 查询中报错
+            pass
+        self.cache = LRUCache(cache_size)
+
+    def close(self):
+        self.buf.close()
+        self._fh.close()
+        if isinstance(self.directory, LexiconBin):
+            self.directory.close()
+        if self.pos_buf is not None:
+            self.pos_buf.close()
+        if self._pos_fh is not None:
+            self._pos_fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def df(self, term):
+        ent = self.directory.get(term)
+        return ent[0] if ent else 0
+
+    def get(self, term, default=None):
+        plist = self.cache.get(term)
+        if plist is not None:
+            return plist
+        ent = self.directory.get(term)
+        if ent is None:
+            return default
+        _, off, n, p_off = ent
+        plist = decode_postings(self.buf[off:off + n], 0, p_off)
+        self.cache.put(term, plist)
+        return plist
+
+    def positions(self, entry):
+        """按倒排项的 poff/tf 从 positions.bin 解码位置列表"""
+        if self.pos_buf is None:
+            self._map_positions()
+        return decode_positions(self.pos_buf, entry["poff"], entry["tf"])
+
+    def _map_positions(self):
+        with self._pos_lock:  # 多个线程同时第一次读位置时只映射一次
+            if self.pos_buf is not None:
+                return
+            path = positions_path(self.path)
+            if self._pos_fh is None:
+                raise FileNotFoundError(path)
+            buf = mmap.mmap(self._pos_fh.fileno(), 0, access=mmap.ACCESS_READ)
+            if buf[:len(POS_MAGIC)] != POS_MAGIC:
+                buf.close()
+                raise ValueError(f"{path} is not a positions file")
+            self.pos_buf = buf
+
+    def get_full(self, term):
+        """带位置的倒排列表（与 postings.json 相同的结构），供重建/合并索引使用；不进缓存"""
+        out = []
+        for e in self.get(term, []):
+            full = {"doc_id": e["doc_id"], "tf": e["tf"], "pos": self.positions(e)}
+            if "skip" in e:
+                full["skip"] = e["skip"]
+            out.append(full)
+        return out
+
+    def skip_reader(self, term):
+        """词项倒排的 SkipReader（按跳表分块解码）；词项不存在或写入时没有跳表时为 None"""
+        ent = self.directory.get(term)
+        if ent is None:
+            return None
+        reader = SkipReader(self.buf, ent[1])
+        return reader if reader.k else None
+
+    def cache_info(self):
+        return self.cache.info()
+
+    def __getitem__(self, term):
+        plist = self.get(term)
+        if plist is None:
+            raise KeyError(term)
+        return plist
+
+    def __contains__(self, term):
+        return term in self.directory
+
+    def __len__(self):
+        return len(self.directory)
+
+    def __iter__(self):
+        return iter(self.directory)
+
+    def keys(self):
+        return self.directory.keys()
+
+    def values(self):
+        for term in self.directory:
+            yield self[term]
+
+    def items(self):
+        for term in self.directory:
+            yield term, self[term]
@@ -0,0 +1,230 @@
+# 布尔查询规划器：位于解析（search_boolean.eval_one）与求值之间
+#   逻辑改写：AND/OR 链展平为 n 元节点并去重；NOT 下推（NOT NOT x -> x，NOT (a OR b) -> NOT a AND NOT b）；
+#             OR 各分支提取公共合取项（(a AND b) OR (a AND c) -> a AND (b OR c)）；子节点按规范顺序排列，
+#             相同的子表达式在计划中是同一个算子，求值时只算一次
+#   代价估计：词项取 df，通配扩展取各词 df 之和，短语/NEAR 取各词 df 的最小值（短语的相邻词对有词对索引时也取其 df），
+#             AND 取最小、OR 取和、NOT 取补
+#   物理算子：scan / bitmap（高频词的压缩位图，见 bitmap.py）/ biword（已收录的两词短语，直接读词对倒排，见 biwords.py）/
+#             phrase（位置校验，已收录的相邻词对先缩小候选）/ intersect（按估计大小升序的 n 路交集，gallop 或 skip）/
+#             expand（通配扩展出的词项，各倒排流式多路归并）/ difference（有序差）/ union /
+#             complement（全集求补，仅当 AND 中没有肯定项时使用）/ empty
+#   子算子全部能以位图求值时，intersect/union/difference/complement 选 bitmap 方式，整棵子树在位图上做 AND/OR/ANDNOT
+#
+# 逻辑节点为元组：("TERM", t) ("PHRASE", (t1, t2, ..)) ("NEAR", k, ordered, a, b) ("EMPTY",)
+#                 ("EXPAND", pattern, (t1, t2, ..), truncated)（解析时已由 wildcard.expand 扩展，truncated 表示超过上限被截断）
+#                 ("NOT", x) ("AND", x1, x2, ..) ("OR", x1, x2, ..)
+# 物理算子同为元组，第二项为估计结果数：
+#   ("scan", est, term) ("bitmap", est, term) ("biword", est, terms) ("phrase", est, terms)
+#   ("near", est, k, ordered, a, b) ("expand", est, pattern, terms, truncated) ("empty", 0)
+#   ("intersect", est, method, children) ("union", est, method, children)
+#   ("difference", est, method, positive, negatives) ("complement", est, method, child)
+#   method：intersect 为 gallop | skip | bitmap，其余为 list | bitmap
+from collections import Counter
+
+EMPTY = ("EMPTY",)
+
+def term_df(postings, term):
+    # 二进制倒排/多段视图从目录读 df，不解码倒排；JSON 倒排直接取列表长度
+    if hasattr(postings, "df"):
+        return postings.df(term)
+    return len(postings.get(term, ()))
+
+def conjuncts(node):
+    return node[1:] if node[0] == "AND" else (node,)
+
+def normalize(node):
+    """把解析得到的二元语法树改写为规范的 n 元逻辑树"""
+    typ = node[0]
+    if typ == "NOT":
+        return negate(normalize(node[1]))
+    if typ in ("AND", "OR"):
+        return combine(typ, [normalize(c) for c in node[1:]])
+    return node
+
+def negate(node):
+    # NOT 下推只做有利的方向：NOT (a AND b) 保持原样，作为差运算的一个减数整体求值
+    if node[0] == "NOT":
+        return node[1]
+    if node[0] == "OR":
+        return combine("AND", [negate(c) for c in node[1:]])
+    return ("NOT", node)
+
+def combine(typ, children):
+    flat = []
+    for c in children:
+        flat.extend(c[1:] if c[0] == typ else (c,))
+    uniq = sorted(set(flat), key=repr)
+    if typ == "AND":
+        if EMPTY in uniq or any(("NOT", c) in flat for c in uniq):
+            return EMPTY
+    else:
+        uniq = factor_common([c for c in uniq if c != EMPTY])
+        if not uniq:
+            return EMPTY
+    if len(uniq) == 1:
+        return uniq[0]
+    return (typ, *uniq)
+
+def factor_common(children):
+    # 贪心提取公共合取项：每轮取出现在最多分支中的一项 x，把含 x 的分支合并为 x AND (各分支去掉 x 后的 OR)；
+    # 某个分支恰为 x 时按吸收律整组化为 x。每轮分支数至少减一
+    while True:
+        counts = Counter(x for c in children for x in conjuncts(c))
+        shared = [x for x, n in counts.items() if n >= 2]
+        if not shared:
+            return children
+        best = min(shared, key=lambda x: (-counts[x], repr(x)))
+        group = [c for c in children if best in conjuncts(c)]
+        rest = [c for c in children if best not in conjuncts(c)]
+        if any(len(conjuncts(c)) == 1 for c in group):
+            merged = best
+        else:
+            residual = [combine("AND", [x for x in conjuncts(c) if x != best]) for c in group]
+            merged = combine("AND", [best, combine("OR", residual)])
+        out = set(rest)
+        if merged[0] == "OR":
+            out.update(merged[1:])
+        elif merged != EMPTY:
+            out.add(merged)
+        children = sorted(out, key=repr)
+
+def is_bitmap(op):
+    return op[0] == "bitmap" or (op[0] in ("intersect", "union", "difference", "complement") and op[2] == "bitmap")
+
+def _method(children):
+    return "bitmap" if all(is_bitmap(c) for c in children) else "list"
+
+def plan(node, df, n_docs, use_skip=False, memo=None, bitmaps=(), biwords=None):
+    """为规范化的逻辑树选择物理算子。df(term) 给出文档频率（词典中不存在时为 0），n_docs 为存活文档数，
+    bitmaps 为有位图的词项集合，biwords 为词对索引（biwords.BiwordIndex，可为 None）。
+    memo 保证相同的逻辑子树对应同一个算子对象（公共子表达式只求值一次）。
+    """
+    memo = {} if memo is None else memo
+    op = memo.get(node)
+    if op is not None:
+        return op
+    typ = node[0]
+    if typ == "TERM":
+        d = df(node[1])
+        if not d:
+            op = ("empty", 0)
+        else:
+            op = ("bitmap" if node[1] in bitmaps else "scan", d, node[1])
+    elif typ == "PHRASE":
+        terms = node[1]
+        d = min(df(t) for t in terms)
+        pairs = [p for p in zip(terms, terms[1:]) if biwords is not None and p in biwords]
+        if pairs:
+            d = min(d, *(biwords.df(p) for p in pairs))
+        if not d:
+            op = ("empty", 0)
+        else:
+            op = ("biword" if len(terms) == 2 and pairs else "phrase", d, terms)
+    elif typ == "NEAR":
+        d = min(df(node[3]), df(node[4]))
+        op = ("near", d, *node[1:]) if d else ("empty", 0)
+    elif typ == "EXPAND":
+        terms = tuple(t for t in node[2] if df(t))
+        d = min(n_docs, sum(df(t) for t in terms))
+        op = ("expand", d, node[1], terms, node[3]) if d else ("empty", 0)
+    elif typ == "NOT":
+        child = plan(node[1], df, n_docs, use_skip, memo, bitmaps, biwords)
+        op = ("complement", max(n_docs - child[1], 0), _method([child]), child)
+    elif typ == "OR":
+        children = [plan(c, df, n_docs, use_skip, memo, bitmaps, biwords) for c in node[1:]]
+        children = [c for c in children if c[0] != "empty"]
+        if len(children) <= 1:
+            op = children[0] if children else ("empty", 0)
+        else:
+            op = ("union", min(n_docs, sum(c[1] for c in children)), _method(children), tuple(children))
+    elif typ == "AND":
+        negs = [c[1] for c in node[1:] if c[0] == "NOT"]
+        pos = [c for c in node[1:] if c[0] != "NOT"]
+        if not pos:
+            # 没有肯定项：a AND NOT b 的形式无从下手，只能对减数的并集求补
+            op = plan(("NOT", combine("OR", negs)), df, n_docs, use_skip, memo, bitmaps, biwords)
+        else:
+            pos_ops = sorted((plan(c, df, n_docs, use_skip, memo, bitmaps, biwords) for c in pos), key=lambda o: o[1])
+            if pos_ops[0][0] == "empty":
+                op = ("empty", 0)
+            else:
+                positive = pos_ops[0]
+                if len(pos_ops) > 1:
+                    method = "bitmap" if _method(pos_ops) == "bitmap" else "skip" if use_skip else "gallop"
+                    positive = ("intersect", pos_ops[0][1], method, tuple(pos_ops))
+                # 减数按估计大小降序：先减去最大的，后续差运算的输入最短
+                neg_ops = sorted((plan(c, df, n_docs, use_skip, memo, bitmaps, biwords) for c in negs), key=lambda o: -o[1])
+                neg_ops = [o for o in neg_ops if o[0] != "empty"]
+                if neg_ops:
+                    op = ("difference", positive[1], _method([positive, *neg_ops]), positive, tuple(neg_ops))
+                else:
+                    op = positive
+    else:
+        op = ("empty", 0)
+    memo[node] = op
+    return op
+
+def format_logical(node):
+    typ = node[0]
+    if typ == "TERM":
+        return node[1]
+    if typ == "PHRASE":
+        return '"' + " ".join(node[1]) + '"'
+    if typ == "NEAR":
+        return f"{node[3]} {'ONEAR' if node[2] else 'NEAR'}/{node[1]} {node[4]}"
+    if typ == "EXPAND":
+        return node[1]
+    if typ == "EMPTY":
+        return "<empty>"
+    if typ == "NOT":
+        return "NOT " + _wrap(node[1])
+    # 否定项排在肯定项之后，读起来即 X AND NOT Y
+    children = sorted(node[1:], key=lambda c: c[0] == "NOT")
+    return f" {typ} ".join(_wrap(c) for c in children)
+
+def _wrap(node):
+    s = format_logical(node)
+    return f"({s})" if node[0] in ("AND", "OR") else s
+
+def format_plan(op):
+    """把物理计划渲染为缩进的多行文本；被多处引用的算子第二次出现时只标注 reused"""
+    lines = []
+    seen = set()
+    def walk(o, depth, prefix=""):
+        pad = "  " * depth + prefix
+        kind, est = o[0], o[1]
+        if id(o) in seen and kind not in ("scan", "bitmap", "biword", "empty"):
+            lines.append(f"{pad}{kind} (est={est}, reused)")
+            return
+        seen.add(id(o))
+        if kind in ("scan", "bitmap"):
+            lines.append(f"{pad}{kind} {o[2]} (df={est})")
+        elif kind == "biword":
+            lines.append(f'{pad}biword "{" ".join(o[2])}" (df={est})')
+        elif kind == "phrase":
+            lines.append(f'{pad}phrase "{" ".join(o[2])}" (est={est})')
+        elif kind == "near":
+            lines.append(f"{pad}{'onear' if o[3] else 'near'}/{o[2]} {o[4]} {o[5]} (est={est})")
+        elif kind == "expand":
+            more = ", truncated" if o[4] else ""
+            lines.append(f"{pad}expand {o[2]} (terms={len(o[3])}{more}, est={est})")
+        elif kind == "empty":
+            lines.append(f"{pad}empty")
+        elif kind == "intersect":
+            lines.append(f"{pad}intersect[{o[2]}] (est={est})")
+            for c in o[3]:
+                walk(c, depth + 1)
+        elif kind == "difference":
+            lines.append(f"{pad}difference[{o[2]}] (est={est})")
+            walk(o[3], depth + 1)
+            for c in o[4]:
+                walk(c, depth + 1, "- ")
+        elif kind == "union":
+            lines.append(f"{pad}union[{o[2]}] (est={est})")
+            for c in o[3]:
+                walk(c, depth + 1)
+        elif kind == "complement":
+            lines.append(f"{pad}complement[{o[2]}] (est={est})")
+            walk(o[3], depth + 1)
+    walk(op, 0)
+    return "\n".join(lines)
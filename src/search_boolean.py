@@ -1,5 +1,12 @@
-import json, re, pathlib, time, sys, os, io, bisect
+import json, re, pathlib, time, sys, os, io, bisect, operator, heapq, itertools, mmap
 from utils import save_json, RESULTS_DIR
+from segments import open_index, live_ids, SegmentedPostings
+from postings_bin import DEFAULT_CACHE_SIZE, entry_positions
+from analyzer import Analyzer, load_analyzer
+from query_plan import EMPTY, normalize, plan, is_bitmap, term_df, format_logical, format_plan
+from bitmap import RoaringBitmap, load_bitmaps
+from biwords import load_biwords
+from wildcard import expand, load_kgrams, DEFAULT_MAX_EXPANSIONS
 INDEX_DIR = pathlib.Path(__file__).resolve().parents[1] / "index_json"
 QUERIES = pathlib.Path(__file__).resolve().parents[1] / "queries" / "boolean.json"
 
@@ -25,17 +32,35 @@ def _ensure_utf8_stdout():
 
 _ensure_utf8_stdout()
 
-# 词典查找器：用于比较压缩前后对检索效率的影响
+# 词典查找器：用于比较压缩前后对检索效率的影响（检索本身经倒排读取器的词典 lexicon.bin 定位词项，见 --dict bin）
+def _lines_at(buf, off):
+    """从 buf（mmap）的 off 处起逐行产出 (行首偏移, 行字节)，不依赖共享的文件位置"""
+    end = len(buf)
+    while off < end:
+        nl = buf.find(b"\n", off)
+        nxt = end if nl < 0 else nl + 1
+        yield off, buf[off:nxt]
+        off = nxt
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
 class LexiconLookup:
-    def __init__(self, mode: str = "raw"):
+    # 压缩词典以 mmap 只读映射，查找只做切片（无 seek/readline 的共享文件位置），同一实例可被多个线程同时使用
+    def __init__(self, mode: str = "raw", extra_terms=None):
         self.mode = (mode or "raw").lower()
+        # 增量段中的词不在 base 的（压缩）词典里，单独记一份
+        self.extra_terms = extra_terms or set()
         self.lex = None
         self.block_idx = None  # list of (first_term, offset)
+        self.block_keys = None  # 块首词列表（与 block_idx 同序），二分用
         self.block_k = 0
-        self.block_fh = None
+        self.block_buf = None
         self.front_idx = None  # list of (first_term, offset)
+        self.front_keys = None
         self.front_k = 0
-        self.front_fh = None
+        self.front_buf = None
         try:
             if self.mode == "raw":
                 # 使用原始 lexicon.json
@@ -46,7 +71,7 @@ class LexiconLookup:
                 dict_path = INDEX_DIR / "lexicon.block.dict"
                 if not (idx_path.exists() and dict_path.exists()):
                     raise FileNotFoundError("block dict not found")
-                self.block_fh = open(dict_path, "rb")
+                self.block_buf = _map(dict_path)
                 # 解析 idx：第一行 k=..，其余每行 offset\tterm
                 self.block_idx = []
                 with open(idx_path, "r", encoding="utf-8") as f:
@@ -61,28 +86,21 @@ class LexiconLookup:
                         self.block_idx.append((term, int(off_s)))
                 # 确保按 term 排序
                 self.block_idx.sort(key=lambda x: x[0])
+                self.block_keys = [k for k, _ in self.block_idx]
             elif self.mode == "front":
                 dict_path = INDEX_DIR / "lexicon.front.dict"
                 if not dict_path.exists():
                     raise FileNotFoundError("front dict not found")
-                self.front_fh = open(dict_path, "rb")
+                self.front_buf = _map(dict_path)
                 # 一遍扫描，记录每个块的首词和偏移
                 self.front_idx = []
-                fh = self.front_fh
-                fh.seek(0)
+                lines = _lines_at(self.front_buf, 0)
                 # 读取第一行 k=..
-                first_line = fh.readline()
-                try:
-                    header = first_line.decode("utf-8", errors="ignore").strip()
-                except Exception:
-                    header = ""
+                _, first_line = next(lines, (0, b""))
+                header = first_line.decode("utf-8", errors="ignore").strip()
                 m = re.match(r"k=(\d+)", header)
                 self.front_k = int(m.group(1)) if m else 0
-                while True:
-                    off = fh.tell()
-                    line = fh.readline()
-                    if not line:
-                        break
+                for off, line in lines:
                     s = line.decode("utf-8", errors="ignore").strip()
                     if not s:
                         continue
@@ -91,6 +109,7 @@ class LexiconLookup:
                         self.front_idx.append((first_term, off))
                 # front_idx 已是文件顺序，也可排序
                 self.front_idx.sort(key=lambda x: x[0])
+                self.front_keys = [k for k, _ in self.front_idx]
             else:
                 # 回退为 raw
                 with open(INDEX_DIR / "lexicon.json", "r", encoding="utf-8") as f:
@@ -110,22 +129,19 @@ class LexiconLookup:
         t = term or ""
         if not t:
             return False
+        if t in self.extra_terms:
+            return True
         if self.mode == "raw":
             return t in self.lex
         if self.mode == "block":
             # 二分定位块首词 <= t 的最大块
-            keys = [k for k, _ in self.block_idx]
-            i = bisect.bisect_right(keys, t) - 1
+            i = bisect.bisect_right(self.block_keys, t) - 1
             if i < 0:
                 return False
             first_term, off = self.block_idx[i]
             # 读取该块的 k 行
-            self.block_fh.seek(off)
             found = False
-            for _ in range(max(1, self.block_k)):
-                line = self.block_fh.readline()
-                if not line:
-                    break
+            for _, line in itertools.islice(_lines_at(self.block_buf, off), max(1, self.block_k)):
                 s = line.decode("utf-8", errors="ignore").strip()
                 if not s:
                     break
@@ -134,14 +150,12 @@ class LexiconLookup:
                     break
             return found
         if self.mode == "front":
-            keys = [k for k, _ in self.front_idx]
-            i = bisect.bisect_right(keys, t) - 1
+            i = bisect.bisect_right(self.front_keys, t) - 1
             if i < 0:
                 return False
             _, off = self.front_idx[i]
-            fh = self.front_fh
-            fh.seek(off)
-            first_line = fh.readline()
+            lines = _lines_at(self.front_buf, off)
+            _, first_line = next(lines, (off, b""))
             if not first_line:
                 return False
             first = first_line.decode("utf-8", errors="ignore").strip()[1:]
@@ -150,10 +164,7 @@ class LexiconLookup:
             # 解码本块剩余 k-1 行
             remain = max(0, self.front_k - 1)
             base = first
-            for _ in range(remain):
-                line = fh.readline()
-                if not line:
-                    break
+            for _, line in itertools.islice(lines, remain):
                 s = line.decode("utf-8", errors="ignore").strip()
                 if not s:
                     continue
@@ -170,21 +181,9 @@ class LexiconLookup:
         return False
 
     def close(self):
-        if self.block_fh:
-            try:
-                self.block_fh.close()
-            except Exception:
-                pass
-        if self.front_fh:
-            try:
-                self.front_fh.close()
-            except Exception:
-                pass
-
-def load_index():
-    with open(INDEX_DIR / "postings.json", "r", encoding="utf-8") as f:
-        postings = json.load(f)
-    return postings
+        for buf in (self.block_buf, self.front_buf):
+            if buf is not None:
+                buf.close()
 
 def docs_for_term(postings, term):
     return set(d["doc_id"] for d in postings.get(term, []))
@@ -237,53 +236,326 @@ def and_intersect_merge(list_a, list_b):
             j += 1
     return out
 
-STOP = set('''a an the and or not is are was were be been being to of in on at for from with by as it this that these those we you your our his her their i he she they them me my mine ours yours its into about over under up down out more most less few many any each every'''.split())
+_DOC_ID = operator.itemgetter("doc_id")
+
+def _key_of(seq):
+    # 倒排列表按 doc_id 比较，中间结果本身就是升序编号
+    return _DOC_ID if seq and isinstance(seq[0], dict) else None
+
+def gallop(seq, target, lo=0, key=None):
+    """指数（galloping）搜索：从 lo 起以 1, 2, 4, .. 的步长越过小于 target 的元素，再在最后一段内二分；
+    返回第一个 >= target 的下标。代价 O(log 距离)，与序列总长无关。
+    """
+    n = len(seq)
+    step = 1
+    hi = lo
+    while hi < n and (seq[hi] if key is None else key(seq[hi])) < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect.bisect_left(seq, target, lo, min(hi, n), key=key)
+
+# 长度比达到该值才 gallop；比值较小时逐项二分不如把长序列的编号装进 set 再探测（见 benchmarks.bench_intersection）
+GALLOP_RATIO = 32
+
+def intersect_gallop(ids, seq):
+    # ids 中每个编号在 seq 中从上次的位置起 gallop 定位；ids 远短于 seq 时约 O(|ids| log(|seq|/|ids|))
+    key = _key_of(seq)
+    out = []
+    pos = 0
+    n = len(seq)
+    for d in ids:
+        pos = gallop(seq, d, pos, key)
+        if pos == n:
+            break
+        if (seq[pos] if key is None else key(seq[pos])) == d:
+            out.append(d)
+    return out
 
-def phrase_docs(postings, phrase_terms):
-    # 任意长度短语：要求相邻位置连续匹配
-    terms = [t for t in phrase_terms if t and t not in STOP]
+def intersect_probe(ids, seq):
+    key = _key_of(seq)
+    keep = set(seq if key is None else map(key, seq))
+    return [d for d in ids if d in keep]
+
+def intersect_step(ids, seq):
+    # 候选 ids 与下一个序列求交：seq 远长于 ids 时 gallop，否则哈希探测
+    if len(seq) >= GALLOP_RATIO * len(ids):
+        return intersect_gallop(ids, seq)
+    return intersect_probe(ids, seq)
+
+def intersect_n(seqs):
+    """n 路交集：seqs 为若干升序序列（倒排列表或编号列表，可混合），从最短的一个出发，
+    由短到长依次与其余序列求交（intersect_step），候选为空即停止。返回升序编号列表。
+    """
+    seqs = sorted(seqs, key=len)
+    if not seqs or not seqs[0]:
+        return []
+    first = seqs[0]
+    key = _key_of(first)
+    res = list(first) if key is None else [key(e) for e in first]
+    for seq in seqs[1:]:
+        res = intersect_step(res, seq)
+        if not res:
+            break
+    return res
+
+def and_not_merge(ids, plist):
+    # 有序差集：升序编号列表 ids 中去掉出现在倒排列表 plist 中的文档，双指针线性扫描 O(|ids| + |plist|)
+    out = []
+    j = 0
+    n = len(plist)
+    for d in ids:
+        while j < n and plist[j]["doc_id"] < d:
+            j += 1
+        if j < n and plist[j]["doc_id"] == d:
+            continue
+        out.append(d)
+    return out
+
+def union_n(plists):
+    # 多路并集：各倒排按 doc_id 升序，heapq.merge 流式归并并去掉相邻重复，不物化中间集合
+    out = []
+    last = -1
+    for d in heapq.merge(*(map(_DOC_ID, pl) for pl in plists)):
+        if d != last:
+            out.append(d)
+            last = d
+    return out
+
+def live_universe(postings):
+    # 旧方式：扫描全部倒排得到文档全集（未提供预先计算的全集时使用）
+    universe = set()
+    for tl in postings.values():
+        for d in tl:
+            universe.add(d["doc_id"])
+    return sorted(universe)
+
+# ---------------- 位置求交：短语与 NEAR/k ----------------
+# 先在文档层做 n 路交集，只对留下的候选文档取各词的位置列表（二进制倒排此时才读 positions.bin）；
+# 位置列表本身有序，用归并 + gallop 匹配，不为每个倒排项构造位置集合。
+
+# 位置列表不长于该值时直接用 in 检查（C 层线性扫描），更长时带游标 gallop
+SHORT_POSITIONS = 8
+
+def entries_for(doc_ids, plist):
+    """候选文档（升序）在倒排列表中对应的项，返回与 doc_ids 对齐的列表。
+    候选远少于倒排时沿 plist gallop，否则顺序归并。
+    """
+    out = []
+    pos = 0
+    if len(plist) >= GALLOP_RATIO * len(doc_ids):
+        for d in doc_ids:
+            pos = gallop(plist, d, pos, _DOC_ID)
+            out.append(plist[pos])
+        return out
+    for d in doc_ids:
+        while plist[pos]["doc_id"] < d:
+            pos += 1
+        out.append(plist[pos])
+    return out
+
+def phrase_match(pos_lists):
+    """pos_lists[i] 为短语第 i 个词在同一文档中的有序位置；存在起点 s 使 s + i 在每个列表中时为真。
+    从最短的列表出发枚举候选起点，其余列表各带一个只前进的游标 gallop 到目标位置。
+    """
+    lens = [len(lst) for lst in pos_lists]
+    j = lens.index(min(lens))
+    others = [(i - j, lst) for i, lst in enumerate(pos_lists) if i != j]
+    cursors = [0] * len(others)
+    for p in pos_lists[j]:
+        for n, (off, lst) in enumerate(others):
+            target = p + off
+            if len(lst) <= SHORT_POSITIONS:
+                if target not in lst:
+                    break
+                continue
+            c = cursors[n] = gallop(lst, target, cursors[n])
+            if c == len(lst):
+                return False
+            if lst[c] != target:
+                break
+        else:
+            return True
+    return False
+
+def near_match(pa, pb, k, ordered=False):
+    """两个有序位置列表中是否存在 x ∈ pa、y ∈ pb 满足 |y - x| <= k（ordered 时要求 0 < y - x <= k）；
+    对 pa 顺序枚举，在 pb 中带游标 gallop 到窗口下界
+    """
+    c = 0
+    n = len(pb)
+    for x in pa:
+        c = gallop(pb, x + 1 if ordered else x - k, c)
+        if c == n:
+            return False
+        if pb[c] <= x + k:
+            return True
+    return False
+
+def positional_docs(postings, terms, match, filters=()):
+    # 文档层 n 路交集得到候选（filters 为额外的升序编号列表，如词对倒排，一并参与求交），再逐个候选取位置列表交给 match 判断
+    plists = [postings_for_term_list(postings, t) for t in terms]
+    candidates = intersect_n([*filters, *plists])
+    if not candidates:
+        return []
+    entries = [entries_for(candidates, pl) for pl in plists]
+    return [d for i, d in enumerate(candidates) if match([entry_positions(postings, e[i]) for e in entries])]
+
+def phrase_docs(postings, phrase_terms, biwords=None):
+    # 任意长度短语：要求相邻位置连续匹配（phrase_terms 已经过分析器规范化，停用词已去除）；返回升序编号列表
+    # biwords（biwords.BiwordIndex）：两词短语已收录时直接返回词对倒排；更长的短语以已收录的相邻词对缩小候选，仍校验位置
+    terms = [t for t in phrase_terms if t]
     if not terms:
-        return set()
+        return []
     if len(terms) == 1:
-        return docs_for_term(postings, terms[0])
-    # 为每个词构建 doc -> positions 集合
-    term_doc_pos = []
-    doc_sets = []
-    for t in terms:
-        doc_pos = {}
-        for entry in postings.get(t, []):
-            doc_pos[entry["doc_id"]] = set(entry.get("pos", []))
-        term_doc_pos.append(doc_pos)
-        doc_sets.append(set(doc_pos.keys()))
-    if not doc_sets:
-        return set()
-    candidates = set.intersection(*doc_sets)
-    out = set()
-    for doc in candidates:
-        first_positions = term_doc_pos[0][doc]
-        other_pos_sets = [term_doc_pos[i][doc] for i in range(1, len(terms))]
-        for p in first_positions:
-            if all((p + i) in other_pos_sets[i-1] for i in range(1, len(terms))):
-                out.add(doc)
+        return [e["doc_id"] for e in postings_for_term_list(postings, terms[0])]
+    pairs = [p for p in zip(terms, terms[1:]) if biwords is not None and p in biwords]
+    if len(terms) == 2 and pairs:
+        return biwords.get(pairs[0])
+    return positional_docs(postings, terms, phrase_match, [biwords.get(p) for p in pairs])
+
+def near_docs(postings, a, b, k, ordered=False):
+    # a NEAR/k b：同一文档中两词位置相距不超过 k；ordered（ONEAR/k）时 b 须在 a 之后
+    return positional_docs(postings, [a, b], lambda pls: near_match(pls[0], pls[1], k, ordered))
+
+def execute_bitmap(op, bitmaps, memo):
+    # 位图子树求值：整棵子树在 RoaringBitmap 上做 AND/OR/ANDNOT，不解码倒排
+    key = ("bitmap", id(op))
+    if key in memo:
+        return memo[key]
+    kind = op[0]
+    if kind == "bitmap":
+        res = bitmaps.get(op[2])
+    elif kind == "intersect":
+        res = execute_bitmap(op[3][0], bitmaps, memo)
+        for child in op[3][1:]:
+            if not res:
                 break
-    return out
+            res = res & execute_bitmap(child, bitmaps, memo)
+    elif kind == "union":
+        res = RoaringBitmap(bitmaps.n_docs)
+        for child in op[3]:
+            res = res | execute_bitmap(child, bitmaps, memo)
+    elif kind == "difference":
+        res = execute_bitmap(op[3], bitmaps, memo)
+        for child in op[4]:
+            if not res:
+                break
+            res = res - execute_bitmap(child, bitmaps, memo)
+    elif kind == "complement":
+        res = RoaringBitmap.full(bitmaps.n_docs) - execute_bitmap(op[3], bitmaps, memo)
+    else:
+        raise ValueError(f"Unknown bitmap operator {kind}")
+    memo[key] = res
+    return res
+
+def execute(op, postings, universe, memo, bitmaps=None, biwords=None):
+    # 物理计划求值，结果一律为升序编号列表；memo 按算子对象缓存，公共子表达式只算一次
+    key = id(op)
+    if key in memo:
+        return memo[key]
+    kind = op[0]
+    if is_bitmap(op):
+        res = execute_bitmap(op, bitmaps, memo).to_list()
+    elif kind == "empty":
+        res = []
+    elif kind == "scan":
+        res = [e["doc_id"] for e in postings_for_term_list(postings, op[2])]
+    elif kind == "biword":
+        res = biwords.get(tuple(op[2]))
+    elif kind == "phrase":
+        res = phrase_docs(postings, op[2], biwords)
+    elif kind == "near":
+        res = near_docs(postings, op[4], op[5], op[2], op[3])
+    elif kind == "expand":
+        res = union_n([postings_for_term_list(postings, t) for t in op[3]])
+    elif kind == "intersect":
+        # n 路交集：子算子已按估计大小升序，从最短的出发依次与其余倒排/中间结果求交（gallop 或哈希探测），
+        # 结果为空即停止，后面的子表达式不再求值；skip 方式下最短的两个倒排先用跳表求交
+        # （二进制倒排在 postings.bin 上按跳表只解码被命中的块，JSON 倒排按 skip 下标归并）；
+        # 能以位图求值的子算子把当前候选转成位图后直接 AND
+        children = op[3]
+        if op[2] == "skip" and children[0][0] == "scan" and children[1][0] == "scan":
+            l1 = postings_for_term_list(postings, children[0][2])
+            reader = postings.skip_reader(children[1][2]) if hasattr(postings, "skip_reader") else None
+            if reader is not None:
+                res = reader.intersect([e["doc_id"] for e in l1])
+            else:
+                l2 = postings_for_term_list(postings, children[1][2])
+                res = and_intersect_with_skip(l1, l2, use_skip=True)
+            rest = children[2:]
+        else:
+            res = execute(children[0], postings, universe, memo, bitmaps, biwords)
+            rest = children[1:]
+        for child in rest:
+            if not res:
+                break
+            if is_bitmap(child):
+                bm = execute_bitmap(child, bitmaps, memo)
+                res = (RoaringBitmap.from_sorted(res, bitmaps.n_docs) & bm).to_list()
+            elif child[0] == "scan":
+                res = intersect_step(res, postings_for_term_list(postings, child[2]))
+            else:
+                res = intersect_step(res, execute(child, postings, universe, memo, bitmaps, biwords))
+    elif kind == "difference":
+        res = execute(op[3], postings, universe, memo, bitmaps, biwords)
+        for child in op[4]:
+            if not res:
+                break
+            if is_bitmap(child):
+                bm = execute_bitmap(child, bitmaps, memo)
+                res = (RoaringBitmap.from_sorted(res, bitmaps.n_docs) - bm).to_list()
+            elif child[0] == "scan":
+                res = and_not_merge(res, postings_for_term_list(postings, child[2]))
+            else:
+                drop = set(execute(child, postings, universe, memo, bitmaps, biwords))
+                res = [d for d in res if d not in drop]
+    elif kind == "union":
+        acc = set()
+        for child in op[3]:
+            acc.update(execute(child, postings, universe, memo, bitmaps, biwords))
+        res = sorted(acc)
+    elif kind == "complement":
+        drop = set(execute(op[3], postings, universe, memo, bitmaps, biwords))
+        res = [d for d in universe if d not in drop]
+    else:
+        raise ValueError(f"Unknown operator {kind}")
+    memo[key] = res
+    return res
+
+_DEFAULT_ANALYZER = Analyzer()
 
-def eval_one(postings, q, *, dict_lookup: LexiconLookup = None, use_skip: bool = False):
-    # 支持双引号短语，AND/OR/NOT（大小写不敏感）
+def eval_one(postings, q, *, dict_lookup: LexiconLookup = None, use_skip: bool = False, analyzer: Analyzer = None,
+             universe=None, explain: bool = False, bitmaps=None, biwords=None, kgrams=None,
+             max_expansions: int = DEFAULT_MAX_EXPANSIONS):
+    # 支持双引号短语，AND/OR/NOT 与邻近算子 NEAR/k、ONEAR/k（大小写不敏感），以及前缀/通配词 tech*、*script、te*ch
+    # 全程在内部整数文档编号上运算，返回升序编号列表（外部 id 由调用方经 docids.json 映射）
+    # 查询词与短语经过与建索引相同的分析器（小写/停用词/词干等）
+    # 解析 -> 规划（query_plan：展平/NOT 下推/提取公共项/按 df 排序）-> 按物理计划求值；语法错误（空查询、缺操作数、括号不配对）抛出 ValueError
+    # universe：存活文档全集（升序，载入索引时算一次），供全集求补与代价估计；explain 时打印计划
+    # bitmaps：高频词项的压缩位图（bitmap.BitmapIndex，仅单一索引），全部由这些词构成的子表达式在位图上求值
+    # biwords：词对索引（biwords.BiwordIndex，仅单一索引），已收录的短语直接读词对倒排，其余短语校验位置
+    # kgrams：通配查询的 k-gram 索引（wildcard.KGramIndex，仅单一索引）；每个通配词至多扩展为 max_expansions 个词项
+    analyzer = analyzer or _DEFAULT_ANALYZER
+    if universe is None:
+        universe = live_universe(postings)
     q = q.strip()
     # 先处理短语 -> 特殊 token：__PHRASE_i__ 或 __TERM_token__
     phrases = re.findall(r'"([^"]+)"', q)
     repl = {}
     for i, ph in enumerate(phrases):
-        terms = [t.lower() for t in re.findall(r"[A-Za-z0-9]+", ph)]
-        if len(terms) == 1:
+        terms = analyzer.terms(ph)
+        if not terms:
+            key = f"__PHRASE_{i}__"
+            repl[key] = EMPTY
+        elif len(terms) == 1:
             key = f"__TERM_{terms[0]}__"
-            repl[key] = lambda p=terms[0]: docs_for_term(postings, p)
+            repl[key] = ("TERM", terms[0])
         else:
             key = f"__PHRASE_{i}__"
-            repl[key] = lambda pts=terms: phrase_docs(postings, pts)
+            repl[key] = ("PHRASE", tuple(terms))
         q = q.replace(f'"{ph}"', key)
-    tokens = re.findall(r"\w+|\(|\)|AND|OR|NOT", q, flags=re.IGNORECASE)
+    tokens = re.findall(r"O?NEAR/\d+|[\w*]+|\(|\)|AND|OR|NOT", q, flags=re.IGNORECASE)
     # 解析为布尔表达式：递归下降（简单版）
     pos = 0
     def parse_expr():
@@ -299,85 +571,115 @@ def eval_one(postings, q, *, dict_lookup: LexiconLookup = None, use_skip: bool =
         return node
     def parse_term():
         nonlocal pos
-        node = parse_factor()
+        node = parse_near()
         while pos < len(tokens):
             op = tokens[pos].upper()
             if op == "AND":
                 pos += 1
-                node = ("AND", node, parse_factor())
+                node = ("AND", node, parse_near())
             else:
                 break
         return node
+    def parse_near():
+        # a NEAR/k b（无序）与 a ONEAR/k b（有序）：优先级高于 AND，两侧须为单个词
+        nonlocal pos
+        node = parse_factor()
+        while pos < len(tokens):
+            m = re.fullmatch(r"(O?)NEAR/(\d+)", tokens[pos], flags=re.IGNORECASE)
+            if not m:
+                break
+            pos += 1
+            right = parse_factor()
+            if EMPTY in (node, right):
+                node = EMPTY
+                continue
+            if node[0] != "TERM" or right[0] != "TERM":
+                raise ValueError(f"NEAR operands must be single terms: {q}")
+            node = ("NEAR", int(m.group(2)), bool(m.group(1)), node[1], right[1])
+        return node
     def parse_factor():
         nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError(f"unexpected end of query: {q!r}")
         tok = tokens[pos]
         if tok == "(":
             pos += 1
             node = parse_expr()
-            assert tokens[pos] == ")"
+            if pos >= len(tokens) or tokens[pos] != ")":
+                raise ValueError(f"missing ')': {q!r}")
             pos += 1
             return node
         if tok.upper() == "NOT":
             pos += 1
             return ("NOT", parse_factor())
         pos += 1
-        # 变量：可能是 __PHRASE__/__TERM__ 或普通词
+        # 变量：短语占位（__PHRASE__/__TERM__）或普通词
         if tok in repl:
-            return ("SET", tok)
-        term = tok.lower()
+            return repl[tok]
+        if "*" in tok:
+            # 通配词：在解析时扩展为索引中的词项，求值时对它们的倒排做多路并集
+            pattern = analyzer.normalize_pattern(tok)
+            terms, truncated = expand(postings, pattern, kgrams, max_expansions)
+            if len(terms) <= 1:
+                return ("TERM", terms[0]) if terms else EMPTY
+            return ("EXPAND", pattern, tuple(terms), truncated)
+        # 被分析器过滤的词（如停用词）不在索引中，按原词查找即得空集
+        term = analyzer.normalize_term(tok) or tok.lower()
         return ("TERM", term)
-    ast = parse_expr()
-
-    def eval_ast(node):
-        typ = node[0]
-        if typ == "SET":
-            return repl[node[1]]()
-        if typ == "TERM":
-            term = node[1]
-            # 如果启用压缩字典查找，则先判断是否存在（仅用于计时对比）
-            if dict_lookup is not None and not dict_lookup.contains(term):
-                return set()
-            return docs_for_term(postings, term)
-        if typ == "AND":
-            # 若启用 skip 且左右均为 TERM，则用有序交集（含跳表）
-            if use_skip and node[1][0] == "TERM" and node[2][0] == "TERM":
-                t1 = node[1][1]
-                t2 = node[2][1]
-                if dict_lookup is not None:
-                    # 字典模式下不存在直接返回空
-                    if not (dict_lookup.contains(t1) and dict_lookup.contains(t2)):
-                        return set()
-                l1 = postings_for_term_list(postings, t1)
-                l2 = postings_for_term_list(postings, t2)
-                if not l1 or not l2:
-                    return set()
-                # 选择更短的在前，略提速
-                if len(l1) > len(l2):
-                    l1, l2 = l2, l1
-                res = and_intersect_with_skip(l1, l2, use_skip=True)
-                return set(res)
-            # 其他情况回退集合交
-            return eval_ast(node[1]) & eval_ast(node[2])
-        if typ == "OR":
-            return eval_ast(node[1]) | eval_ast(node[2])
-        if typ == "NOT":
-            universe = set()
-            for tl in postings.values():
-                for d in tl:
-                    universe.add(d["doc_id"])
-            return universe - eval_ast(node[1])
-        raise ValueError(f"Unknown node {typ}")
-    return sorted(eval_ast(ast))
+    ast = normalize(parse_expr())
+
+    def df(term):
+        # 启用压缩字典查找时先判断是否存在（仅用于计时对比），不存在的词 df 记为 0
+        if dict_lookup is not None and not dict_lookup.contains(term):
+            return 0
+        return term_df(postings, term)
+
+    op = plan(ast, df, len(universe), use_skip, bitmaps=bitmaps if bitmaps is not None else (), biwords=biwords)
+    if explain:
+        print(f"逻辑式: {format_logical(ast)}")
+        print(format_plan(op))
+    return execute(op, postings, universe, {}, bitmaps, biwords)
+
+def open_search_index(root=INDEX_DIR, fmt="auto", cache_size=DEFAULT_CACHE_SIZE, use_bitmaps=True, use_biwords=True):
+    """载入布尔检索所需的全部结构，返回 (postings, doc_ids, universe, bitmaps, biwords, kgrams)。
+    分段索引时为多段视图（全局编号、已过滤墓碑），否则直接是 base 的倒排
+    """
+    postings, doc_ids, _ = open_index(fmt, root, cache_size)
+    universe = list(live_ids(postings, doc_ids))  # 存活文档全集只算一次，供各查询的 NOT 与代价估计共用
+    # 位图按内部编号存储，只对应单一索引；多段视图的全局编号与之不符，不使用
+    segmented = isinstance(postings, SegmentedPostings)
+    bitmaps = None if segmented or not use_bitmaps else load_bitmaps(root)
+    biwords = None if segmented or not use_biwords else load_biwords(root)
+    # k-gram 索引在第一次通配查询时才读入；多段视图的词表与 base 不同，通配词逐个检查全部词项
+    kgrams = None if segmented else load_kgrams(root)
+    return postings, doc_ids, universe, bitmaps, biwords, kgrams
 
 def main():
     import argparse
     ap = argparse.ArgumentParser(description="Boolean search with timing and optional compressed lexicon/skip AND")
-    ap.add_argument("--dict", dest="dict_mode", default="raw", choices=["raw", "block", "front"],
-                    help="dictionary lookup mode for term existence: raw|block|front")
-    ap.add_argument("--use-skip", dest="use_skip", action="store_true", help="use skip-pointer AND optimization for TERM AND TERM")
+    ap.add_argument("--dict", dest="dict_mode", default="bin", choices=["bin", "raw", "block", "front"],
+                    help="dictionary for term lookup: bin (the postings reader's own lexicon.bin, no extra structure) | "
+                         "raw|block|front (additional existence check, for timing comparison)")
+    ap.add_argument("--use-skip", dest="use_skip", action="store_true",
+                    help="use skip pointers when intersecting the two shortest postings lists of a conjunction")
+    ap.add_argument("--explain", action="store_true", help="print the rewritten query and the chosen physical plan")
+    ap.add_argument("--no-bitmaps", action="store_true",
+                    help="ignore bitmaps.bin and evaluate frequent terms on sorted postings lists")
+    ap.add_argument("--no-biwords", action="store_true",
+                    help="ignore biwords.bin and verify every phrase against positions")
+    ap.add_argument("--max-expansions", type=int, default=DEFAULT_MAX_EXPANSIONS,
+                    help="expand each prefix/wildcard term (tech*, *script) to at most N index terms, in lexicographic order")
+    ap.add_argument("--postings", dest="postings_fmt", default="auto", choices=["auto", "json", "bin"],
+                    help="postings file to load: auto (bin if present) | json | bin")
+    ap.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                    help="LRU capacity (number of terms) for decoded postings lists of the binary reader")
     args = ap.parse_args()
 
-    postings = load_index()
+    load_start = time.time()
+    postings, doc_ids, universe, bitmaps, biwords, kgrams = open_search_index(
+        INDEX_DIR, args.postings_fmt, args.cache_size, not args.no_bitmaps, not args.no_biwords)
+    load_time = (time.time() - load_start) * 1000
+    analyzer = load_analyzer(INDEX_DIR)
     with open(QUERIES, "r", encoding="utf-8") as f:
         qobj = json.load(f)
     
@@ -389,13 +691,18 @@ def main():
     print("布尔检索执行时间统计")
     print("=" * 60)
     
-    # 初始化字典查找器
-    dict_lookup = LexiconLookup(args.dict_mode)
+    # 额外的词存在性检查（raw/block/front，仅用于计时对比）；bin 模式直接用倒排读取器的词典
+    extra = postings.segment_terms if isinstance(postings, SegmentedPostings) else None
+    dict_lookup = None if args.dict_mode == "bin" else LexiconLookup(args.dict_mode, extra)
 
     # 执行每个查询并计时
     for q in qobj.get("queries", []):
         start_time = time.time()
-        results[q] = eval_one(postings, q, dict_lookup=dict_lookup, use_skip=args.use_skip)
+        hits = eval_one(postings, q, dict_lookup=dict_lookup, use_skip=args.use_skip, analyzer=analyzer,
+                        universe=universe, explain=args.explain, bitmaps=bitmaps, biwords=biwords,
+                        kgrams=kgrams, max_expansions=args.max_expansions)
+        # 各段编号区间互相独立，映射回外部 id 后统一排序
+        results[q] = sorted(doc_ids[i] for i in hits)
         end_time = time.time()
         execution_time = (end_time - start_time) * 1000  # 转换为毫秒
         execution_times[q] = execution_time
@@ -413,6 +720,7 @@ def main():
     print("\n" + "=" * 60)
     print("总体统计")
     print("=" * 60)
+    print(f"索引载入时间: {load_time:.2f} ms")
     print(f"总查询数量: {len(qobj.get('queries', []))}")
     print(f"总执行时间: {total_execution_time:.2f} ms")
     print(f"平均每查询时间: {total_execution_time / len(qobj.get('queries', [])):.2f} ms")
@@ -434,6 +742,7 @@ def main():
     
     # 保存执行时间统计到单独文件
     time_stats = {
+        "index_load_time_ms": load_time,
         "total_queries": len(qobj.get("queries", [])),
         "total_execution_time_ms": total_execution_time,
         "average_time_per_query_ms": total_execution_time / len(qobj.get("queries", [])),
@@ -452,8 +761,11 @@ def main():
     print(f"执行时间统计已保存 -> {time_out}")
     # 额外打印模式信息，便于对比
     print(f"模式: dict={args.dict_mode}, use_skip={args.use_skip}")
+    if hasattr(postings, "cache_info"):
+        print(f"倒排缓存: {postings.cache_info()}")
 
-    dict_lookup.close()
+    if dict_lookup is not None:
+        dict_lookup.close()
 
 if __name__ == "__main__":
     main()
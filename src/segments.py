@@ -0,0 +1,267 @@
+# 分段索引（segment）：全量构建的索引作为 base 段（文件在 index_json/ 根目录），
+# 增量文档写成小的不可变段（index_json/segments/seg_NNNNNN/），删除/更新只记录为各段的墓碑（tombstones.json）。
+# 段清单 index_json/segments.json 记录段的顺序与文档数；分层（tiered）合并策略把同一量级的小段压实成大段。
+#
+# 检索端的全局文档编号 = 段的起始偏移 + 段内编号；被墓碑标记的文档在读取倒排时过滤掉。
+# 没有 segments.json 时整个索引就是单个 base 段，行为与旧版完全一致。
+import json, math, os, shutil, time
+from utils import INDEX_DIR, DOCIDS_FILE, load_docids
+from postings_bin import BinaryPostings, LRUCache, DEFAULT_CACHE_SIZE
+
+SEGMENTS_FILE = "segments.json"
+SEGMENTS_DIR = "segments"
+TOMBSTONES_FILE = "tombstones.json"
+LOCK_FILE = "segments.lock"
+BASE = "base"
+
+def segment_dir(name, root=INDEX_DIR):
+    return root if name == BASE else root / SEGMENTS_DIR / name
+
+def load_segments(root=INDEX_DIR):
+    """读取段清单；不存在时视为只有 base 段"""
+    path = root / SEGMENTS_FILE
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    segs = [{"name": BASE, "docs": len(load_docids(root))}] if (root / DOCIDS_FILE).exists() else []
+    return {"segments": segs, "next_id": 1, "merging": []}
+
+def save_segments(manifest, root=INDEX_DIR):
+    # 先写临时文件再原子替换，读端任何时刻看到的都是完整清单
+    path = root / SEGMENTS_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def new_segment_name(manifest):
+    name = f"seg_{manifest['next_id']:06d}"
+    manifest["next_id"] += 1
+    return name
+
+def reset_segments(root=INDEX_DIR):
+    """全量重建后调用：丢弃所有增量段、墓碑与段清单"""
+    shutil.rmtree(root / SEGMENTS_DIR, ignore_errors=True)
+    for name in (SEGMENTS_FILE, TOMBSTONES_FILE):
+        if (root / name).exists():
+            (root / name).unlink()
+
+def load_tombstones(name, root=INDEX_DIR):
+    path = segment_dir(name, root) / TOMBSTONES_FILE
+    if not path.exists():
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return set(json.load(f))
+
+def save_tombstones(name, tombstones, root=INDEX_DIR):
+    path = segment_dir(name, root) / TOMBSTONES_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sorted(tombstones), f)
+    os.replace(tmp, path)
+
+class SegmentLock:
+    """段清单的进程间互斥（O_EXCL 创建锁文件）；只在读改写清单/墓碑的短临界区内持有"""
+    def __init__(self, root=INDEX_DIR, timeout=60.0):
+        self.path = root / LOCK_FILE
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"could not lock {self.path}; remove it if no build is running")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        self.path.unlink(missing_ok=True)
+
+def add_tombstones(manifest, ext_ids, root=INDEX_DIR):
+    """把外部 doc_id 集合在所有段中标记为已删除，返回新增墓碑数"""
+    if not ext_ids:
+        return 0
+    n = 0
+    for seg in manifest["segments"]:
+        doc_ids = load_docids(segment_dir(seg["name"], root))
+        hit = {i for i, d in enumerate(doc_ids) if d in ext_ids}
+        if not hit:
+            continue
+        dead = load_tombstones(seg["name"], root)
+        hit -= dead
+        if hit:
+            save_tombstones(seg["name"], dead | hit, root)
+            seg["deleted"] = len(dead) + len(hit)
+            n += len(hit)
+    return n
+
+def live_docs(seg):
+    return seg["docs"] - seg.get("deleted", 0)
+
+def tier_of(seg, factor):
+    return int(math.log(max(live_docs(seg), 1), factor))
+
+def select_merges(manifest, factor=10, max_deleted_ratio=0.5):
+    """分层合并策略：按存活文档数的量级（factor 为底的对数）分层，某层段数达到 factor 即合并该层；
+    删除比例过高的段单独重写以回收空间；不含存活文档的段直接丢弃（返回空的合并组）。
+    正在合并中的段不参与选择。返回若干组段名。
+    """
+    busy = set(manifest.get("merging", []))
+    segs = [s for s in manifest["segments"] if s["name"] not in busy]
+    groups = []
+    empty = [s["name"] for s in segs if live_docs(s) == 0]
+    if empty:
+        groups.append(empty)
+    segs = [s for s in segs if live_docs(s) > 0]
+    tiers = {}
+    for s in segs:
+        tiers.setdefault(tier_of(s, factor), []).append(s)
+    chosen = set()
+    for tier in sorted(tiers):
+        members = tiers[tier]
+        if len(members) >= factor:
+            groups.append([s["name"] for s in members])
+            chosen.update(s["name"] for s in members)
+    for s in segs:
+        if s["name"] not in chosen and s.get("deleted", 0) > s["docs"] * max_deleted_ratio:
+            groups.append([s["name"]])
+    return groups
+
+def postings_format(directory):
+    """目录中已有的倒排格式：json | bin | both（都没有时为 json）"""
+    has_json = (directory / "postings.json").exists()
+    has_bin = (directory / "postings.bin").exists()
+    if has_json and has_bin:
+        return "both"
+    return "bin" if has_bin else "json"
+
+def open_postings(directory, fmt="auto", cache_size=DEFAULT_CACHE_SIZE):
+    # auto：存在 postings.bin 时优先使用（mmap + 只载入目录，倒排按需解码并进 LRU），否则读 postings.json
+    bin_path = directory / "postings.bin"
+    if fmt == "bin" or (fmt == "auto" and bin_path.exists()):
+        return BinaryPostings(bin_path, cache_size)
+    with open(directory / "postings.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class SegmentedPostings:
+    """把多个段拼成一个只读的倒排视图：与 dict 相同的接口，doc_id 为全局编号，已删除文档被过滤。
+    拼接/过滤后的列表不再带 skip 指针（原指针是段内下标）。拼接结果进 LRU 缓存（各段读取器本身不再缓存）。
+    二进制段的项不含位置，只记录段序号 part 与位置偏移 poff，positions() 转交对应段的读取器。
+    """
+    def __init__(self, root=INDEX_DIR, fmt="auto", manifest=None, cache_size=DEFAULT_CACHE_SIZE):
+        manifest = manifest or load_segments(root)
+        self.parts = []  # (起始偏移, 段倒排, 墓碑集合)
+        self.sizes = []  # 各段编号表长度
+        self.doc_ids = []
+        self.live = 0
+        terms = {}
+        self.segment_terms = set()  # 出现在增量段（非 base）中的词
+        for seg in manifest["segments"]:
+            d = segment_dir(seg["name"], root)
+            postings = open_postings(d, fmt, cache_size=0)
+            dead = load_tombstones(seg["name"], root)
+            self.parts.append((len(self.doc_ids), postings, dead))
+            ids = load_docids(d)
+            self.sizes.append(len(ids))
+            self.doc_ids.extend(ids)
+            self.live += len(ids) - len(dead)
+            terms.update(dict.fromkeys(postings.keys()))
+            if seg["name"] != BASE:
+                self.segment_terms.update(postings.keys())
+        self.terms = list(terms)
+        self.cache = LRUCache(cache_size)
+
+    def get(self, term, default=None):
+        plist = self.cache.get(term)
+        if plist is not None:
+            return plist
+        out = []
+        found = False
+        for part, (base, postings, dead) in enumerate(self.parts):
+            seg_list = postings.get(term)
+            if seg_list is None:
+                continue
+            found = True
+            for e in seg_list:
+                if e["doc_id"] not in dead:
+                    entry = {"doc_id": base + e["doc_id"], "tf": e["tf"]}
+                    if "pos" in e:
+                        entry["pos"] = e["pos"]
+                    else:
+                        entry["part"] = part
+                        entry["poff"] = e["poff"]
+                    out.append(entry)
+        if not found:
+            return default
+        self.cache.put(term, out)
+        return out
+
+    def cache_info(self):
+        return self.cache.info()
+
+    def close(self):
+        for _, p, _ in self.parts:
+            if hasattr(p, "close"):
+                p.close()
+
+    def positions(self, entry):
+        return self.parts[entry["part"]][1].positions(entry)
+
+    def df(self, term):
+        # 各段 df 之和（不扣除墓碑），只用作查询规划的代价估计
+        return sum(p.df(term) if hasattr(p, "df") else len(p.get(term, ())) for _, p, _ in self.parts)
+
+    def live_ids(self):
+        for (base, _, dead), n in zip(self.parts, self.sizes):
+            for i in range(n):
+                if i not in dead:
+                    yield base + i
+
+    def __getitem__(self, term):
+        plist = self.get(term)
+        if plist is None:
+            raise KeyError(term)
+        return plist
+
+    def __contains__(self, term):
+        return any(term in p for _, p, _ in self.parts)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def keys(self):
+        return self.terms
+
+    def values(self):
+        for term in self.terms:
+            yield self[term]
+
+    def items(self):
+        for term in self.terms:
+            yield term, self[term]
+
+def live_ids(postings, doc_ids):
+    """存活文档的全局编号（升序）：单一索引即 0..N-1（编号表只含有词的文档），多段视图去掉墓碑"""
+    if isinstance(postings, SegmentedPostings):
+        return postings.live_ids()
+    return range(len(doc_ids))
+
+def open_index(fmt="auto", root=INDEX_DIR, cache_size=DEFAULT_CACHE_SIZE):
+    """检索端统一入口，返回 (postings, doc_ids, 存活文档数)。
+    只有 base 段且无墓碑时直接返回该段的倒排（保留 skip 指针与惰性解码），否则返回多段视图。
+    cache_size：已解码倒排列表的 LRU 容量（按词项计）。
+    """
+    manifest = load_segments(root)
+    segs = manifest["segments"]
+    if len(segs) == 1 and segs[0]["name"] == BASE and not segs[0].get("deleted"):
+        doc_ids = load_docids(root)
+        return open_postings(root, fmt, cache_size), doc_ids, len(doc_ids)
+    view = SegmentedPostings(root, fmt, manifest, cache_size)
+    return view, view.doc_ids, view.live
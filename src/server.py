@@ -0,0 +1,344 @@
+# 常驻查询服务：索引只载入一次，以 HTTP + JSON 同时提供布尔检索与 VSM 检索，省去每次查询启动进程、载入索引的开销
+# 只用标准库 asyncio 实现最小的 HTTP/1.1（keep-alive、按 Content-Length 读请求体），监听 TCP 端口或 Unix socket。
+#
+# 端点（参数可放在查询串，也可放在 POST 的 JSON 请求体中）：
+#   GET  /health                        索引概况（文档数、词项数、载入时间、代数）
+#   GET|POST /search/boolean?q=...      布尔/短语/邻近/通配查询，返回升序外部 doc_id（与 boolean_results.json 相同）
+#   GET|POST /search/vsm?q=...&k=10     TF-IDF 余弦排序的前 k 个 [doc_id, score]（与 vsm_results.json 相同）
+#   POST /batch {"boolean": [...], "vsm": [...], "k": 10}   一次提交多条查询，按输入顺序返回各条的结果（单条出错只在该项记 error）
+#   POST /reload                        重新载入 index_json/，成功后原子切换
+#
+# 热切换：每次载入得到一个独立的快照（倒排读取器、编号表、位图、词对、k-gram、统计与分析器），请求开始时取当前快照并计数，
+# 结束时归还；重新载入在线程池中完成，校验通过后才替换当前快照，旧快照等最后一个进行中的请求结束再关闭。
+# 载入或校验失败时继续用旧快照服务。索引目录中的文件都由写出端先写 .tmp 再换入（utils.atomic_open），
+# 旧快照已打开的文件（mmap 及 kgrams.bin 等延迟读取的句柄）仍指向旧内容，重建索引不影响进行中的请求。--watch 定期检查索引文件的大小与修改时间，
+# 连续两次检查都不变（写出已结束）时自动重新载入。
+#
+# 查询在 --threads 个工作线程中求值（索引读取器只做 mmap 切片、缓存带锁，同一快照可被多个线程共用），
+# 批量请求中的各条查询分别提交给线程池；--threads 0 时在事件循环线程上逐条求值，批量请求在查询之间让出事件循环。
+import asyncio, json, pathlib, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from utils import INDEX_DIR
+from segments import LOCK_FILE
+from postings_bin import DEFAULT_CACHE_SIZE
+from analyzer import load_analyzer
+from search_boolean import eval_one, open_search_index, DEFAULT_MAX_EXPANSIONS
+from search_vsm import load_vsm_stats, score
+
+DEFAULT_PORT = 8765
+DEFAULT_THREADS = 4
+MAX_BODY = 16 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+# 请求参数校验：不合法时抛出 ValueError，由 handle 返回 400
+def query_param(params, name="q"):
+    if name not in params:
+        raise ValueError(f"missing parameter {name}")
+    q = params[name]
+    if not isinstance(q, str):
+        raise ValueError(f"parameter {name} must be a string")
+    return q
+
+def query_list(params, name):
+    qs = params.get(name, [])
+    if not isinstance(qs, list) or not all(isinstance(q, str) for q in qs):
+        raise ValueError(f"parameter {name} must be a list of strings")
+    return qs
+
+def query_error(q, e):
+    # 批量请求中单条查询的错误：语法/参数错误只给出原因，其他异常带上类型（与 handle 中 400/500 的区分一致）
+    msg = str(e) if isinstance(e, (ValueError, TypeError, KeyError)) else f"{type(e).__name__}: {e}"
+    return {"query": q, "error": msg}
+
+def int_param(params, name, default, minimum):
+    v = params.get(name, default)
+    if isinstance(v, str) and v.strip().lstrip("+-").isdigit():  # 查询串中的值都是字符串
+        v = int(v)
+    if type(v) is not int:
+        raise ValueError(f"parameter {name} must be an integer")
+    if v < minimum:
+        raise ValueError(f"parameter {name} must be >= {minimum}")
+    return v
+
+def index_fingerprint(root=INDEX_DIR):
+    """索引目录下各文件的 (相对路径, 大小, 修改时间)，用于发现重建；忽略写出中的 .tmp 与段锁文件"""
+    out = []
+    for p in sorted(root.rglob("*")):
+        if p.name.endswith(".tmp") or p.name == LOCK_FILE:
+            continue
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        if p.is_file():
+            out.append((str(p.relative_to(root)), st.st_size, st.st_mtime_ns))
+    return tuple(out)
+
+class IndexSnapshot:
+    """一次载入的完整索引。active 为正在使用它的请求数；被替换（retire）后在最后一个请求结束时关闭"""
+    def __init__(self, root, args, generation):
+        start = time.time()
+        self.root = root
+        self.generation = generation
+        self.fingerprint = index_fingerprint(root)  # 先取指纹：载入期间若又有改动，下次检查会再触发
+        self.postings, self.doc_ids, self.universe, self.bitmaps, self.biwords, self.kgrams = open_search_index(
+            root, args.postings_fmt, args.cache_size, not args.no_bitmaps, not args.no_biwords)
+        try:
+            # 各文件按文件原子换入，但重建期间仍可能载入新旧混合的一组文件：文档数不一致即拒绝这次载入
+            for name, obj in (("postings.bin", self.postings), ("bitmaps.bin", self.bitmaps),
+                              ("biwords.bin", self.biwords)):
+                n_docs = getattr(obj, "n_docs", None)
+                if n_docs is not None and n_docs != len(self.doc_ids):
+                    raise ValueError(f"{name} has {n_docs} documents but docids.json has {len(self.doc_ids)}")
+            self.analyzer = load_analyzer(root)
+            self.stats = load_vsm_stats(self.postings, self.doc_ids, len(self.universe), root)
+        except Exception:
+            self.close()
+            raise
+        self.active = 0
+        self.retired = False
+        self.loaded_at = time.time()
+        self.load_ms = (self.loaded_at - start) * 1000
+
+    def acquire(self):
+        self.active += 1
+        return self
+
+    def release(self):
+        self.active -= 1
+        if self.retired and self.active == 0:
+            self.close()
+
+    def retire(self):
+        self.retired = True
+        if self.active == 0:
+            self.close()
+
+    def close(self):
+        for obj in (self.postings, self.kgrams):
+            if hasattr(obj, "close"):
+                obj.close()
+
+    def info(self):
+        return {"generation": self.generation, "docs": len(self.universe), "terms": len(self.postings),
+                "loaded_at": self.loaded_at, "load_ms": self.load_ms,
+                "bitmaps": self.bitmaps is not None, "biwords": self.biwords is not None}
+
+    def boolean(self, q, use_skip=False, max_expansions=DEFAULT_MAX_EXPANSIONS):
+        hits = eval_one(self.postings, q, use_skip=use_skip, analyzer=self.analyzer, universe=self.universe,
+                        bitmaps=self.bitmaps, biwords=self.biwords, kgrams=self.kgrams, max_expansions=max_expansions)
+        return sorted(self.doc_ids[i] for i in hits)
+
+    def vsm(self, q, k=10):
+        return score(q, self.postings, self.doc_ids, self.stats, self.analyzer)[:k]
+
+class QueryServer:
+    def __init__(self, args, root=INDEX_DIR):
+        self.args = args
+        self.root = root
+        self.snapshot = IndexSnapshot(root, args, 1)
+        self.lock = asyncio.Lock()  # 同一时刻只进行一次重新载入
+        self.failed = None  # 上次载入失败时的指纹，文件再次变化前不重试
+        self.pool = ThreadPoolExecutor(args.threads, thread_name_prefix="query") if args.threads > 0 else None
+
+    async def run_query(self, fn, *args):
+        if self.pool is None:
+            out = fn(*args)
+            await asyncio.sleep(0)  # 让出事件循环，其他连接的请求可穿插执行
+            return out
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def reload(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            gen = self.snapshot.generation + 1
+            try:
+                new = await loop.run_in_executor(None, IndexSnapshot, self.root, self.args, gen)
+            except Exception:
+                self.failed = await loop.run_in_executor(None, index_fingerprint, self.root)
+                raise
+            old, self.snapshot = self.snapshot, new
+            old.retire()
+            self.failed = None
+            print(f"已切换到第 {gen} 代索引：{len(new.universe)} 篇文档，载入 {new.load_ms:.1f} ms", flush=True)
+            return new
+
+    async def watch(self, interval):
+        loop = asyncio.get_running_loop()
+        pending = None
+        while True:
+            await asyncio.sleep(interval)
+            fp = await loop.run_in_executor(None, index_fingerprint, self.root)
+            if fp == self.snapshot.fingerprint or fp == self.failed:
+                pending = None
+                continue
+            if fp != pending:  # 仍在变化（或刚发现变化），等下一次检查确认写出已结束
+                pending = fp
+                continue
+            pending = None
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"重新载入失败，继续使用第 {self.snapshot.generation} 代索引：{e}", flush=True)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if body:
+            obj = json.loads(body)
+            if not isinstance(obj, dict):
+                raise ValueError("request body must be a JSON object")
+            params.update(obj)
+        path = url.path.rstrip("/") or "/"
+        routes = {"/health": ("GET",), "/search/boolean": ("GET", "POST"), "/search/vsm": ("GET", "POST"),
+                  "/batch": ("POST",), "/reload": ("POST",)}
+        if path not in routes:
+            return 404, {"error": f"unknown endpoint {path}"}
+        if method not in routes[path]:
+            return 405, {"error": f"{method} not allowed on {path}"}
+        if path == "/reload":
+            try:
+                snap = await self.reload()
+            except Exception as e:
+                return 500, {"reloaded": False, "error": str(e), **self.snapshot.info()}
+            return 200, {"reloaded": True, **snap.info()}
+        snap = self.snapshot.acquire()
+        try:
+            start = time.time()
+            if path == "/health":
+                out = {"status": "ok", "active": snap.active - 1, **snap.info()}
+            elif path == "/batch":
+                out = await self.batch(snap, params)
+            elif path == "/search/boolean":
+                q = query_param(params)
+                docs = await self.run_query(snap.boolean, q, self.args.use_skip, self.max_expansions(params))
+                out = {"query": q, "hits": len(docs), "docs": docs}
+            else:
+                q = query_param(params)
+                results = await self.run_query(snap.vsm, q, int_param(params, "k", 10, 0))
+                out = {"query": q, "results": results}
+            out["took_ms"] = (time.time() - start) * 1000
+            return 200, out
+        finally:
+            snap.release()
+
+    def max_expansions(self, params):
+        return int_param(params, "max_expansions", self.args.max_expansions, 1)
+
+    async def batch(self, snap, params):
+        """各条查询的结果按输入顺序排成列表（重复的查询各占一项）；单条查询出错只在该项记 error，不影响其余查询。
+        所有查询都结束后才返回：调用方随后归还快照，不会有仍在线程池中读取该快照的查询。
+        """
+        k = int_param(params, "k", 10, 0)
+        max_exp = self.max_expansions(params)
+        bq = query_list(params, "boolean")
+        vq = query_list(params, "vsm")
+        jobs = [(snap.boolean, q, self.args.use_skip, max_exp) for q in bq] + [(snap.vsm, q, k) for q in vq]
+        if self.pool is None:
+            outs = []
+            for fn, *args in jobs:
+                try:
+                    outs.append(await self.run_query(fn, *args))
+                except Exception as e:
+                    outs.append(e)
+        else:
+            outs = await asyncio.gather(*(self.run_query(*job) for job in jobs), return_exceptions=True)
+        boolean = [query_error(q, r) if isinstance(r, BaseException) else {"query": q, "hits": len(r), "docs": r}
+                   for q, r in zip(bq, outs)]
+        vsm = [query_error(q, r) if isinstance(r, BaseException) else {"query": q, "results": r}
+               for q, r in zip(vq, outs[len(bq):])]
+        return {"boolean": boolean, "vsm": vsm}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                keep = False
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        h = await reader.readline()
+                        if h in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = h.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                    conn = headers.get("connection", "").lower()
+                    keep = conn == "keep-alive" if version == "HTTP/1.0" else conn != "close"
+                    if length > MAX_BODY:
+                        status, obj, keep = 413, {"error": "request body too large"}, False
+                    else:
+                        body = await reader.readexactly(length) if length else b""
+                        status, obj = await self.dispatch(method, target, body)
+                except (ValueError, TypeError, KeyError) as e:
+                    status, obj = 400, {"error": str(e)}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    status, obj = 500, {"error": f"{type(e).__name__}: {e}"}
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        "Content-Type: application/json; charset=utf-8\r\n"
+                        f"Content-Length: {len(data)}\r\n"
+                        f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n")
+                writer.write(head.encode("latin-1") + data)
+                await writer.drain()
+                if not keep:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(args):
+    server = QueryServer(args)
+    snap = server.snapshot
+    if args.unix:
+        pathlib.Path(args.unix).unlink(missing_ok=True)
+        srv = await asyncio.start_unix_server(server.handle, path=args.unix)
+        where = f"unix:{args.unix}"
+    else:
+        srv = await asyncio.start_server(server.handle, args.host, args.port)
+        where = f"http://{args.host}:{args.port}"
+    print(f"索引已载入：{len(snap.universe)} 篇文档，{len(snap.postings)} 个词项，{snap.load_ms:.1f} ms", flush=True)
+    print(f"监听 {where}", flush=True)
+    if args.watch:
+        asyncio.get_running_loop().create_task(server.watch(args.watch))
+    async with srv:
+        await srv.serve_forever()
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Long-running query server (Boolean + VSM over HTTP/JSON)")
+    ap.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    ap.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    ap.add_argument("--watch", type=float, default=0.0,
+                    help="check index_json/ every SECONDS and reload once a rebuild has finished (0 = only on POST /reload)")
+    ap.add_argument("--threads", type=int, default=DEFAULT_THREADS,
+                    help="worker threads evaluating queries against the shared index (0 = on the event loop thread)")
+    ap.add_argument("--use-skip", dest="use_skip", action="store_true",
+                    help="use skip pointers when intersecting the two shortest postings lists of a conjunction")
+    ap.add_argument("--no-bitmaps", action="store_true",
+                    help="ignore bitmaps.bin and evaluate frequent terms on sorted postings lists")
+    ap.add_argument("--no-biwords", action="store_true",
+                    help="ignore biwords.bin and verify every phrase against positions")
+    ap.add_argument("--max-expansions", type=int, default=DEFAULT_MAX_EXPANSIONS,
+                    help="default cap on index terms per prefix/wildcard term (per request: max_expansions)")
+    ap.add_argument("--postings", dest="postings_fmt", default="auto", choices=["auto", "json", "bin"],
+                    help="postings file to load: auto (bin if present) | json | bin")
+    ap.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                    help="LRU capacity (number of terms) for decoded postings lists of the binary reader")
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# 集合统计（index_json/stats.bin）：建索引时随倒排一起写出，VSM 启动时直接载入，无需扫描全部倒排
+#   N（文档数）、每个词项的 df 与 idf、每篇文档的 TF-IDF 向量范数与长度（索引 token 数）、平均文档长度
+# 权重与 search_vsm 一致：w(t, d) = (1 + log tf) * idf，idf = log((N + 1) / (df + 1))
+#
+# 文件布局（小端）：
+#   MAGIC
+#   <QQd>(N, 编号表长度 n_ids, 平均文档长度)
+#   norms:   n_ids 个 float64（按内部文档编号）
+#   lengths: n_ids 个 uint32
+#   <Q>(V)  df: V 个 uint32  idf: V 个 float64
+#   <Q>(词表字节数) + 以 "\n" 连接的 UTF-8 词表（与 df/idf 同序）
+import math, struct, sys
+from array import array
+from utils import INDEX_DIR, atomic_open
+
+MAGIC = b"IRST1\n"
+STATS_FILE = "stats.bin"
+_HEAD = struct.Struct("<QQd")
+_COUNT = struct.Struct("<Q")
+
+def idf_of(n_docs, df):
+    return math.log((n_docs + 1) / (df + 1))
+
+def _to_le(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def avg_len(lengths):
+    # 平均文档长度：只计有词的文档（长度 0 的编号为空文档）
+    live = [l for l in lengths if l]
+    return sum(live) / len(live) if live else 0.0
+
+class CollectionStats:
+    def __init__(self, n_docs, norms, lengths, terms, df, idf, avg_doc_len=None):
+        self.n_docs = n_docs
+        self.norms = norms        # 内部编号 -> TF-IDF 向量范数
+        self.lengths = lengths    # 内部编号 -> 文档长度
+        # 从 stats.bin 载入时直接用文件头中的值，不再遍历 lengths
+        self.avg_doc_len = avg_len(lengths) if avg_doc_len is None else avg_doc_len
+        self.df = dict(zip(terms, df))
+        self.idf = dict(zip(terms, idf))
+
+    @property
+    def n_ids(self):
+        return len(self.norms)
+
+class StatsBuilder:
+    """随倒排流逐词累积统计：每个词项的倒排写完即知 df/idf，文档范数与长度边走边加"""
+    def __init__(self, n_docs, n_ids=None):
+        self.n_docs = n_docs
+        n_ids = n_docs if n_ids is None else n_ids
+        self.norm2 = [0.0] * n_ids
+        self.lengths = [0] * n_ids
+        self.terms = []
+        self.df = []
+        self.idf = []
+
+    def add(self, term, docs_list):
+        df = len(docs_list)
+        idf = idf_of(self.n_docs, df)
+        self.terms.append(term)
+        self.df.append(df)
+        self.idf.append(idf)
+        norm2, lengths = self.norm2, self.lengths
+        for e in docs_list:
+            tf = e["tf"]
+            w = (1.0 + math.log(tf)) * idf
+            norm2[e["doc_id"]] += w * w
+            lengths[e["doc_id"]] += tf
+
+    def wrap(self, items):
+        """包装 (term, docs_list) 流：原样产出，同时累积统计"""
+        for term, docs_list in items:
+            self.add(term, docs_list)
+            yield term, docs_list
+
+    def merge(self, other):
+        """合并另一个（不同词项集合上的）部分统计，用于并行建索引的各分区"""
+        self.norm2 = [a + b for a, b in zip(self.norm2, other.norm2)]
+        self.lengths = [a + b for a, b in zip(self.lengths, other.lengths)]
+        self.terms += other.terms
+        self.df += other.df
+        self.idf += other.idf
+
+    def build(self):
+        return CollectionStats(self.n_docs, [math.sqrt(x) for x in self.norm2], self.lengths,
+                               self.terms, self.df, self.idf)
+
+    def save(self, path):
+        norms = _to_le(array("d", (math.sqrt(x) for x in self.norm2)))
+        lengths = _to_le(array("I", self.lengths))
+        avg = avg_len(self.lengths)
+        vocab = "\n".join(self.terms).encode("utf-8")
+        with atomic_open(path) as f:
+            f.write(MAGIC)
+            f.write(_HEAD.pack(self.n_docs, len(self.norm2), avg))
+            f.write(norms.tobytes())
+            f.write(lengths.tobytes())
+            f.write(_COUNT.pack(len(self.terms)))
+            f.write(_to_le(array("I", self.df)).tobytes())
+            f.write(_to_le(array("d", self.idf)).tobytes())
+            f.write(_COUNT.pack(len(vocab)))
+            f.write(vocab)
+
+def load_stats(directory=INDEX_DIR):
+    """读取 stats.bin；不存在或格式不符时返回 None（调用方退回现场统计）"""
+    path = directory / STATS_FILE
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        n_docs, n_ids, avg = _HEAD.unpack(f.read(_HEAD.size))
+        norms = array("d")
+        norms.frombytes(f.read(8 * n_ids))
+        lengths = array("I")
+        lengths.frombytes(f.read(4 * n_ids))
+        (v,) = _COUNT.unpack(f.read(_COUNT.size))
+        df = array("I")
+        df.frombytes(f.read(4 * v))
+        idf = array("d")
+        idf.frombytes(f.read(8 * v))
+        (n,) = _COUNT.unpack(f.read(_COUNT.size))
+        vocab = f.read(n).decode("utf-8")
+    for arr in (norms, lengths, df, idf):
+        _to_le(arr)
+    terms = vocab.split("\n") if v else []
+    return CollectionStats(n_docs, norms, lengths, terms, df, idf, avg)
+
+def collect_stats(items, n_docs, n_ids=None):
+    """现场统计（分段视图或缺少 stats.bin 的旧索引）：遍历一遍 (term, docs_list)"""
+    builder = StatsBuilder(n_docs, n_ids)
+    for term, docs_list in items:
+        builder.add(term, docs_list)
+    return builder.build()
@@ -1,31 +1,77 @@
-import re, pathlib, json
-from utils import read_jsonl, write_jsonl, DATA_STAGE
+import json, itertools
+from collections import deque
+from utils import DATA_STAGE
+from analyzer import DEFAULT_STAGES, parse_stages, load_analyzer, save_analyzer
+from tokens import TOKENS_MAGIC, get_analyzer, token_row, encode_token_block
 
-STOP = set('''a an the and or not is are was were be been being to of in on at for from with by as it this that these those we you your our his her their i he she they them me my mine ours yours its into about over under up down out more most less few many any each every'''.split())
+def tokenize_chunk(lines, fmt="jsonl", stages=DEFAULT_STAGES):
+    """进程池任务：对一批 events.jsonl 原始行分词，返回 (已编码的输出片段, 文档数)"""
+    rows = [token_row(json.loads(line), stages) for line in lines if line.strip()]
+    if fmt == "bin":
+        return encode_token_block(rows), len(rows)
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), len(rows)
 
-def simple_tokenize(text):
-    tokens = []
-    for i, m in enumerate(re.finditer(r"[A-Za-z0-9]+", text.lower())):
-        tok = m.group(0)
-        if tok in STOP:
-            continue
-        tokens.append((tok, i))  # (token, position)
-    return tokens
+def iter_chunks(path, chunk_size):
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield lines
+
+def tokenize_file(src, out, fmt="jsonl", workers=1, chunk_size=2000, stages=DEFAULT_STAGES):
+    """按块分词并按原顺序写出；workers>1 时用进程池，同时在途的块数有上限以控制内存"""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    mode, kw = ("wb", {}) if fmt == "bin" else ("w", {"encoding": "utf-8"})
+    with open(out, mode, **kw) as f:
+        if fmt == "bin":
+            f.write(TOKENS_MAGIC)
+        if workers <= 1:
+            for lines in iter_chunks(src, chunk_size):
+                data, cnt = tokenize_chunk(lines, fmt, stages)
+                f.write(data)
+                n += cnt
+            return n
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            pending = deque()
+            for lines in iter_chunks(src, chunk_size):
+                pending.append(ex.submit(tokenize_chunk, lines, fmt, stages))
+                if len(pending) >= workers * 2:
+                    data, cnt = pending.popleft().result()
+                    f.write(data)
+                    n += cnt
+            while pending:
+                data, cnt = pending.popleft().result()
+                f.write(data)
+                n += cnt
+    return n
 
 def main():
-    src = DATA_STAGE / "events.jsonl"
-    out = DATA_STAGE / "events.tokens.jsonl"
-    rows = []
-    for d in read_jsonl(src):
-        toks = simple_tokenize(d.get("text",""))
-        rows.append({
-            "doc_id": d.get("doc_id") or "",
-            "title": d.get("title") or "",
-            "text": d.get("text") or "",
-            "tokens": toks,  # list of [term, pos]
-        })
-    write_jsonl(out, rows)
-    print(f"Tokenized {len(rows)} docs -> {out}")
+    import argparse
+    ap = argparse.ArgumentParser(description="Tokenize events.jsonl into events.tokens.jsonl")
+    ap.add_argument("--delta", action="store_true",
+                    help="tokenize the incremental events.delta.jsonl instead of the full corpus")
+    ap.add_argument("--format", dest="fmt", default="jsonl", choices=["jsonl", "bin"],
+                    help="output format: jsonl (events.tokens.jsonl) | bin (compact events.tokens.bin)")
+    ap.add_argument("--workers", type=int, default=1, help="number of worker processes (1 = serial)")
+    ap.add_argument("--chunk-size", type=int, default=2000, help="documents per chunk")
+    ap.add_argument("--analyzer", default=None,
+                    help="comma-separated stages: lowercase,fold,stopwords,stem "
+                         "(default: lowercase,stopwords; with --delta: the existing index's analyzer)")
+    args = ap.parse_args()
+    name = "events.delta" if args.delta else "events"
+    src = DATA_STAGE / f"{name}.jsonl"
+    out = DATA_STAGE / f"{name}.tokens.{args.fmt}"
+    if args.analyzer:
+        stages = parse_stages(args.analyzer)
+    else:
+        stages = load_analyzer().stages if args.delta else DEFAULT_STAGES
+    n = tokenize_file(src, out, args.fmt, args.workers, args.chunk_size, stages)
+    # 记录分析器配置，build_index 会随索引一起保存，供查询端使用同一流水线
+    save_analyzer(get_analyzer(stages), DATA_STAGE)
+    print(f"Tokenized {n} docs -> {out}")
 
 if __name__ == "__main__":
     main()
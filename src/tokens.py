@@ -0,0 +1,117 @@
+# 分词与二进制 token 流的共用函数：tokenize.py（分词脚本）、build_index.py、pipeline.py 都从这里导入。
+# 模块不叫 tokenize，免得 `from tokenize import ...` 与标准库同名模块互相遮蔽。
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from analyzer import Analyzer, DEFAULT_STAGES, parse_stages
+
+_ANALYZERS = {}
+
+def get_analyzer(stages=DEFAULT_STAGES):
+    # 每个进程按配置各缓存一个分析器实例（进程池 worker 中同样复用，LRU 缓存随之保留）
+    stages = parse_stages(stages)
+    a = _ANALYZERS.get(stages)
+    if a is None:
+        a = _ANALYZERS[stages] = Analyzer(stages)
+    return a
+
+def simple_tokenize(text, stages=DEFAULT_STAGES):
+    return get_analyzer(stages).analyze(text)  # [(token, position)]
+
+def token_row(d, stages=DEFAULT_STAGES):
+    return {
+        "doc_id": d.get("doc_id") or "",
+        "title": d.get("title") or "",
+        "text": d.get("text") or "",
+        "tokens": simple_tokenize(d.get("text",""), stages),  # list of [term, pos]
+    }
+
+# ---------------- 二进制 token 流（events.tokens.bin） ----------------
+# 文件 = MAGIC + 若干块；块 = varint(块字节数) + 块内容
+# 块内容 = varint(词数) + 词表(varint 长度 + UTF-8) + varint(文档数) + 文档记录
+# 文档记录 = doc_id(varint 长度 + UTF-8) + varint(token 数) + [varint(块内 term_id), varint(位置差)] * n
+# 每块自带词表，各 worker 可独立编码，无需全局 term_id 协调
+TOKENS_MAGIC = b"IRTK1\n"
+
+def encode_token_block(docs):
+    """把一批文档（含 doc_id 与 tokens）编码为一个自包含的二进制块"""
+    term_ids = {}
+    body = bytearray()
+    for d in docs:
+        encode_str(d["doc_id"], body)
+        toks = d["tokens"]
+        encode_varint(len(toks), body)
+        prev = 0
+        for term, pos in toks:
+            tid = term_ids.get(term)
+            if tid is None:
+                tid = term_ids[term] = len(term_ids)
+            encode_varint(tid, body)
+            encode_varint(pos - prev, body)  # 位置单调递增，存差值
+            prev = pos
+    head = bytearray()
+    encode_varint(len(term_ids), head)
+    for term in term_ids:  # dict 保持插入顺序 = term_id 顺序
+        encode_str(term, head)
+    encode_varint(len(docs), head)
+    block = bytearray()
+    encode_varint(len(head) + len(body), block)
+    return bytes(block + head + body)
+
+def _read_block_size(f):
+    # 从文件对象逐字节读取块长度 varint；文件结束返回 None
+    n = shift = 0
+    while True:
+        b = f.read(1)
+        if not b:
+            return None
+        n |= (b[0] & 0x7F) << shift
+        if b[0] < 0x80:
+            return n
+        shift += 7
+
+def token_block_offsets(path):
+    """各块的起始字节偏移（只读块长度并跳过块内容），供按块边界切分文件"""
+    offsets = []
+    with open(path, "rb") as f:
+        if f.read(len(TOKENS_MAGIC)) != TOKENS_MAGIC:
+            raise ValueError(f"{path} is not a token stream file")
+        while True:
+            start = f.tell()
+            size = _read_block_size(f)
+            if size is None:
+                return offsets
+            offsets.append(start)
+            f.seek(size, 1)
+
+def read_token_stream(path, start=None, end=None):
+    """逐块读取二进制 token 流，产出与 events.tokens.jsonl 行兼容的 {"doc_id", "tokens"}
+    start/end：只读取 [start, end) 字节区间内的块（start 须为块起点，见 token_block_offsets）
+    """
+    with open(path, "rb") as f:
+        if f.read(len(TOKENS_MAGIC)) != TOKENS_MAGIC:
+            raise ValueError(f"{path} is not a token stream file")
+        if start is not None:
+            f.seek(start)
+        while end is None or f.tell() < end:
+            size = _read_block_size(f)
+            if size is None:
+                return
+            data = f.read(size)
+            n_terms, pos = decode_varint(data, 0)
+            terms = []
+            for _ in range(n_terms):
+                t, pos = decode_str(data, pos)
+                terms.append(t)
+            n_docs, pos = decode_varint(data, pos)
+            for _ in range(n_docs):
+                doc_id, pos = decode_str(data, pos)
+                n_tok, pos = decode_varint(data, pos)
+                toks = []
+                p = 0
+                for _ in range(n_tok):
+                    tid, pos = decode_varint(data, pos)
+                    gap, pos = decode_varint(data, pos)
+                    p += gap
+                    toks.append((terms[tid], p))
+                yield {"doc_id": doc_id, "tokens": toks}
+            if pos != size:
+                raise ValueError(f"corrupt token block in {path}")
@@ -1,13 +1,29 @@
-import json, re, math, pathlib, time
+import contextlib, json, os, re, math, pathlib, time
 from typing import List, Dict, Tuple
 
 DATA_STAGE = pathlib.Path(__file__).resolve().parents[1] / "data_stage"
 INDEX_DIR = pathlib.Path(__file__).resolve().parents[1] / "index_json"
 RESULTS_DIR = pathlib.Path(__file__).resolve().parents[1] / "results"
+DOCIDS_FILE = "docids.json"  # 内部文档编号 -> 外部 doc_id（列表下标即编号）
 
 def now_ms():
     return int(time.time()*1000)
 
+@contextlib.contextmanager
+def atomic_open(path, mode="wb", **kwargs):
+    """先写同目录的 <文件名>.tmp，成功后 os.replace 换入；已打开旧文件的读取器（如 server.py 的常驻索引）
+    继续读旧内容，新载入的读取器只会看到完整的新文件。写出失败时删除临时文件、保留原文件。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+
 def read_jsonl(path):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
@@ -20,7 +36,38 @@ def write_jsonl(path, rows):
         for r in rows:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
-def save_json(path, obj):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+def save_json(path, obj, pretty=True):
+    with atomic_open(path, "w", encoding="utf-8") as f:
+        if pretty:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        else:
+            # 紧凑格式：json.dumps 一次性编码可走 C 加速，写出量也小得多
+            f.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+
+def save_json_items(path, items, pretty=True):
+    """把 (key, value) 流逐项写成一个 JSON 对象，无需先在内存中拼出整个 dict。
+    pretty=True 时输出与 save_json(indent=2) 逐字节一致。
+    """
+    with atomic_open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        first = True
+        for k, v in items:
+            body = json_item(k, v, pretty)
+            f.write(body if first else "," + body)
+            first = False
+        f.write("\n}" if pretty and not first else "}")
+
+def json_item(k, v, pretty=True):
+    """单个 "key": value 的文本（不含分隔逗号），与 save_json_items 的输出格式一致"""
+    if pretty:
+        # 借 json.dumps 生成单项的缩进文本，去掉外层花括号
+        return json.dumps({k: v}, ensure_ascii=False, indent=2)[1:-2]
+    return json.dumps(k, ensure_ascii=False) + ":" + json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+def load_docids(directory=INDEX_DIR):
+    """读取 docids.json：倒排中的 doc_id 是稠密整数编号，输出结果时据此映射回外部 id；不存在则为空表"""
+    path = directory / DOCIDS_FILE
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,179 @@
+# 前缀与通配查询的词项扩展（tech*、*script、te*ch）
+#   纯前缀（唯一的 * 在末尾）：在有序的压缩词典 lexicon.bin 上做范围扫描（见 lexicon_bin.LexiconBin.with_prefix）
+#   其他通配：k-gram 索引（index_json/kgrams.bin）。词项两端补 $ 后切成长度 k 的片段，每个片段记录含它的词项序号；
+#             模式按 * 切开、两端补 $，各段内的 k-gram 对应的序号列表求交得到候选，再用完整模式过滤（k-gram 会有误报）；
+#             模式中没有完整的 k-gram（如 *a*）时只能逐个检查全部词项
+# 扩展结果按字典序截取前 limit 个（DEFAULT_MAX_EXPANSIONS，检索端 --max-expansions），保证单个通配项的代价有上界。
+#
+# kgrams.bin 布局：
+#   MAGIC
+#   <QQQ>(k, 词项数 V, k-gram 数 G)
+#   V 个词项（排序后，下标即序号）：varint(字节数) + UTF-8
+#   G 条记录：gram, varint(词项数), 各序号的 varint 差值
+import re, struct, threading
+from collections import defaultdict
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from lexicon_bin import LexiconBin
+from utils import atomic_open
+
+MAGIC = b"IRKG1\n"
+KGRAMS_FILE = "kgrams.bin"
+KGRAM = 3
+DEFAULT_MAX_EXPANSIONS = 128
+_HEAD = struct.Struct("<QQQ")
+
+def kgrams_of(text, k=KGRAM):
+    padded = f"${text}$"
+    return {padded[i:i + k] for i in range(len(padded) - k + 1)}
+
+def pattern_kgrams(pattern, k=KGRAM):
+    # 模式按 * 切开后各段（两端补 $）内部的完整 k-gram
+    grams = set()
+    for piece in f"${pattern}$".split("*"):
+        grams.update(piece[i:i + k] for i in range(len(piece) - k + 1))
+    return grams
+
+def compile_pattern(pattern):
+    return re.compile(".*".join(re.escape(p) for p in pattern.split("*")), re.DOTALL)
+
+def is_prefix_pattern(pattern):
+    return pattern.endswith("*") and "*" not in pattern[:-1]
+
+class KGramBuilder:
+    """随倒排流收集词项（与 bitmap.BitmapBuilder 同样的 add/wrap/merge/save 用法），保存时排序并建 k-gram -> 词项序号倒排"""
+    def __init__(self, k=KGRAM):
+        self.k = k
+        self.terms = []
+
+    def add(self, term, docs_list):
+        if docs_list:
+            self.terms.append(term)
+
+    def wrap(self, items):
+        for term, docs_list in items:
+            self.add(term, docs_list)
+            yield term, docs_list
+
+    def merge(self, other):
+        self.terms += other.terms
+
+    def save(self, path):
+        terms = sorted(set(self.terms))
+        grams = defaultdict(list)
+        for i, term in enumerate(terms):
+            for g in kgrams_of(term, self.k):
+                grams[g].append(i)
+        out = bytearray(MAGIC)
+        out += _HEAD.pack(self.k, len(terms), len(grams))
+        for term in terms:
+            encode_str(term, out)
+        for g in sorted(grams):
+            ids = grams[g]
+            encode_str(g, out)
+            encode_varint(len(ids), out)
+            prev = 0
+            for i in ids:
+                encode_varint(i - prev, out)
+                prev = i
+        with atomic_open(path) as f:
+            f.write(out)
+
+class KGramIndex:
+    """kgrams.bin 的读取器。文件在构造时打开、第一次通配查询时才读入（重建时新文件整体换入，已打开的句柄仍读到旧版本）（只建词表与 gram -> 记录偏移的目录），
+    各 gram 的序号列表在首次使用时解码并缓存（整体替换缓存项，多线程下至多重复解码一次）。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.terms = None
+        self._fh = open(path, "rb")
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._fh.close()
+
+    def _load(self):
+        with self._lock:  # 多个线程同时第一次通配查询时只读入一次
+            if self.terms is None:
+                self._read()
+
+    def _read(self):
+        with self._fh as f:
+            buf = f.read()
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path}: not a k-gram file")
+        self.k, n_terms, n_grams = _HEAD.unpack_from(buf, len(MAGIC))
+        pos = len(MAGIC) + _HEAD.size
+        terms = []
+        for _ in range(n_terms):
+            term, pos = decode_str(buf, pos)
+            terms.append(term)
+        self.directory = {}
+        self.cache = {}
+        for _ in range(n_grams):
+            g, pos = decode_str(buf, pos)
+            self.directory[g] = pos
+            n, pos = decode_varint(buf, pos)
+            for _ in range(n):
+                _, pos = decode_varint(buf, pos)
+        self.buf = buf
+        self.terms = terms
+
+    def ids(self, gram):
+        ids = self.cache.get(gram)
+        if ids is None:
+            pos = self.directory.get(gram)
+            if pos is None:
+                return []
+            n, pos = decode_varint(self.buf, pos)
+            ids = []
+            i = 0
+            for _ in range(n):
+                gap, pos = decode_varint(self.buf, pos)
+                i += gap
+                ids.append(i)
+            self.cache[gram] = ids
+        return ids
+
+    def match(self, pattern, limit=DEFAULT_MAX_EXPANSIONS):
+        """匹配通配模式的词项（升序），返回 (词项列表, 是否因超过 limit 被截断)"""
+        if self.terms is None:
+            self._load()
+        lists = sorted((self.ids(g) for g in pattern_kgrams(pattern, self.k)), key=len)
+        if lists:
+            keep = set(lists[0])
+            for ids in lists[1:]:
+                keep.intersection_update(ids)
+                if not keep:
+                    break
+            candidates = sorted(keep)
+        else:
+            candidates = range(len(self.terms))
+        regex = compile_pattern(pattern)
+        terms = (self.terms[i] for i in candidates)
+        return _take((t for t in terms if regex.fullmatch(t)), limit)
+
+def _take(terms, limit):
+    out = []
+    for t in terms:
+        if len(out) >= limit:
+            return out, True
+        out.append(t)
+    return out, False
+
+def expand(postings, pattern, kgrams=None, limit=DEFAULT_MAX_EXPANSIONS):
+    """把通配模式扩展为索引中的词项（升序），返回 (词项列表, 是否被截断)。
+    纯前缀且倒排读取器带 lexicon.bin 时在词典上范围扫描，否则用 k-gram 索引；两者都没有（如多段视图、
+    只有 postings.json 的旧索引）时退回逐个检查全部词项。
+    """
+    directory = getattr(postings, "directory", None)
+    if is_prefix_pattern(pattern) and isinstance(directory, LexiconBin):
+        return _take((t for t, _ in directory.with_prefix(pattern[:-1])), limit)
+    if kgrams is not None:
+        return kgrams.match(pattern, limit)
+    regex = compile_pattern(pattern)
+    return _take(sorted(t for t in postings.keys() if regex.fullmatch(t)), limit)
+
+def load_kgrams(directory):
+    """kgrams.bin 存在时返回（尚未读入的）KGramIndex，否则 None"""
+    path = directory / KGRAMS_FILE
+    return KGramIndex(path) if path.exists() else None
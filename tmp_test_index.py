@@ -0,0 +1,127 @@
+import sys, pathlib, random, tempfile
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[0] / 'src'))
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from postings_bin import write_postings_bin, BinaryPostings, entry_positions
+from bitmap import RoaringBitmap, CHUNK
+from lexicon_bin import write_lexicon_bin, LexiconBin
+from build_index import accumulate, finalize, save_postings, flush_segment
+from segments import SegmentedPostings
+
+# 随机但可复现的小语料：词项按 Zipf 式分布，少数高频词会得到跳表与位图
+rng = random.Random(7)
+VOCAB = ["t%03d" % i for i in range(60)] + ["café", "naïve", "日本"]
+
+def make_rows(ids):
+    rows = []
+    for d in ids:
+        n = rng.randint(1, 30)
+        rows.append({"doc_id": d, "tokens": [(VOCAB[min(int(rng.paretovariate(1.2)) - 1, len(VOCAB) - 1)], p) for p in range(n)]})
+    return rows
+
+def check_codec():
+    for n in [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32, 2 ** 63 - 1]:
+        out = bytearray()
+        encode_varint(n, out)
+        assert decode_varint(out, 0) == (n, len(out)), n
+    out = bytearray()
+    strs = ["", "a", "café", "日本語", "x" * 200]
+    for s in strs:
+        encode_str(s, out)
+    pos = 0
+    for s in strs:
+        got, pos = decode_str(out, pos)
+        assert got == s, (got, s)
+    assert pos == len(out)
+    print('codec: ok')
+
+def check_postings(tmp):
+    _, postings, doc_ids = finalize(accumulate(make_rows(["d%04d" % i for i in range(3000)])), "sqrt")
+    path = tmp / "postings.bin"
+    write_postings_bin(path, iter(sorted(postings.items())), len(doc_ids))
+    with BinaryPostings(path) as bp:
+        assert bp.n_docs == len(doc_ids) and len(bp) == len(postings)
+        assert list(bp.keys()) == sorted(postings)
+        for term, docs in postings.items():
+            assert bp.get_full(term) == docs, term
+            assert bp.df(term) == len(docs)
+            reader = bp.skip_reader(term)
+            if reader is None:
+                continue
+            # SkipReader 按块求交与集合求交一致
+            ids = [d["doc_id"] for d in docs]
+            probe = sorted(rng.sample(range(len(doc_ids)), 200))
+            assert reader.intersect(probe) == sorted(set(probe) & set(ids)), term
+        assert bp.get("missing") is None and bp.skip_reader("missing") is None
+    print('postings.bin: ok,', len(postings), 'terms')
+
+def check_roaring():
+    n_docs = 3 * CHUNK + 1000
+    for density in [0.001, 0.05, 0.5]:
+        a = sorted(d for d in range(n_docs) if rng.random() < density)
+        b = sorted(d for d in range(n_docs) if rng.random() < 0.2)
+        ra, rb = RoaringBitmap.from_sorted(a, n_docs), RoaringBitmap.from_sorted(b, n_docs)
+        assert ra.to_list() == a and len(ra) == len(a)
+        assert (ra & rb).to_list() == sorted(set(a) & set(b))
+        assert (ra | rb).to_list() == sorted(set(a) | set(b))
+        assert (ra - rb).to_list() == sorted(set(a) - set(b))
+        assert (RoaringBitmap.full(n_docs) - ra).to_list() == sorted(set(range(n_docs)) - set(a))
+        out = bytearray()
+        ra.encode(out)
+        back, pos = RoaringBitmap.decode(out, 0, n_docs)
+        assert back.to_list() == a and pos == len(out)
+    print('roaring: ok')
+
+def check_lexicon(tmp):
+    terms = sorted({"".join(rng.choice("abcde") for _ in range(rng.randint(1, 6))) for _ in range(500)} | {"café", "日本"})
+    entries = [(t, i + 1, i * 10, 10, i * 3) for i, t in enumerate(terms)]
+    path = tmp / "lexicon.bin"
+    for block_k in [1, 4, 16]:
+        write_lexicon_bin(path, entries, 1234, 99, block_k)
+        lex = LexiconBin(path, 1234, 99)
+        try:
+            assert len(lex) == len(terms) and list(lex.keys()) == terms
+            for t, *ent in entries:
+                assert lex.get(t) == tuple(ent), t
+            assert lex.get("zzz") is None and lex.get("") is None
+            for prefix in ["a", "ab", "cde", "e", "zz", ""]:
+                assert [t for t, _ in lex.with_prefix(prefix)] == [t for t in terms if t.startswith(prefix)], prefix
+        finally:
+            lex.close()
+    print('lexicon.bin: ok,', len(terms), 'terms')
+
+def view_of(postings, ext):
+    # term -> {外部 id: (tf, 位置)}，不依赖内部编号
+    return {term: {ext[e["doc_id"]]: (e["tf"], entry_positions(postings, e)) for e in postings[term]} for term in postings}
+
+def check_segments(tmp):
+    rows = {r["doc_id"]: r for r in make_rows(["d%04d" % i for i in range(800)])}
+    _, postings, doc_ids = finalize(accumulate(rows.values()), "sqrt")
+    root = tmp / "seg"
+    root.mkdir()
+    save_postings(lambda: iter(sorted(postings.items())), doc_ids, "bin", directory=root)
+    # 两批增量：新增 + 更新已有文档 + 删除
+    for batch in range(2):
+        delta = make_rows(["d%04d" % i for i in rng.sample(range(1000), 60)])
+        deletes = ["d%04d" % i for i in rng.sample(range(1000), 30)]
+        flush_segment(accumulate(delta), deletes, "sqrt", "bin", root)
+        for d in deletes:
+            rows.pop(d, None)
+        rows.update((r["doc_id"], r) for r in delta)
+    view = SegmentedPostings(root)
+    try:
+        _, full, full_ids = finalize(accumulate(rows.values()), "sqrt")
+        got = {t: v for t, v in view_of(view, view.doc_ids).items() if v}
+        assert got == view_of(full, full_ids)
+        assert sorted(view.doc_ids[i] for i in view.live_ids()) == full_ids
+    finally:
+        view.close()
+    print('segments: ok,', len(full_ids), 'live docs in', len(view.parts), 'segments')
+
+if __name__ == "__main__":
+    check_codec()
+    check_roaring()
+    with tempfile.TemporaryDirectory() as d:
+        tmp = pathlib.Path(d)
+        check_postings(tmp)
+        check_lexicon(tmp)
+        check_segments(tmp)
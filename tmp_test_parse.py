@@ -1,6 +1,6 @@
 ﻿import sys, pathlib, xml.etree.ElementTree as ET
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[0] / 'src'))
-from parse_xml import extract_event
+from parse_xml import extract_event, extract_event_xpath
 xml = '''<?xml version="1.0" encoding="UTF-8"?>
 <item>
     <venue>
@@ -50,13 +50,15 @@ xml = '''<?xml version="1.0" encoding="UTF-8"?>
     <event_url>http://www.meetup.com/nohowebdev/events/12821780/</event_url>
     <photo_url>http://photos1.meetupstatic.com/photos/event/1/0/5/b/global_11476187.jpeg</photo_url>
 </item>'''
-root = ET.fromstring(xml)
-doc = extract_event(root)
-print('doc_id=', doc['doc_id'])
-print('title=', doc['title'])
-print('group=', doc['group'], 'urlname=', doc['group_urlname'])
-print('venue=', doc['venue'])
-print('hosts=', doc['hosts'])
-print('time=', doc['time'], 'created=', doc['created'], 'updated=', doc['updated'])
-print('event_url=', doc['event_url'])
-print('text_prefix=', doc['text'][:120])
+if __name__ == "__main__":
+    root = ET.fromstring(xml)
+    doc = extract_event(root)
+    assert doc == extract_event_xpath(root), "single-pass extractor diverges from XPath version"
+    print('doc_id=', doc['doc_id'])
+    print('title=', doc['title'])
+    print('group=', doc['group'], 'urlname=', doc['group_urlname'])
+    print('venue=', doc['venue'])
+    print('hosts=', doc['hosts'])
+    print('time=', doc['time'], 'created=', doc['created'], 'updated=', doc['updated'])
+    print('event_url=', doc['event_url'])
+    print('text_prefix=', doc['text'][:120])